@@ -0,0 +1,100 @@
+############################################################################################
+# Copyright (C) Jędrzej Kubica, Nicolas Thierry-Mieg, 2026
+#
+# This file was written by Jędrzej Kubica and Nicolas Thierry-Mieg
+# (CNRS, France) Nicolas.Thierry-Mieg@univ-grenoble-alpes.fr
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with this program.
+# If not, see <https://www.gnu.org/licenses/>.
+############################################################################################
+
+# Cache of the tissue enrichment of each node of a network, joined from the UniProt file
+# (protein -> gene) and the expression data (gene -> enrichment).
+# The node-indexed enrichment array (float32, NaN for nodes without expression data)
+# is stored next to the network cache (see network_cache.py), keyed by the hashes of the
+# network, UniProt and expression files, and memory-mapped by later runs.
+
+import os
+import hashlib
+import logging
+
+import numpy
+
+import network_cache
+
+# set up logger, using inherited config, in case we get called as a module
+logger = logging.getLogger(__name__)
+
+
+def cache_key(network_file, weighted, directed, uniprot_file, expression_file, expression_format):
+    """
+    Returns the name of the cache entry for the enrichment of the nodes of network_file
+    """
+    key = hashlib.sha256()
+    for part in (network_cache.cache_key(network_file, weighted, directed),
+                 network_cache.file_hash(uniprot_file),
+                 network_cache.file_hash(expression_file),
+                 expression_format):
+        key.update(part.encode() + b"\0")
+    return(f"enrichment_{key.hexdigest()[:32]}")
+
+
+def join_enrichment(idx2node, uniprot2gene, gene2row, gene_enrichment):
+    """
+    Joins protein -> gene -> enrichment for every node of the network
+
+    arguments:
+    - idx2node: list of node names (proteins)
+    - uniprot2gene: dict, key=protein, value=gene name
+    - gene2row: dict, key=gene name, value=row index in gene_enrichment
+    - gene_enrichment: numpy array of enrichment, 1D (genes) or 2D (genes x tissues)
+
+    returns:
+    - enrichment: float32 numpy array of enrichment indexed by node index
+        (nodes, or nodes x tissues), NaN for nodes without expression data
+    """
+    enrichment = numpy.full((len(idx2node),) + gene_enrichment.shape[1:], numpy.nan, dtype=numpy.float32)
+    for (i, protein) in enumerate(idx2node):
+        # due to obsolete GTEx data, some genes are removed from the tissue enrichment analysis
+        if protein in uniprot2gene:
+            gene = uniprot2gene[protein]
+            if gene in gene2row:
+                enrichment[i] = gene_enrichment[gene2row[gene]]
+    return(enrichment)
+
+
+def load_enrichment(network_file, weighted, directed, uniprot_file, expression_file, expression_format,
+                    build, cache_dir=network_cache.CACHE_DIR):
+    """
+    Loads the node-indexed tissue enrichment from the cache, building it with build()
+    and adding it to the cache if needed
+
+    arguments:
+    - network_file, weighted, directed: the network, as in network_cache.load_network()
+    - uniprot_file, expression_file: the annotation files, part of the cache key
+    - expression_format: string describing how expression_file is read (eg "gtex" or "tpm"),
+        part of the cache key
+    - build: function without arguments returning the arrays to cache (dict, key=name,
+        value=numpy array), at least 'enrichment' from join_enrichment()
+    - cache_dir: cache directory
+
+    returns:
+    - arrays: dict, key=name, value=numpy array (read-only memory-maps when cached)
+    """
+    entry_dir = os.path.join(cache_dir, cache_key(network_file, weighted, directed,
+                                                  uniprot_file, expression_file, expression_format))
+    if os.path.isdir(entry_dir):
+        logger.info(f"Loading tissue enrichment from cache {entry_dir}")
+        return(network_cache.load_entry(entry_dir))
+
+    arrays = build()
+    network_cache.save_entry(cache_dir, entry_dir, arrays)
+    return(arrays)
@@ -0,0 +1,149 @@
+############################################################################################
+# Copyright (C) Jędrzej Kubica, Nicolas Thierry-Mieg, 2026
+#
+# This file was written by Jędrzej Kubica and Nicolas Thierry-Mieg
+# (CNRS, France) Nicolas.Thierry-Mieg@univ-grenoble-alpes.fr
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with this program.
+# If not, see <https://www.gnu.org/licenses/>.
+############################################################################################
+
+# Transparent compressed text files, chosen by file extension: .gz (gzip), .xz (xz)
+# and .zst (zstd, needs the zstandard package); any other file is plain text.
+# Compressed files are read and written as streams, never decompressed to disk.
+# Readers that build file names (eg ranks_LOO.tsv in a phenotype directory) use find_file()
+# to accept the plain file or any compressed variant of it.
+# This file must stay compatible with Python 3.7, as it is imported by the NetCore runner.
+
+import os
+import gzip
+import lzma
+import shutil
+import logging
+
+try:
+    import zstandard
+except ImportError:
+    # only needed for .zst files
+    zstandard = None
+
+# set up logger, using inherited config, in case we get called as a module
+logger = logging.getLogger(__name__)
+
+# compression formats, as given on the command line of the runners, and their file extensions
+COMPRESSIONS = ("gz", "xz", "zst")
+EXTENSIONS = tuple("." + compression for compression in COMPRESSIONS)
+
+
+def compression_of(file):
+    """
+    Returns the compression format of file from its extension (one of COMPRESSIONS),
+    or None for a plain text file
+    """
+    for compression in COMPRESSIONS:
+        if str(file).endswith("." + compression):
+            return(compression)
+    return(None)
+
+
+def compressed_name(file, compression=None):
+    """
+    Returns the name of file compressed with compression (one of COMPRESSIONS, None for plain text)
+    """
+    if compression is None:
+        return(str(file))
+    return(str(file) + "." + compression)
+
+
+def check_compression(compression):
+    """
+    Raises an exception if files cannot be compressed with compression (eg zst without
+    the zstandard package), so that runners fail at startup rather than after computing
+    """
+    if compression is not None and compression not in COMPRESSIONS:
+        raise Exception(f"Unknown compression {compression}, expecting one of {COMPRESSIONS}")
+    if compression == "zst" and zstandard is None:
+        raise Exception("Compression zst needs the zstandard package")
+
+
+def open_file(file, mode='r', compression=None):
+    """
+    Opens a plain or compressed file, eg as a drop-in replacement for open(file, 'r')
+
+    arguments:
+    - file: path to the file
+    - mode: 'r', 'w' or 'a' for text, 'rb' or 'wb' for bytes
+    - compression: one of COMPRESSIONS, None to use the extension of file
+
+    returns:
+    - f: file object, to use in a with statement
+    """
+    if mode not in ('r', 'w', 'a', 'rb', 'wb'):
+        raise Exception(f"Unsupported mode {mode} for {file}")
+    if compression is None:
+        compression = compression_of(file)
+    if compression is not None and not mode.endswith('b'):
+        mode += 't'
+
+    if compression is None:
+        return(open(file, mode))
+    elif compression == "gz":
+        return(gzip.open(file, mode))
+    elif compression == "xz":
+        return(lzma.open(file, mode))
+    elif compression == "zst":
+        if zstandard is None:
+            raise Exception(f"Cannot open {file}: reading and writing .zst files needs the zstandard package")
+        return(zstandard.open(file, mode))
+
+    raise Exception(f"Unknown compression {compression}, expecting one of {COMPRESSIONS}")
+
+
+def find_file(file):
+    """
+    Returns file if it exists, otherwise its first existing compressed variant
+    (file.gz, file.xz or file.zst), or file itself if none exists (so that callers
+    report the expected file name)
+    """
+    if os.path.isfile(file):
+        return(file)
+    for extension in EXTENSIONS:
+        if os.path.isfile(str(file) + extension):
+            return(str(file) + extension)
+    return(file)
+
+
+def finalize_file(part_file, file, compression=None):
+    """
+    Turns a completed plain text file part_file into file compressed with compression
+    (one of COMPRESSIONS, None for plain text): streamed into a temporary file renamed
+    into place, so that file is never truncated. part_file is removed, as well as any
+    other variant of file (eg a plain file.tsv left by a previous run, that readers
+    would otherwise find first).
+
+    returns:
+    - out_file: name of the final file
+    """
+    out_file = compressed_name(file, compression)
+    if compression is None:
+        os.replace(part_file, out_file)
+    else:
+        tmp_file = out_file + ".tmp"
+        with open(part_file, 'rb') as f_in, open_file(tmp_file, 'wb', compression) as f_out:
+            shutil.copyfileobj(f_in, f_out, 1 << 20)
+        os.replace(tmp_file, out_file)
+        os.remove(part_file)
+
+    for variant in (str(file),) + tuple(str(file) + extension for extension in EXTENSIONS):
+        if variant != out_file and os.path.isfile(variant):
+            os.remove(variant)
+    return(out_file)
+
@@ -0,0 +1,226 @@
+############################################################################################
+# Copyright (C) Jędrzej Kubica, Nicolas Thierry-Mieg, 2026
+#
+# This file was written by Jędrzej Kubica and Nicolas Thierry-Mieg
+# (CNRS, France) Nicolas.Thierry-Mieg@univ-grenoble-alpes.fr
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with this program.
+# If not, see <https://www.gnu.org/licenses/>.
+############################################################################################
+
+# Store of the full leave-one-out scores of a method, shared by the BFWalk, MultiXrank and
+# NetCore runners. A store is a directory with:
+# - scores.npy: float32 matrix (left-out genes x network nodes), memory-mapped, where row i
+#   has the scores of all nodes when genes[i] is left out
+# - genes.tsv and nodes.tsv: the gene table (rows) and node table (columns), one name per line
+# - done.npy: boolean array, done[i] is True once row i is written
+# Rows are written as the runner goes (and flushed before being marked done, so an interrupted
+# run leaves a usable store), and read in chunks of rows without loading the whole matrix.
+# This file must stay compatible with Python 3.7, as it is imported by the NetCore runner.
+
+import os
+import shutil
+import logging
+import tempfile
+
+import numpy
+
+import ranking
+
+# set up logger, using inherited config, in case we get called as a module
+logger = logging.getLogger(__name__)
+
+# default name of the store directory, in the output directory of each runner
+STORE_DIR = "LOO_store"
+
+
+def write_table(table_file, header, names):
+    with open(table_file, 'w') as f:
+        f.write(header + "\n")
+        for name in names:
+            f.write(name + "\n")
+
+
+def read_table(table_file, header):
+    with open(table_file, 'r') as f:
+        if f.readline().rstrip("\n") != header:
+            raise Exception(f"LOO store problem, wrong format: {table_file}")
+        return([line.rstrip("\n") for line in f])
+
+
+def read_genes(store_dir):
+    """
+    Returns the gene table of the store: list of left-out genes, in row order
+    """
+    return(read_table(os.path.join(store_dir, "genes.tsv"), "GENE"))
+
+
+def read_nodes(store_dir):
+    """
+    Returns the node table of the store: list of network nodes, in column order
+    """
+    return(read_table(os.path.join(store_dir, "nodes.tsv"), "NODE"))
+
+
+def create_store(store_dir, genes, nodes):
+    """
+    Creates an empty store for the left-out genes and network nodes, or keeps the existing
+    store_dir if it has the same genes and nodes (eg when resuming an interrupted run).
+    The store is built in a temporary directory renamed to store_dir, so that readers
+    never see a partial store.
+
+    arguments:
+    - store_dir: path of the store directory
+    - genes: list of left-out genes (rows)
+    - nodes: list of network nodes (columns)
+    """
+    genes = list(genes)
+    nodes = list(nodes)
+    if os.path.isdir(store_dir):
+        try:
+            if read_genes(store_dir) == genes and read_nodes(store_dir) == nodes:
+                n_done = int(numpy.count_nonzero(numpy.load(os.path.join(store_dir, "done.npy"))))
+                logger.info(f"Using existing LOO store {store_dir}, {n_done} of {len(genes)} genes done")
+                return
+        except Exception as e:
+            logger.warning(f"Unreadable LOO store {store_dir}: {repr(e)}")
+        logger.warning(f"Replacing LOO store {store_dir}, built for other genes or nodes")
+        shutil.rmtree(store_dir)
+
+    parent_dir = os.path.dirname(os.path.abspath(store_dir))
+    os.makedirs(parent_dir, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(dir=parent_dir)
+    write_table(os.path.join(tmp_dir, "genes.tsv"), "GENE", genes)
+    write_table(os.path.join(tmp_dir, "nodes.tsv"), "NODE", nodes)
+    # the scores file is allocated (sparse on most file systems) but not filled:
+    # rows that are not done are never read
+    scores = numpy.lib.format.open_memmap(os.path.join(tmp_dir, "scores.npy"), mode='w+',
+                                          dtype=numpy.float32, shape=(len(genes), len(nodes)))
+    del scores
+    numpy.save(os.path.join(tmp_dir, "done.npy"), numpy.zeros(len(genes), dtype=bool))
+    os.rename(tmp_dir, store_dir)
+    logger.info(f"Created LOO store {store_dir} for {len(genes)} genes x {len(nodes)} nodes")
+
+
+def write_rows(store_dir, rows, scores):
+    """
+    Writes the scores of some left-out genes and marks them as done
+
+    arguments:
+    - store_dir: path of the store directory
+    - rows: list of row indexes (positions of the left-out genes in the gene table)
+    - scores: 2D numpy array (len(rows) x num_nodes), scores of all nodes for each left-out gene
+    """
+    scores_mmap = numpy.load(os.path.join(store_dir, "scores.npy"), mmap_mode='r+')
+    scores_mmap[rows] = scores
+    scores_mmap.flush()
+    del scores_mmap
+
+    done = numpy.load(os.path.join(store_dir, "done.npy"), mmap_mode='r+')
+    done[rows] = True
+    done.flush()
+
+
+def load_scores(store_dir):
+    """
+    Memory-maps the store without reading it
+
+    returns:
+    - scores: read-only numpy memmap (genes x nodes), rows that are not done are undefined
+    - done: boolean numpy array, done[i] is True if row i is written
+    """
+    scores = numpy.load(os.path.join(store_dir, "scores.npy"), mmap_mode='r')
+    done = numpy.load(os.path.join(store_dir, "done.npy"))
+    return(scores, done)
+
+
+def iter_chunks(store_dir, genes=None, chunk_size=256):
+    """
+    Reads the scores of the left-out genes chunk by chunk, so that only chunk_size rows
+    are in memory at once
+
+    arguments:
+    - store_dir: path of the store directory
+    - genes: list of left-out genes to read, None for all genes done in the store
+    - chunk_size: number of rows per chunk
+
+    yields:
+    - (chunk_genes, chunk_scores): list of genes and float32 numpy array (len(chunk_genes) x num_nodes)
+    """
+    (scores, done) = load_scores(store_dir)
+    store_genes = read_genes(store_dir)
+    gene2row = {gene: i for (i, gene) in enumerate(store_genes)}
+
+    if genes is None:
+        rows = numpy.flatnonzero(done)
+    else:
+        missing = [gene for gene in genes if gene not in gene2row or not done[gene2row[gene]]]
+        if missing:
+            raise Exception(f"LOO store {store_dir} has no scores for {len(missing)} genes, eg {missing[0]}")
+        rows = numpy.array([gene2row[gene] for gene in genes], dtype=numpy.int64)
+
+    for start in range(0, len(rows), chunk_size):
+        chunk_rows = rows[start:start + chunk_size]
+        yield ([store_genes[i] for i in chunk_rows], numpy.asarray(scores[chunk_rows]))
+
+
+def left_out_ranks(store_dir, ties="min", genes=None, chunk_size=256):
+    """
+    Recalculates the rank of each left-out gene among the scores of its own leave-one-out run,
+    reading the store in chunks; genes that are not nodes of the network, or that have no
+    score in their own run (NaN, eg not scored by NetCore), are skipped.
+    Ranks are calculated on the float32 scores of the store, so nodes whose scores only
+    differ beyond float32 precision are tied.
+
+    arguments:
+    - store_dir: path of the store directory
+    - ties: tie policy, one of ranking.TIES
+    - genes, chunk_size: see iter_chunks()
+
+    returns:
+    - node2rank: dict with key=left-out gene, value=rank
+    """
+    node2idx = {node: j for (j, node) in enumerate(read_nodes(store_dir))}
+    node2rank = {}
+    for (chunk_genes, chunk_scores) in iter_chunks(store_dir, genes, chunk_size):
+        in_network = [i for (i, gene) in enumerate(chunk_genes) if gene in node2idx]
+        if not in_network:
+            continue
+        cols = [node2idx[chunk_genes[i]] for i in in_network]
+        chunk_scores = chunk_scores[in_network]
+        left_out_scores = chunk_scores[numpy.arange(len(in_network)), cols][:, numpy.newaxis]
+        n_above = numpy.count_nonzero(chunk_scores > left_out_scores, axis=1)
+        n_equal = numpy.count_nonzero(chunk_scores == left_out_scores, axis=1)
+        for (i, above, equal, score) in zip(in_network, n_above, n_equal, left_out_scores[:, 0]):
+            if not numpy.isnan(score):
+                node2rank[chunk_genes[i]] = ranking.rank_from_counts(above, equal, ties)
+    return(node2rank)
+
+
+def store_ranks(store_dir, network_size, ties="min", chunk_size=256):
+    """
+    Ranks of all left-out genes of a complete store, for the analysis scripts: see left_out_ranks().
+    Left-out genes that are not nodes of the store, or without a score (eg not in the main
+    component of the network for NetCore) get rank=network_size, as in
+    netcore_index.netcore_scores_to_ranks().
+
+    arguments:
+    - store_dir: path of the store directory
+    - network_size: total number of nodes in the network
+    - ties, chunk_size: see left_out_ranks()
+
+    returns:
+    - node2rank: dict with key=left-out gene, value=rank, in the order of the gene table
+    """
+    genes = read_genes(store_dir)
+    # raises an exception if some genes are not done
+    node2rank = left_out_ranks(store_dir, ties, genes, chunk_size)
+    return({gene: node2rank.get(gene, network_size) for gene in genes})
@@ -0,0 +1,228 @@
+############################################################################################
+# Copyright (C) Jędrzej Kubica, Nicolas Thierry-Mieg, 2026
+#
+# This file was written by Jędrzej Kubica and Nicolas Thierry-Mieg
+# (CNRS, France) Nicolas.Thierry-Mieg@univ-grenoble-alpes.fr
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with this program.
+# If not, see <https://www.gnu.org/licenses/>.
+############################################################################################
+
+# Index of a NetCore leave-one-out output tree (netcore-output/{PHENOTYPE}/output_{LEFT-OUT-NODE}/random_walk_weights.txt).
+# Each scores file is parsed once: for its left-out node we keep the number of nodes scoring
+# higher and the number scoring the same, which gives its rank with any tie policy.
+# The index is cached in the tree (INDEX_FILE), keyed by the mtime and size of each scores file,
+# so later runs only re-parse the files that changed.
+
+import os
+import logging
+import concurrent.futures
+
+import numpy
+
+import ranking
+import compressed_io
+
+# set up logger, using inherited config, in case we get called as a module
+logger = logging.getLogger(__name__)
+
+INDEX_FILE = "netcore_index.npz"
+
+
+def netcore_scores_file(netcore_LOO_dir, left_out_node):
+    # random_walk_weights.txt, or a compressed variant of it (see compressed_io.py)
+    return(compressed_io.find_file(os.path.join(netcore_LOO_dir, f"output_{left_out_node}", "random_walk_weights.txt")))
+
+
+def parse_netcore_scores_file(left_out_node, netcore_LOO_file, full_scores=False):
+    """
+    Parses one NetCore scores file for left-out node
+
+    returns:
+    - n_above: number of nodes with a higher score than the left-out node
+    - n_equal: number of nodes with the same score, including the left-out node
+        (n_above and n_equal are -1 if the left-out node is not in the file)
+    - nodes, scores: list of all nodes and numpy array of their scores
+        if full_scores, None otherwise
+    """
+    with compressed_io.open_file(netcore_LOO_file, 'r') as f:
+        header = f.readline()
+        if not header.startswith("node_index\t"):
+            raise Exception(f"NetCore scores file problem for left-out node {left_out_node}, wrong format: {netcore_LOO_file}")
+        nodes = []
+        scores = []
+        for line in f:
+            split_line = line.rstrip().split("\t")
+            if len(split_line) != 4:
+                raise Exception(f"Invalid line in NetCore scores file for left-out node {left_out_node}: {line}")
+            nodes.append(split_line[1])
+            scores.append(float(split_line[2]))
+    scores = numpy.array(scores)
+
+    (n_above, n_equal) = (-1, -1)
+    if left_out_node in nodes:
+        score = scores[nodes.index(left_out_node)]
+        n_above = int(numpy.count_nonzero(scores > score))
+        n_equal = int(numpy.count_nonzero(scores == score))
+
+    if full_scores:
+        return(n_above, n_equal, nodes, scores)
+    return(n_above, n_equal, None, None)
+
+
+def load_index(index_file):
+    """
+    Loads a cached index, returns a dict of numpy arrays, or None if there is
+    no usable index file
+    """
+    if not os.path.isfile(index_file):
+        return(None)
+    try:
+        with numpy.load(index_file) as data:
+            return({key: data[key] for key in data.files})
+    except Exception as e:
+        logger.warning(f"Ignoring unreadable NetCore index {index_file}: {e}")
+        return(None)
+
+
+def save_index(index_file, index):
+    """
+    Writes the index atomically (a temporary file renamed over index_file);
+    if the NetCore output tree is not writable, only logs a warning
+    """
+    tmp_file = index_file + ".tmp.npz"
+    try:
+        numpy.savez(tmp_file, **index)
+        os.replace(tmp_file, index_file)
+    except OSError as e:
+        logger.warning(f"Cannot save NetCore index {index_file}: {e}")
+
+
+def index_netcore_dir(netcore_LOO_dir, left_out, full_scores=False):
+    """
+    Builds (or updates) the index of the NetCore scores files for the left-out nodes.
+    Scores files that are not in the cached index, or whose mtime or size changed,
+    are parsed in a thread pool; the updated index is then saved in netcore_LOO_dir.
+
+    arguments:
+    - netcore_LOO_dir: directory with NetCore scores files for left-out nodes,
+        eg. for each left-out node scores for all nodes in the interactome are in:
+        netcore-output/{PHENOTYPE}/output_{LEFT-OUT-NODE}/random_walk_weights.txt
+    - left_out: list of left-out nodes
+    - full_scores: if True, also index the scores of all nodes for each left-out node;
+        they are also kept (and re-parsed files are parsed with them) if the cached index has them,
+        so that updating the index never drops them
+
+    returns:
+    - index: dict with numpy arrays, one row per left-out node in the order of left_out:
+        'genes', 'mtimes', 'sizes', 'n_above', 'n_equal' (see parse_netcore_scores_file),
+        and if full_scores: 'nodes' (all nodes in the scores files) and
+        'scores' (float32, left-out nodes x nodes, NaN if a node is missing from a file)
+    """
+    left_out = list(left_out)
+    mtimes = numpy.zeros(len(left_out), dtype=numpy.int64)
+    sizes = numpy.zeros(len(left_out), dtype=numpy.int64)
+    for (i, left_out_node) in enumerate(left_out):
+        netcore_LOO_file = netcore_scores_file(netcore_LOO_dir, left_out_node)
+        if not os.path.isfile(netcore_LOO_file):
+            raise Exception(f"NetCore scores file not found for left-out node {left_out_node}: {netcore_LOO_file}")
+        stat = os.stat(netcore_LOO_file)
+        mtimes[i] = stat.st_mtime_ns
+        sizes[i] = stat.st_size
+
+    index_file = os.path.join(netcore_LOO_dir, INDEX_FILE)
+    cached = load_index(index_file)
+    if cached is not None and full_scores and 'scores' not in cached:
+        cached = None
+    # keep the full scores of the cached index
+    full_scores = full_scores or (cached is not None and 'scores' in cached)
+    cached_row = {}
+    if cached is not None:
+        cached_row = {gene: row for (row, gene) in enumerate(cached['genes'].tolist())}
+
+    # rows of left_out that can be taken from the cached index
+    from_cache = {}
+    for (i, left_out_node) in enumerate(left_out):
+        row = cached_row.get(left_out_node)
+        if row is not None and cached['mtimes'][row] == mtimes[i] and cached['sizes'][row] == sizes[i]:
+            from_cache[i] = row
+    to_parse = [i for i in range(len(left_out)) if i not in from_cache]
+
+    index = {'genes': numpy.array(left_out, dtype=str),
+             'mtimes': mtimes,
+             'sizes': sizes,
+             'n_above': numpy.zeros(len(left_out), dtype=numpy.int64),
+             'n_equal': numpy.zeros(len(left_out), dtype=numpy.int64)}
+    for (i, row) in from_cache.items():
+        index['n_above'][i] = cached['n_above'][row]
+        index['n_equal'][i] = cached['n_equal'][row]
+
+    if to_parse:
+        logger.info(f"Indexing {len(to_parse)} NetCore scores files ({len(from_cache)} from the cached index)")
+    with concurrent.futures.ThreadPoolExecutor() as executor:
+        parsed = list(executor.map(lambda i: parse_netcore_scores_file(left_out[i], netcore_scores_file(netcore_LOO_dir, left_out[i]), full_scores),
+                                   to_parse))
+    for (i, (n_above, n_equal, nodes, scores)) in zip(to_parse, parsed):
+        index['n_above'][i] = n_above
+        index['n_equal'][i] = n_equal
+
+    if full_scores:
+        all_nodes = set()
+        if from_cache:
+            all_nodes.update(cached['nodes'].tolist())
+        for (n_above, n_equal, nodes, scores) in parsed:
+            all_nodes.update(nodes)
+        all_nodes = sorted(all_nodes)
+        node2idx = {node: j for (j, node) in enumerate(all_nodes)}
+
+        index['nodes'] = numpy.array(all_nodes, dtype=str)
+        index['scores'] = numpy.full((len(left_out), len(all_nodes)), numpy.nan, dtype=numpy.float32)
+        if from_cache:
+            cached_cols = numpy.array([node2idx[node] for node in cached['nodes'].tolist()], dtype=numpy.int64)
+            for (i, row) in from_cache.items():
+                index['scores'][i, cached_cols] = cached['scores'][row]
+        for (i, (n_above, n_equal, nodes, scores)) in zip(to_parse, parsed):
+            index['scores'][i, [node2idx[node] for node in nodes]] = scores
+
+    if to_parse or cached is None or len(cached_row) != len(left_out):
+        save_index(index_file, index)
+
+    return(index)
+
+
+def netcore_scores_to_ranks(left_out, netcore_LOO_dir, n_nodes, ties="min"):
+    """
+    Finds the rank of each left-out node among the NetCore scores of its leave-one-out run,
+    using the index of netcore_LOO_dir (built or updated if needed);
+    for left-out nodes for which scores are missing (not in the main network component), we assign scores=0.
+
+    arguments:
+    - left_out: list of left-out nodes
+    - netcore_LOO_dir: directory with NetCore scores files for left-out nodes,
+        eg. for each left-out node scores for all nodes in the interactome are in:
+        netcore-output/{PHENOTYPE}/output_{LEFT-OUT-NODE}/random_walk_weights.txt
+    - n_nodes: total number of nodes in the network
+    - ties: tie policy, one of ranking.TIES
+
+    returns:
+    - node2rank: dict with key=left-out node, value=rank
+    """
+    index = index_netcore_dir(netcore_LOO_dir, left_out)
+
+    node2rank = {}
+    for (left_out_node, n_above, n_equal) in zip(index['genes'].tolist(), index['n_above'], index['n_equal']):
+        if n_above < 0:
+            # If the left-out node is not found in the NetCore scores file, assign score=0 (rank==n_nodes)
+            node2rank[left_out_node] = n_nodes
+        else:
+            node2rank[left_out_node] = ranking.rank_from_counts(n_above, n_equal, ties)
+
+    return(node2rank)
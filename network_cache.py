@@ -0,0 +1,197 @@
+############################################################################################
+# Copyright (C) Jędrzej Kubica, Nicolas Thierry-Mieg, 2026
+#
+# This file was written by Jędrzej Kubica and Nicolas Thierry-Mieg
+# (CNRS, France) Nicolas.Thierry-Mieg@univ-grenoble-alpes.fr
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with this program.
+# If not, see <https://www.gnu.org/licenses/>.
+############################################################################################
+
+# Cache of parsed networks in CSR format, shared by the validation scripts.
+# A network file is parsed once with data_parser.parse_network(), and saved in the cache
+# directory as .npy files: indptr and indices (int32), weights (float32, only for weighted
+# networks) and nodes (node names, in the order of data_parser's node indexes).
+# The cache entry is keyed by a hash of the network file's content and the weighted/directed
+# flags, and later loads memory-map the arrays instead of parsing the file.
+# Undirected networks are stored with both directions of each edge; duplicate edges are merged
+# (a-b and b-a are the same undirected edge, the last one listed gives the weight).
+
+import os
+import shutil
+import hashlib
+import logging
+import tempfile
+
+import numpy
+
+import data_parser
+
+# set up logger, using inherited config, in case we get called as a module
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = os.path.join(os.environ.get("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache")),
+                         "BFWalk-validation")
+
+# bumped when build_CSR() changes, so that entries built by older versions are not used
+CACHE_VERSION = 2
+
+
+def file_hash(file_name):
+    """
+    Returns the sha256 hex digest of the content of file_name
+    """
+    digest = hashlib.sha256()
+    with open(file_name, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return(digest.hexdigest())
+
+
+def cache_key(network_file, weighted, directed):
+    """
+    Returns the name of the cache entry for network_file: a hash of its content
+    followed by the weighted/directed flags and CACHE_VERSION
+    """
+    return(f"{file_hash(network_file)[:32]}_w{int(bool(weighted))}_d{int(bool(directed))}_v{CACHE_VERSION}")
+
+
+def load_entry(entry_dir):
+    """
+    Memory-maps all arrays of a cache entry
+
+    returns:
+    - arrays: dict, key=array name, value=read-only numpy memmap
+    """
+    arrays = {}
+    for file_name in os.listdir(entry_dir):
+        if file_name.endswith(".npy"):
+            arrays[file_name[:-4]] = numpy.load(os.path.join(entry_dir, file_name), mmap_mode='r')
+    return(arrays)
+
+
+def save_entry(cache_dir, entry_dir, arrays):
+    """
+    Saves arrays (dict, key=array name, value=numpy array) as a cache entry:
+    written in a temporary directory renamed to entry_dir, so that readers never see
+    a partial entry; if the cache directory is not writable, only logs a warning
+    """
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(dir=cache_dir)
+        for (name, array) in arrays.items():
+            numpy.save(os.path.join(tmp_dir, name + ".npy"), array)
+        try:
+            os.rename(tmp_dir, entry_dir)
+            logger.info(f"Cached in {entry_dir}")
+        except OSError:
+            # another process cached the same entry in the meantime
+            shutil.rmtree(tmp_dir)
+    except OSError as e:
+        logger.warning(f"Cannot write cache in {cache_dir}: {e}")
+
+
+def dedup_edges(rows, cols, weights):
+    """
+    Sorts edges by (row, col), and for duplicate edges keeps the last one in input order
+    (as networkx does)
+
+    returns:
+    - (rows, cols, weights): numpy arrays of the sorted distinct edges
+    """
+    order = numpy.lexsort((numpy.arange(len(rows)), cols, rows))
+    (rows, cols, weights) = (rows[order], cols[order], weights[order])
+    last = numpy.ones(len(rows), dtype=bool)
+    last[:-1] = (rows[1:] != rows[:-1]) | (cols[1:] != cols[:-1])
+    return(rows[last], cols[last], weights[last])
+
+
+def build_CSR(network_file, weighted, directed):
+    """
+    Parses network_file with data_parser.parse_network() and builds its CSR arrays
+
+    returns:
+    - arrays: dict with numpy arrays 'indptr', 'indices', 'nodes' and, if weighted, 'weights'
+    """
+    (edge_list, node2idx, idx2node) = data_parser.parse_network(network_file, weighted, directed)
+    n_nodes = len(node2idx)
+
+    rows = numpy.fromiter((edge[0] for edge in edge_list), dtype=numpy.int64, count=len(edge_list))
+    cols = numpy.fromiter((edge[1] for edge in edge_list), dtype=numpy.int64, count=len(edge_list))
+    if weighted:
+        weights = numpy.fromiter((edge[2] for edge in edge_list), dtype=numpy.float32, count=len(edge_list))
+    else:
+        weights = numpy.ones(len(edge_list), dtype=numpy.float32)
+    if not directed:
+        # an undirected edge can be listed as a-b and b-a: merge them on (min, max) before
+        # mirroring, so that both directions get the same weight
+        rows, cols = numpy.minimum(rows, cols), numpy.maximum(rows, cols)
+        (rows, cols, weights) = dedup_edges(rows, cols, weights)
+        loops = (rows == cols)
+        rows, cols = numpy.concatenate((rows, cols[~loops])), numpy.concatenate((cols, rows[~loops]))
+        weights = numpy.concatenate((weights, weights[~loops]))
+
+    (rows, cols, weights) = dedup_edges(rows, cols, weights)
+
+    arrays = {'indptr': numpy.zeros(n_nodes + 1, dtype=numpy.int32),
+              'indices': cols.astype(numpy.int32),
+              'nodes': numpy.array([idx2node[i] for i in range(n_nodes)], dtype=str)}
+    numpy.cumsum(numpy.bincount(rows, minlength=n_nodes), out=arrays['indptr'][1:])
+    if weighted:
+        arrays['weights'] = weights
+    return(arrays)
+
+
+def load_network(network_file, weighted=False, directed=False, cache_dir=CACHE_DIR):
+    """
+    Loads network_file from the cache, parsing it and adding it to the cache if needed.
+    If the cache directory is not writable, the parsed network is returned without caching.
+
+    arguments:
+    - network_file: SIF file, as read by data_parser.parse_network()
+    - weighted, directed: passed to data_parser.parse_network()
+    - cache_dir: cache directory
+
+    returns:
+    - indptr, indices: CSR arrays (int32, read-only memory-maps when cached):
+        the neighbours of node i are indices[indptr[i]:indptr[i+1]]
+    - weights: float32 edge weights aligned with indices, or None if not weighted
+    - node2idx: dict with key=node name, value=node index
+    - idx2node: list of node names
+    """
+    entry_dir = os.path.join(cache_dir, cache_key(network_file, weighted, directed))
+
+    if os.path.isdir(entry_dir):
+        logger.info(f"Loading network from cache {entry_dir}")
+        arrays = load_entry(entry_dir)
+    else:
+        arrays = build_CSR(network_file, weighted, directed)
+        save_entry(cache_dir, entry_dir, arrays)
+
+    idx2node = arrays['nodes'].tolist()
+    node2idx = {node: i for (i, node) in enumerate(idx2node)}
+    return(arrays['indptr'], arrays['indices'], arrays.get('weights'), node2idx, idx2node)
+
+
+def degrees(indptr, indices):
+    """
+    Calculates the degree of each node in the undirected graph underlying a CSR network
+    (as networkx.Graph would: each pair of neighbours counts once whatever the direction
+    of its edges, and a self-loop counts 2)
+
+    returns:
+    - degrees: 1D numpy array of degrees, indexed by node index
+    """
+    n_nodes = len(indptr) - 1
+    rows = numpy.repeat(numpy.arange(n_nodes, dtype=numpy.int64), numpy.diff(indptr))
+    cols = numpy.asarray(indices, dtype=numpy.int64)
+    pairs = numpy.unique(numpy.minimum(rows, cols) * n_nodes + numpy.maximum(rows, cols))
+    return(numpy.bincount(pairs // n_nodes, minlength=n_nodes) + numpy.bincount(pairs % n_nodes, minlength=n_nodes))
@@ -0,0 +1,76 @@
+############################################################################################
+# Copyright (C) Jędrzej Kubica, Nicolas Thierry-Mieg, 2026
+#
+# This file was written by Jędrzej Kubica and Nicolas Thierry-Mieg
+# (CNRS, France) Nicolas.Thierry-Mieg@univ-grenoble-alpes.fr
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with this program.
+# If not, see <https://www.gnu.org/licenses/>.
+############################################################################################
+
+import logging
+
+import numpy
+
+# set up logger, using inherited config, in case we get called as a module
+logger = logging.getLogger(__name__)
+
+# tie policies, for nodes with the same score as the left-out node:
+# - min: the left-out node is ranked before all of them
+# - average: the left-out node gets the average rank of the tied nodes
+# - max: the left-out node is ranked after all of them
+TIES = ("min", "average", "max")
+
+
+def rank_of_node(scores, idx, ties="min"):
+    """
+    Calculates the rank of one node among all nodes sorted by descending score
+    (the highest score has rank=1), without sorting: counts the scores above and
+    equal to the node's score, in O(N).
+
+    arguments:
+    - scores: list or 1D numpy array of scores for all nodes
+    - idx: index of the node in scores
+    - ties: tie policy, one of TIES
+
+    returns:
+    - rank: int, or float with ties="average" when the number of tied nodes is even
+    """
+    scores = numpy.asarray(scores)
+    score = scores[idx]
+    n_above = int(numpy.count_nonzero(scores > score))
+    if ties == "min":
+        return(n_above + 1)
+    n_equal = int(numpy.count_nonzero(scores == score))  # includes the node itself
+    return(rank_from_counts(n_above, n_equal, ties))
+
+
+def rank_from_counts(n_above, n_equal, ties="min"):
+    """
+    Calculates the rank of a node from the number of nodes with a higher score (n_above)
+    and with the same score (n_equal, including the node itself)
+
+    returns:
+    - rank: int, or float with ties="average" when the number of tied nodes is even
+    """
+    n_above = int(n_above)
+    n_equal = int(n_equal)
+    if ties == "min":
+        return(n_above + 1)
+    elif ties == "max":
+        return(n_above + n_equal)
+    elif ties == "average":
+        rank = n_above + (n_equal + 1) / 2
+        if rank.is_integer():
+            rank = int(rank)
+        return(rank)
+
+    raise Exception(f"Unknown tie policy {ties}, expecting one of {TIES}")
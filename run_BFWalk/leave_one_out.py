@@ -20,16 +20,153 @@ import os
 import sys
 import logging
 import pathlib
+import concurrent.futures
 
 import argparse
+import numpy
 
 PATH_TO_BFWalk = "/home/kubicaj/Software/BFWalk"
 sys.path.append(PATH_TO_BFWalk)
 import BFWalk
 import data_parser
 
+# shared modules of this repository (ranking.py...) are in the parent directory
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+import ranking
+import loo_store
+import compressed_io
 
-def leave_one_out(network, node2idx, seeds, seeds_vector, alpha, cacheFile, PATH_TO_BFWalk, threads):
+# set up logger, using inherited config, in case we get called as a module
+logger = logging.getLogger(__name__)
+
+
+# per-worker copy of the network and parameters, set once per process by init_worker()
+worker_args = None
+
+
+def score_left_out(node, network, node2idx, seeds_vector, alpha, cacheFile, PATH_TO_BFWalk, threads, ties="min"):
+    '''
+    Calculates the score and rank of one seed when it is left out of the seeds
+
+    arguments: see leave_one_out()
+
+    returns:
+    - score: score of the left-out node
+    - rank: rank of the left-out node in the network
+    - scores: 1D numpy array (float32) of the scores of all nodes
+    '''
+    logger.info("Leaving out %s", node)
+    seeds_vector_copy = seeds_vector.copy()
+    seeds_vector_copy[node2idx[node]] = 0
+    scores = BFWalk.calculate_scores(network, node2idx, seeds_vector_copy, alpha, cacheFile, PATH_TO_BFWalk, threads)
+    score = scores[node2idx[node]]
+    rank = ranking.rank_of_node(scores, node2idx[node], ties)
+
+    return(score, rank, numpy.asarray(scores, dtype=numpy.float32))
+
+
+def init_worker(network, node2idx, seeds_vector, alpha, cacheFile, PATH_TO_BFWalk, threads, ties):
+    '''
+    Process pool initializer: keeps the network and parameters in the worker,
+    so they are transferred once per worker rather than once per left-out node.
+    BFWalk.calculate_scores() only takes the path of the cache file, and BFWalk has no
+    function to load the cache once and pass it in: the cache file is still read by
+    every call, in direct mode once per left-out node (contributions mode has no per-node call).
+    '''
+    global worker_args
+    worker_args = (network, node2idx, seeds_vector, alpha, cacheFile, PATH_TO_BFWalk, threads, ties)
+
+
+def worker_score_left_out(node):
+    return(score_left_out(node, *worker_args))
+
+
+def seed_contributions(network, node2idx, seeds, alpha, cacheFile, PATH_TO_BFWalk, threads):
+    '''
+    Calculates the contribution of each seed to the scores, ie the scores obtained with
+    that seed alone, in a single batched call: BFWalk.calculate_scores() gets a
+    (num_nodes x num_seeds) matrix with one seed per column instead of a seeds vector.
+
+    arguments: see leave_one_out()
+
+    returns:
+    - contributions: 2D numpy array of shape (num_nodes, len(seeds)), column j has the
+        scores for seeds[j] alone, or None if BFWalk cannot score a seeds matrix
+    '''
+    seeds_matrix = numpy.zeros((len(node2idx), len(seeds)))
+    for (j, node) in enumerate(seeds):
+        seeds_matrix[node2idx[node], j] = 1
+
+    try:
+        contributions = numpy.asarray(BFWalk.calculate_scores(network, node2idx, seeds_matrix, alpha, cacheFile, PATH_TO_BFWalk, threads),
+                                      dtype=float)
+    except Exception as e:
+        logger.warning(f"BFWalk cannot score a seeds matrix: {repr(e)}")
+        return(None)
+
+    if contributions.shape != seeds_matrix.shape:
+        logger.warning(f"BFWalk returned scores of shape {contributions.shape} for a seeds matrix of shape {seeds_matrix.shape}")
+        return(None)
+
+    return(contributions)
+
+
+def scores_are_close(scores, expected):
+    '''
+    Returns True if scores match expected up to floating-point noise
+    '''
+    atol = 1e-9 * numpy.max(numpy.abs(expected), initial=0)
+    return(bool(numpy.allclose(scores, expected, rtol=1e-6, atol=atol)))
+
+
+def leave_one_out_contributions(network, node2idx, seeds, seeds_vector, alpha, cacheFile, PATH_TO_BFWalk, threads, skip=()):
+    '''
+    Prepares the leave-one-out using the linearity of the scores in the seeds vector:
+    the scores without seed s are the scores with all seeds minus the contribution of s,
+    so all left-out scores and ranks follow from the full scores and one batched
+    calculation of the contributions (see seed_contributions()).
+
+    Linearity is checked first on two seeds, and again on the full contribution matrix
+    (when no seeds are skipped).
+
+    arguments: see leave_one_out()
+
+    returns:
+    - full_scores: 1D numpy array of scores with all seeds
+    - contributions: 2D numpy array with one column per seed not in skip, in seeds order,
+    or None if the scores are not linear in the seeds vector
+    '''
+    if len(seeds) < 2:
+        return(None)
+
+    logger.info("Checking that the scores are linear in the seeds vector")
+    check_seeds = seeds[:2]
+    check_contributions = seed_contributions(network, node2idx, check_seeds, alpha, cacheFile, PATH_TO_BFWalk, threads)
+    if check_contributions is None:
+        return(None)
+    check_vector = numpy.zeros(len(node2idx))
+    for node in check_seeds:
+        check_vector[node2idx[node]] = 1
+    check_scores = numpy.asarray(BFWalk.calculate_scores(network, node2idx, check_vector, alpha, cacheFile, PATH_TO_BFWalk, threads))
+    if not scores_are_close(check_contributions.sum(axis=1), check_scores):
+        logger.warning("Scores are not linear in the seeds vector")
+        return(None)
+
+    todo = [node for node in seeds if node not in skip]
+    logger.info(f"Calculating the contributions of {len(todo)} seeds")
+    full_scores = numpy.asarray(BFWalk.calculate_scores(network, node2idx, seeds_vector, alpha, cacheFile, PATH_TO_BFWalk, threads))
+    contributions = seed_contributions(network, node2idx, todo, alpha, cacheFile, PATH_TO_BFWalk, threads)
+    if contributions is None:
+        return(None)
+    if len(todo) == len(seeds) and not scores_are_close(contributions.sum(axis=1), full_scores):
+        logger.warning("Scores with all seeds differ from the sum of the seed contributions")
+        return(None)
+
+    return(full_scores, contributions)
+
+
+def leave_one_out(network, node2idx, seeds, seeds_vector, alpha, cacheFile, PATH_TO_BFWalk, threads, workers=1, ties="min",
+                  mode="direct", skip=()):
     '''
     arguments:
     - network: list of "edges", an edge is a tuple (source, dest, weight) where
@@ -41,78 +178,189 @@ def leave_one_out(network, node2idx, seeds, seeds_vector, alpha, cacheFile, PATH
     - cacheFile: path to cache file 
     - PATH_TO_BFWalk: path to BFWalk
     - threads: number of threads to use, 0 to use all available cores
+    - workers: number of processes, each one leaving out one node at a time;
+        the threads are split between the workers
+    - ties: how to rank a left-out node tied with other nodes, one of ranking.TIES
+    - mode: "direct" to re-calculate the scores for each left-out node, or "contributions"
+        to derive them from the per-seed contributions (see leave_one_out_contributions()),
+        falling back to "direct" if the scores are not linear in the seeds vector
+    - skip: seeds that are not left out (eg already done in a previous run)
 
-    returns:
-    - scores_left_out: dict with scores for left-out nodes, key=node, value=score
-    - ranks_left_out: dict with ranks for left-out nodes, key=node, value=rank in network
+    yields:
+    - (node, score, rank, scores) for each left-out node, in seeds order, as soon as it is available,
+        where scores is a float32 numpy array of the scores of all nodes
     '''
-    # initialize dict to store left-out ranks
-    scores_left_out = {}
-    ranks_left_out = {}
+    todo = [node for node in seeds if node not in skip]
+    if not todo:
+        return
+
+    if mode == "contributions":
+        prepared = leave_one_out_contributions(network, node2idx, seeds, seeds_vector, alpha,
+                                               cacheFile, PATH_TO_BFWalk, threads, skip)
+        if prepared is not None:
+            (full_scores, contributions) = prepared
+            for (j, node) in enumerate(todo):
+                logger.info("Leaving out %s", node)
+                scores = full_scores - contributions[:, j]
+                yield (node, scores[node2idx[node]], ranking.rank_of_node(scores, node2idx[node], ties),
+                       scores.astype(numpy.float32))
+            return
+        logger.warning("Cannot use the seed contributions, falling back to re-calculating the scores for each left-out node")
 
-    for node in seeds:
-        logger.info("Leaving out %s", node)
-        seeds_vector_copy = seeds_vector.copy()
-        seeds_vector_copy[node2idx[node]] = 0
-        scores = BFWalk.calculate_scores(network, node2idx, seeds_vector_copy, alpha, cacheFile, PATH_TO_BFWalk, threads)
-        # save score
-        scores_left_out[node] = scores[node2idx[node]]
+    if workers > 1 and cacheFile is not None and not os.path.exists(cacheFile):
+        # the cache file is built on the first call, build it once here
+        # rather than in every worker at the same time
+        node = todo.pop(0)
+        yield (node, *score_left_out(node, network, node2idx, seeds_vector, alpha, cacheFile, PATH_TO_BFWalk, threads, ties))
 
-        # save rank
-        scores_sorted = sorted(scores, reverse=True)
-        rank = scores_sorted.index(scores[node2idx[node]]) + 1  # + 1 because ranks start at 1 not 0
-        ranks_left_out[node] = rank
+    if workers <= 1:
+        for node in todo:
+            yield (node, *score_left_out(node, network, node2idx, seeds_vector, alpha, cacheFile, PATH_TO_BFWalk, threads, ties))
+    elif todo:
+        # don't oversubscribe the machine: each worker gets its share of the threads
+        if threads == 0:
+            threads = os.cpu_count()
+        threads_per_worker = max(1, threads // workers)
+        logger.info(f"Running {workers} workers with {threads_per_worker} threads each")
 
-    return(scores_left_out, ranks_left_out)
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers,
+                                                    initializer=init_worker,
+                                                    initargs=(network, node2idx, seeds_vector, alpha,
+                                                              cacheFile, PATH_TO_BFWalk, threads_per_worker, ties)) as executor:
+            # map() yields results in the order of todo, so the output files keep the seeds order
+            for (node, result) in zip(todo, executor.map(worker_score_left_out, todo)):
+                yield (node, *result)
 
 
-def scores_to_TSV(scores, out_dir):
+def read_checkpoint(out_dir):
     '''
+    Reads the left-out nodes already done by a previous (interrupted) run:
+    from the partial files scores_LOO.tsv.part and ranks_LOO.tsv.part if they exist,
+    otherwise from the final files scores_LOO.tsv and ranks_LOO.tsv (possibly compressed).
+    Truncated last lines are ignored, and only nodes present in both files are kept.
+
     arguments:
-    - scores: dict with scores for left-out nodes, key=node, value=score
     - out_dir: path to output directory
 
-    saves scores to a TSV file scores_file with 2 columns: node score
+    returns:
+    - done: dict, key=node, value=(score, rank) as formatted strings, in file order
     '''
-    with open(os.path.join(out_dir, "scores_LOO.tsv"), "w") as f:
-        f.write("NODE" + "\t" + "SCORE" + "\n")
-        for node in scores:
-            score = scores[node]
-            f.write(node + "\t" + "{:.3g}".format(score) + "\n")
+    node2fields = []
+    for name in ("scores_LOO.tsv", "ranks_LOO.tsv"):
+        path = os.path.join(out_dir, name + ".part")
+        if not os.path.isfile(path):
+            path = compressed_io.find_file(os.path.join(out_dir, name))
+        node2field = {}
+        if os.path.isfile(path):
+            with compressed_io.open_file(path, 'r') as f:
+                header = f.readline()
+                if not header.startswith("NODE\t"):
+                    raise Exception(f"Cannot resume, wrong format of {path}")
+                for line in f:
+                    split_line = line.split("\t")
+                    if not line.endswith("\n") or len(split_line) != 2:
+                        # interrupted while writing this line
+                        break
+                    node2field[split_line[0]] = split_line[1].rstrip("\n")
+        node2fields.append(node2field)
+
+    (node2score, node2rank) = node2fields
+    done = {}
+    for node in node2rank:
+        if node in node2score:
+            done[node] = (node2score[node], node2rank[node])
+
+    return(done)
 
 
-def ranks_to_TSV(ranks, out_dir):
+def open_checkpoint(out_dir, done):
     '''
+    Starts the partial files scores_LOO.tsv.part and ranks_LOO.tsv.part in out_dir,
+    with a header and the left-out nodes already done
+
     arguments:
-    - ranks: dict with ranks for left-out causal genes, key=node, value=score
     - out_dir: path to output directory
+    - done: dict, key=node, value=(score, rank) as formatted strings
+
+    returns:
+    - (scores_f, ranks_f): partial files opened for appending
+    '''
+    files = []
+    for (name, col, field) in (("scores_LOO.tsv", "SCORE", 0), ("ranks_LOO.tsv", "RANK", 1)):
+        path = os.path.join(out_dir, name + ".part")
+        with open(path + ".tmp", 'w') as f:
+            f.write("NODE" + "\t" + col + "\n")
+            for node in done:
+                f.write(node + "\t" + done[node][field] + "\n")
+        os.replace(path + ".tmp", path)
+        files.append(open(path, 'a'))
+
+    return(tuple(files))
+
+
+def append_checkpoint(scores_f, ranks_f, node, score, rank):
+    '''
+    Appends the score and rank of one left-out node to the partial files,
+    and flushes them to disk so they survive a crash
+    '''
+    scores_f.write(node + "\t" + "{:.3g}".format(score) + "\n")
+    ranks_f.write(node + "\t" + str(rank) + "\n")
+    for f in (scores_f, ranks_f):
+        f.flush()
+        os.fsync(f.fileno())
+
 
-    saves scores to a TSV file scores_file with 2 columns: node rank
+def close_checkpoint(scores_f, ranks_f, out_dir, compression=None):
     '''
-    with open(os.path.join(out_dir, "ranks_LOO.tsv"), "w") as f:
-        f.write("NODE" + "\t" + "RANK" + "\n")
-        for node in ranks:
-            rank = ranks[node]
-            f.write(node + "\t" + str(rank) + "\n")
+    Closes the partial files and atomically renames them to
+    scores_LOO.tsv and ranks_LOO.tsv in out_dir, compressed with compression
+    (one of compressed_io.COMPRESSIONS, None for plain text)
+    '''
+    for (f, name) in ((scores_f, "scores_LOO.tsv"), (ranks_f, "ranks_LOO.tsv")):
+        f.close()
+        compressed_io.finalize_file(os.path.join(out_dir, name + ".part"), os.path.join(out_dir, name), compression)
 
 
 def main(network_file, seeds_file, alpha, weighted, directed,
-         out_dir, cacheFile, PATH_TO_BFWalk, threads):
-    
+         out_dir, cacheFile, PATH_TO_BFWalk, threads, workers=1, ties="min", mode="direct", resume=False, store=True,
+         compression=None):
+    compressed_io.check_compression(compression)
+
     logger.info("Parsing network")
     (network, node2idx, idx2node) = data_parser.parse_network(network_file, weighted, directed)
 
     logger.info("Parsing seeds")
     (seeds, seeds_vector) = data_parser.parse_seeds(seeds_file, node2idx)
 
-    logger.info("Calculating leave-one-out ranks")
-    (scores, ranks) = leave_one_out(network, node2idx, seeds, seeds_vector, alpha, cacheFile, PATH_TO_BFWalk, threads)
+    done = {}
+    if resume:
+        done = read_checkpoint(out_dir)
+        # only keep results for the current seeds
+        seeds_set = set(seeds)
+        done = {node: done[node] for node in done if node in seeds_set}
+        logger.info(f"Resuming, {len(done)} of {len(seeds)} left-out nodes already done")
 
-    logger.info(f"Saving leave-one-out scores to {out_dir}")
-    scores_to_TSV(scores, out_dir)
+    store_dir = os.path.join(out_dir, loo_store.STORE_DIR)
+    if store:
+        # the scores of all nodes for each left-out node (see loo_store.py)
+        loo_store.create_store(store_dir, seeds, [idx2node[i] for i in range(len(node2idx))])
+        seed2row = {node: i for (i, node) in enumerate(seeds)}
+        # left-out nodes done in the checkpoint but not in the store (eg previous run with --no_store,
+        # or interrupted between the two) are left out again, to fill their store rows
+        (store_scores, store_done) = loo_store.load_scores(store_dir)
+        not_stored = [node for node in done if not store_done[seed2row[node]]]
+        if not_stored:
+            logger.warning(f"{len(not_stored)} left-out nodes already done are not in the LOO store, re-calculating them")
+            done = {node: done[node] for node in done if store_done[seed2row[node]]}
 
-    logger.info(f"Saving leave-one-out ranks to {out_dir}")
-    ranks_to_TSV(ranks, out_dir)
+    logger.info(f"Calculating leave-one-out scores and ranks, saving them to {out_dir}")
+    (scores_f, ranks_f) = open_checkpoint(out_dir, done)
+    for (node, score, rank, scores) in leave_one_out(network, node2idx, seeds, seeds_vector, alpha, cacheFile, PATH_TO_BFWalk,
+                                                     threads, workers, ties, mode, skip=done):
+        if store:
+            loo_store.write_rows(store_dir, [seed2row[node]], scores[numpy.newaxis, :])
+        append_checkpoint(scores_f, ranks_f, node, score, rank)
+    close_checkpoint(scores_f, ranks_f, out_dir, compression)
 
     logger.info("Done!")
 
@@ -162,6 +410,36 @@ if __name__ == "__main__":
                         help='number of parallel threads to run, default=0 to use all available cores',
                         default=0,
                         type=int)
+    parser.add_argument('--workers',
+                        help='''number of processes leaving out seeds in parallel, default=1;
+                                the --threads are split between the workers''',
+                        default=1,
+                        type=int)
+    parser.add_argument('--ties',
+                        help='''how to rank a left-out node tied with other nodes: min, average or max rank
+                                of the tied nodes, default=min''',
+                        choices=ranking.TIES,
+                        default="min")
+    parser.add_argument('--mode',
+                        help='''direct: re-calculate the scores for each left-out seed;
+                                contributions: calculate the contribution of each seed in one batch and subtract it
+                                from the scores with all seeds (requires scores linear in the seeds vector, checked
+                                at startup, otherwise falls back to direct), default=direct''',
+                        choices=['direct', 'contributions'],
+                        default="direct")
+    parser.add_argument('--resume',
+                        help='''resume an interrupted run: skip the seeds already in the (partial) scores
+                                and ranks files in --out''',
+                        action='store_true')
+    parser.add_argument('--compress',
+                        help='''compress the final scores and ranks files (eg ranks_LOO.tsv.gz),
+                                the partial files stay plain text, default: no compression''',
+                        choices=compressed_io.COMPRESSIONS,
+                        default=None)
+    parser.add_argument('--no_store',
+                        help='''don't save the scores of all nodes for each left-out seed
+                                in the LOO store (LOO_store/ in --out, see loo_store.py)''',
+                        action='store_true')
 
     args = parser.parse_args()
 
@@ -180,7 +458,8 @@ if __name__ == "__main__":
 
     try:
         main(args.network, args.seeds, args.alpha, args.weighted,
-             args.directed, args.out, args.cacheFile, PATH_TO_BFWalk, args.threads)
+             args.directed, args.out, args.cacheFile, PATH_TO_BFWalk, args.threads, args.workers, args.ties, args.mode, args.resume,
+             not args.no_store, args.compress)
     except Exception as e:
         # details on the issue should be in the exception name, print it to stderr and die
         sys.stderr.write("ERROR in " + script_name + " : " + repr(e) + "\n")
@@ -24,7 +24,22 @@ import logging
 import argparse
 import subprocess
 
-import multixrank
+import numpy
+import pandas
+
+try:
+    import multixrank
+except ImportError:
+    # only needed with --engine multixrank
+    multixrank = None
+
+import rwr
+
+# shared modules of this repository (ranking.py...) are in the parent directory
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+import ranking
+import loo_store
+import compressed_io
 
 
 def parse_interactome(interactome_file, tmp_dir):
@@ -55,32 +70,193 @@ def parse_seeds(ranks_file, tmp_dir):
             f_out.write(first_col + "\n")
 
 
-def save_seeds(seeds, out_file):
-    with open(out_file, 'w') as f:
-        for gene in seeds:
-            f.write(gene + '\n')
+def restart_vector(multixrank_obj, seeds):
+    """
+    Builds the initial probability distribution of the RWR for a seed list,
+    like multixrank's Seed.get_seed_scores() does from a seeds file:
+    each seed gets eta * tau / (number of seeds in its multiplex) in each layer
+
+    arguments:
+    - multixrank_obj: multixrank.Multixrank object
+    - seeds: list of seed nodes
+
+    returns:
+    - prox_vector: 1D numpy array over the nodes of all layers of all multiplexes
+    """
+    multiplex_tuple = multixrank_obj.multiplexall_obj.multiplex_tuple
+    size = sum(len(multiplex.nodes) * len(multiplex.layer_tuple) for multiplex in multiplex_tuple)
+    prox_vector = numpy.zeros(size)
+
+    start = 0
+    for multiplex in multiplex_tuple:
+        node2pos = {node: i for (i, node) in enumerate(multiplex.nodes)}
+        multiplex_seeds = [node2pos[seed] for seed in set(seeds) if seed in node2pos]
+        for (layer_idx, layer) in enumerate(multiplex.layer_tuple):
+            layer_start = start + len(multiplex.nodes) * layer_idx
+            for pos in multiplex_seeds:
+                prox_vector[layer_start + pos] = (multiplex.eta * layer.tau) / len(multiplex_seeds)
+        start += len(multiplex.nodes) * len(multiplex.layer_tuple)
+
+    return(prox_vector)
+
+
+def random_walk_restart(transition_matrix, prox_vector, r, threshold=1e-10):
+    """
+    Random walk with restart, iterated until the L2 norm of the change is below threshold,
+    as in multixrank.Multixrank.random_walk_rank()
+
+    arguments:
+    - transition_matrix: scipy.sparse matrix, column-normalized
+    - prox_vector: 1D numpy array, initial probability distribution
+    - r: restart probability
+
+    returns:
+    - prox_vector_norm: 1D numpy array, steady-state probability distribution
+    """
+    restart_vector = prox_vector / prox_vector.sum()
+    prox_vector_norm = restart_vector
+    residue = 1
+    while residue >= threshold:
+        old_prox_vector = prox_vector_norm
+        prox_vector_norm = (1 - r) * transition_matrix.dot(prox_vector_norm) + r * restart_vector
+        residue = numpy.sqrt(numpy.sum((prox_vector_norm - old_prox_vector) ** 2))
+
+    return(prox_vector_norm)
+
+
+def ranking_dataframe(multixrank_obj, scores):
+    """
+    Builds the table returned by multixrank.Multixrank.random_walk_rank(),
+    with columns: multiplex, node, layer, score
+
+    arguments:
+    - multixrank_obj: multixrank.Multixrank object
+    - scores: 1D numpy array over the nodes of all layers of all multiplexes
+    """
+    multiplex_col = []
+    node_col = []
+    layer_col = []
+    for multiplex in multixrank_obj.multiplexall_obj.multiplex_tuple:
+        for layer in multiplex.layer_tuple:
+            multiplex_col += [multiplex.key] * len(multiplex.nodes)
+            node_col += list(multiplex.nodes)
+            layer_col += [layer.key] * len(multiplex.nodes)
 
+    return(pandas.DataFrame({'multiplex': multiplex_col, 'node': node_col, 'layer': layer_col, 'score': scores}))
 
-def save_config(template_config, out_config, seed_path):
-    with open(template_config, 'r') as f_in:
-        data = f_in.readlines()
 
-    replaced = False
-    for i, line in enumerate(data):
-        if line.strip().startswith('seed:'):
-            data[i] = f"seed: {seed_path}\n"
-            replaced = True
-            break
+def parse_output_policy(policy):
+    """
+    Parses the --output policy for the scores of each left-out gene in tmp/output_{gene}/:
+    "none" (no scores file), "topk=N" (the N highest-scoring nodes) or "full" (all nodes)
 
-    if not replaced:
-        data.insert(0, f"seed: {seed_path}\n")
+    returns:
+    - top_k: 0 for "none", N for "topk=N", None for "full"
+    """
+    if policy == "none":
+        return(0)
+    elif policy == "full":
+        return(None)
+    elif policy.startswith("topk="):
+        try:
+            top_k = int(policy[len("topk="):])
+        except ValueError:
+            top_k = -1
+        if top_k > 0:
+            return(top_k)
+    raise argparse.ArgumentTypeError(f"invalid output policy {policy}, expecting none, topk=N (N > 0) or full")
+
+
+def store_nodes(ranking_df):
+    """
+    Names of the LOO store columns for the rows of a ranking table: the node names,
+    prefixed with the layer when a node appears in several layers
+    """
+    nodes = ranking_df['node'].astype(str).tolist()
+    if len(set(nodes)) == len(nodes):
+        return(nodes)
+    return([f"{layer}/{node}" for (layer, node) in zip(ranking_df['layer'].astype(str), nodes)])
 
-    with open(out_config, 'w') as f_out:
-        f_out.writelines(data)
 
+def leave_one_out_multixrank(tmp_dir, base_config, causal_genes, ranks_file, ties="min", store_dir=None, top_k=100,
+                             compression=None):
+    """
+    Leave-one-out with the multixrank package, appending the left-out ranks to ranks_file
+    and saving the scores of each left-out gene in tmp_dir/output_{gene}/
+    (top_k highest-scoring nodes of each multiplex, see parse_output_policy(), compressed with compression),
+    and in the LOO store store_dir (see loo_store.py) if not None
+    """
+    # the network and transition matrix don't depend on the seeds: build them once,
+    # with all causal genes as seeds, then only swap the restart vector for each left-out gene
+    logger.info("Building the MultiXrank model")
+    multixrank_obj = multixrank.Multixrank(config=base_config, wdir=tmp_dir)
+    transition_matrix = multixrank.TransitionMatrix(multiplex_all=multixrank_obj.multiplexall_obj,
+                                                    bipartite_matrix=multixrank_obj.bipartiteall_obj.bipartite_matrix,
+                                                    lamb=multixrank_obj.lamb).transition_matrixcoo.tocsr()
+
+    for (row, leftOut) in enumerate(causal_genes):
+        logger.info(f"Leaving out {leftOut}")
 
-def main(network, GBA_ranks, out_dir, config_path):
+        causal_genes_no_left_out = [g for g in causal_genes if g != leftOut]
+
+        prox_vector = restart_vector(multixrank_obj, causal_genes_no_left_out)
+        scores = random_walk_restart(transition_matrix, prox_vector, multixrank_obj.r)
+        ranking_df = ranking_dataframe(multixrank_obj, scores)
+        if store_dir is not None:
+            if row == 0:
+                loo_store.create_store(store_dir, causal_genes, store_nodes(ranking_df))
+            loo_store.write_rows(store_dir, [row], scores[numpy.newaxis, :])
+
+        if top_k != 0:
+            output_path = os.path.join(tmp_dir, f"output_{leftOut}")
+            # write_ranking() aggregates the scores across layers, then keeps the top nodes (all if top_k is None)
+            multixrank_obj.write_ranking(ranking_df, path=output_path, top=top_k)
+            rwr.compress_scores(output_path, compression)
+
+        matches = numpy.flatnonzero(ranking_df['node'].to_numpy() == leftOut)
+        rank = ranking.rank_of_node(ranking_df['score'].to_numpy(), matches[0], ties) if len(matches) else 'NA'
+
+        with open(ranks_file, 'a') as f_out:
+            f_out.write(f"{leftOut}\t{rank}\n")
+
+
+def leave_one_out_native(tmp_dir, config_path, causal_genes, ranks_file, ties="min", batch_size=256, store_dir=None, top_k=100,
+                         compression=None):
+    """
+    Leave-one-out with the native RWR engine (see rwr.py): the restart vectors of
+    batch_size left-out genes are iterated together as the columns of one matrix.
+    Same outputs as leave_one_out_multixrank().
+    """
+    (r, self_loops) = rwr.read_config(config_path)
+    (adjacency, nodes) = rwr.load_network(os.path.join(tmp_dir, "interactome_human.tsv"), self_loops)
+    transition = rwr.transition_matrix(adjacency)
+    node2idx = {node: i for (i, node) in enumerate(nodes)}
+    if store_dir is not None:
+        loo_store.create_store(store_dir, causal_genes, nodes)
+
+    for start in range(0, len(causal_genes), batch_size):
+        batch = causal_genes[start:start + batch_size]
+        logger.info(f"Leaving out {len(batch)} genes: {batch[0]} ... {batch[-1]}")
+
+        seed_sets = [[g for g in causal_genes if g != leftOut] for leftOut in batch]
+        scores = rwr.random_walk_restart(transition, rwr.restart_matrix(node2idx, seed_sets), r)
+        if store_dir is not None:
+            loo_store.write_rows(store_dir, list(range(start, start + len(batch))), scores.T)
+
+        with open(ranks_file, 'a') as f_out:
+            for (j, leftOut) in enumerate(batch):
+                if top_k != 0:
+                    rwr.write_scores(os.path.join(tmp_dir, f"output_{leftOut}"), nodes, scores[:, j], top_k=top_k,
+                                     compression=compression)
+
+                rank = ranking.rank_of_node(scores[:, j], node2idx[leftOut], ties) if leftOut in node2idx else 'NA'
+                f_out.write(f"{leftOut}\t{rank}\n")
+
+
+def main(network, GBA_ranks, out_dir, config_path, ties="min", engine="multixrank", batch_size=256, store=True, top_k=100,
+         compression=None):
     logger.info("Running leave-one-out for MultiXrank")
+    compressed_io.check_compression(compression)
 
     out_dir = os.path.abspath(out_dir)
     tmp_dir = os.path.join(out_dir, 'tmp')
@@ -102,32 +278,18 @@ def main(network, GBA_ranks, out_dir, config_path):
     with open(ranks_file, 'w') as f_out:
         f_out.write(f'NODE\tRANK\n')
 
-    for leftOut in causal_genes:
-        logger.info(f"Leaving out {leftOut}")
-
-        causal_genes_no_left_out = [g for g in causal_genes if g != leftOut]
-
-        seeds_left_out = os.path.join(tmp_dir, f"seeds_{leftOut}.txt")
-        save_seeds(causal_genes_no_left_out, seeds_left_out)
-
-        config_left_out = os.path.join(tmp_dir, f"config_{leftOut}.yml")
-        save_config(base_config, config_left_out, seeds_left_out)
+    # the scores of all nodes for each left-out gene (see loo_store.py)
+    store_dir = os.path.join(out_dir, loo_store.STORE_DIR) if store else None
 
-        multixrank_obj = multixrank.Multixrank(config=config_left_out, wdir=tmp_dir)
-        ranking_df = multixrank_obj.random_walk_rank()
-
-        ranking_df.sort_values(by='score', ascending=False, inplace=True)
-        ranking_df.reset_index(drop=True, inplace=True)
-
-        output_path = os.path.join(tmp_dir, f"output_{leftOut}")
-        multixrank_obj.write_ranking(ranking_df, path=output_path)
-
-        matches = ranking_df.index[ranking_df['node'] == leftOut].tolist()
-        rank = matches[0] + 1 if matches else 'NA'
-
-        with open(ranks_file, 'a') as f_out:
-            f_out.write(f"{leftOut}\t{rank}\n")
+    if engine == "native":
+        leave_one_out_native(tmp_dir, base_config, causal_genes, ranks_file, ties, batch_size, store_dir, top_k, compression)
+    elif multixrank is None:
+        raise Exception("multixrank is not installed, install it or use --engine native")
+    else:
+        leave_one_out_multixrank(tmp_dir, base_config, causal_genes, ranks_file, ties, store_dir, top_k, compression)
 
+    # ranks_LOO.tsv is appended to during the run, and only compressed when complete
+    ranks_file = compressed_io.finalize_file(ranks_file, ranks_file, compression)
     logger.info(f"Ranks saved to {ranks_file}")
     logger.info("Done!")
 
@@ -152,6 +314,34 @@ if __name__ == '__main__':
                         help='directory where to write the output files',
                         type=pathlib.Path,
                         required=True)
+    parser.add_argument('--ties',
+                        help='how to rank a left-out node tied with other nodes: min, average or max rank of the tied nodes (default: min)',
+                        choices=ranking.TIES,
+                        default="min")
+    parser.add_argument('--engine',
+                        help='multixrank: run the multixrank package; native: run the RWR in this repository '
+                             '(single-layer configs only, same scores), default=multixrank',
+                        choices=['multixrank', 'native'],
+                        default="multixrank")
+    parser.add_argument('--batch_size',
+                        help='number of left-out genes run together by the native engine, default=256',
+                        type=int,
+                        default=256)
+    parser.add_argument('--output',
+                        help='scores saved for each left-out gene in tmp/output_{gene}/: none, '
+                             'topk=N for the N highest-scoring nodes, or full for all nodes, default=topk=100 '
+                             '(the scores of all nodes are also in the LOO store, unless --no_store)',
+                        type=parse_output_policy,
+                        default="topk=100")
+    parser.add_argument('--compress',
+                        help='compress ranks_LOO.tsv (when complete) and the scores files of the left-out genes, '
+                             'one of gz, xz, zst, default: no compression',
+                        choices=compressed_io.COMPRESSIONS,
+                        default=None)
+    parser.add_argument('--no_store',
+                        help="don't save the scores of all nodes for each left-out gene in the LOO store "
+                             '(LOO_store/ in --out, see loo_store.py)',
+                        action='store_true')
 
     args = parser.parse_args()
 
@@ -166,7 +356,9 @@ if __name__ == '__main__':
     logger = logging.getLogger(script_name)
 
     try:
-        main(str(args.network), str(args.GBA_ranks), str(out_dir), str(args.config))
+        main(str(args.network), str(args.GBA_ranks), str(out_dir), str(args.config), ties=args.ties,
+             engine=args.engine, batch_size=args.batch_size, store=not args.no_store, top_k=args.output,
+             compression=args.compress)
     except Exception as e:
         sys.stderr.write('ERROR in ' + script_name + ' : ' + repr(e) + '\n')
         sys.exit(1)
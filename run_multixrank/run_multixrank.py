@@ -23,7 +23,17 @@ import logging
 import argparse
 import subprocess
 
-import multixrank
+try:
+    import multixrank
+except ImportError:
+    # only needed with --engine multixrank
+    multixrank = None
+
+import rwr
+
+# shared modules of this repository (compressed_io.py...) are in the parent directory
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+import compressed_io
 
 
 def parse_interactome(interactome_file, out_dir):
@@ -54,18 +64,37 @@ def parse_seeds(ranks_file, out_dir):
             f_out.write(first_col + "\n")
 
 
-def main(network, GBA_ranks, out_dir, config_path):
+def main(network, GBA_ranks, out_dir, config_path, engine="multixrank", compression=None):
+    compressed_io.check_compression(compression)
     logger.info("Parsing interactome and seeds for MultiXrank")
 
     parse_interactome(network, out_dir)
     parse_seeds(GBA_ranks, out_dir)
 
+    if engine == "native":
+        logger.info("Running the native RWR engine")
+        (r, self_loops) = rwr.read_config(config_path)
+        (adjacency, nodes) = rwr.load_network(os.path.join(out_dir, "interactome_human.tsv"), self_loops)
+        with open(os.path.join(out_dir, "seeds.txt"), 'r') as f:
+            seeds = [line.strip() for line in f if line.strip()]
+        node2idx = {node: i for (i, node) in enumerate(nodes)}
+        scores = rwr.random_walk_restart(rwr.transition_matrix(adjacency), rwr.restart_matrix(node2idx, [seeds]), r)
+
+        logger.info(f"Saving scores to {out_dir}")
+        rwr.write_scores(out_dir, nodes, scores[:, 0], compression=compression)
+        logger.info("Done!")
+        return
+
+    if multixrank is None:
+        raise Exception("multixrank is not installed, install it or use --engine native")
+
     logger.info("Running MultiXrank")
     multixrank_obj = multixrank.Multixrank(config=f"{config_path}", wdir=f"{out_dir}")
     ranking_df = multixrank_obj.random_walk_rank()
 
     logger.info(f"Saving scores to {out_dir}")
     multixrank_obj.write_ranking(ranking_df, path=out_dir)
+    rwr.compress_scores(out_dir, compression)
 
     logger.info("Done!")
 
@@ -91,6 +120,15 @@ if __name__ == "__main__":
                         help='directory where to write the output files',
                         type=pathlib.Path,
                         required=True)
+    parser.add_argument('--engine',
+                        help='multixrank: run the multixrank package; native: run the RWR in this repository '
+                             '(single-layer configs only, same scores), default=multixrank',
+                        choices=['multixrank', 'native'],
+                        default="multixrank")
+    parser.add_argument('--compress',
+                        help='compress the scores files (eg multiplex_1.tsv.gz), one of gz, xz, zst, default: no compression',
+                        choices=compressed_io.COMPRESSIONS,
+                        default=None)
 
     args = parser.parse_args()
 
@@ -107,7 +145,8 @@ if __name__ == "__main__":
     # set up logger: we want script name rather than 'root'
     logger = logging.getLogger(script_name)
     try:
-        main(args.network, args.GBA_ranks, out_dir, config_path=args.config)
+        main(args.network, args.GBA_ranks, out_dir, config_path=args.config, engine=args.engine,
+             compression=args.compress)
     except Exception as e:
         # details on the issue should be in the exception name, print it to stderr and die
         sys.stderr.write("ERROR in " + script_name + " : " + repr(e) + "\n")
@@ -0,0 +1,215 @@
+############################################################################################
+# Copyright (C) Jędrzej Kubica, Nicolas Thierry-Mieg, 2026
+#
+# This file was written by Jędrzej Kubica and Nicolas Thierry-Mieg
+# (CNRS, France) Nicolas.Thierry-Mieg@univ-grenoble-alpes.fr
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with this program.
+# If not, see <https://www.gnu.org/licenses/>.
+############################################################################################
+
+# Native random walk with restart (RWR) on a single undirected, unweighted network layer,
+# equivalent to MultiXrank with one multiplex containing one layer (as in default/config.yml),
+# but running the power iteration on a block of restart vectors at once.
+
+import os
+import sys
+import glob
+import logging
+from fractions import Fraction
+
+import numpy
+import scipy.sparse
+import yaml
+
+# shared modules of this repository (compressed_io.py...) are in the parent directory
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+import compressed_io
+
+# set up logger, using inherited config, in case we get called as a module
+logger = logging.getLogger(__name__)
+
+
+def read_config(config_path):
+    """
+    Reads the parameters used by the native engine from a MultiXrank config file, parsed
+    and defaulted as MultiXrank does. Raises an exception if the config uses anything the
+    native engine doesn't implement: several multiplexes or layers, bipartite networks,
+    weighted or directed layers (graph_type other than 00), or eta/tau other than 1.
+    lamb and delta are accepted as they are: they only weigh the jumps between multiplexes
+    and between layers, so they don't change the walk on a single layer.
+
+    returns:
+    - r: restart probability
+    - self_loops: whether self-loops are kept
+    """
+    with open(config_path, 'r') as f:
+        # like MultiXrank: all values are read as strings
+        config = yaml.load(f, Loader=yaml.BaseLoader)
+    if not isinstance(config, dict) or not isinstance(config.get('multiplex'), dict):
+        raise Exception(f"No 'multiplex' field in config file {config_path}")
+
+    # MultiXrank's defaults
+    r = float(config.get('r', 0.7))
+    self_loops = bool(int(config.get('self_loops', 1)))
+
+    if 'bipartite' in config:
+        raise Exception(f"The native RWR engine doesn't support bipartite networks, found in {config_path}")
+    if len(config['multiplex']) != 1:
+        raise Exception(f"The native RWR engine needs a config with a single multiplex, found {len(config['multiplex'])} in {config_path}")
+    if 'eta' in config and [float(Fraction(eta)) for eta in config['eta']] != [1.0]:
+        raise Exception(f"The native RWR engine needs eta: [1], found {config['eta']} in {config_path}")
+
+    multiplex = list(config['multiplex'].values())[0]
+    n_layers = len(multiplex.get('layers', []))
+    if n_layers != 1:
+        raise Exception(f"The native RWR engine needs a config with a single layer, found {n_layers} in {config_path}")
+    if 'graph_type' in multiplex and list(multiplex['graph_type']) != ['00']:
+        raise Exception(f"The native RWR engine only supports unweighted undirected layers (graph_type: [00]), "
+                        f"found {multiplex['graph_type']} in {config_path}")
+    if 'tau' in multiplex and [float(Fraction(tau)) for tau in multiplex['tau']] != [1.0]:
+        raise Exception(f"The native RWR engine needs tau: [1], found {multiplex['tau']} in {config_path}")
+
+    return(r, self_loops)
+
+
+def load_network(interactome_file, self_loops=False):
+    """
+    Reads an undirected, unweighted network from a TSV file with two columns: node1, node2
+    (as written by parse_interactome()); duplicate edges are merged.
+    Like MultiXrank, self-loop edges are always removed: self_loops only decides whether
+    a node that only appears in self-loops is kept (as an isolated node).
+
+    arguments:
+    - interactome_file: path to the TSV file
+    - self_loops: whether self-loops are kept
+
+    returns:
+    - adjacency: scipy.sparse CSR matrix (num_nodes x num_nodes), symmetric, with 0/1 entries
+    - nodes: list of node names, sorted as in MultiXrank
+    """
+    edges = []
+    with open(interactome_file, 'r') as f:
+        for line in f:
+            split_line = line.split()
+            if len(split_line) < 2:
+                continue
+            if split_line[0] == split_line[1] and not self_loops:
+                continue
+            edges.append((split_line[0], split_line[1]))
+
+    nodes = sorted(set(node for edge in edges for node in edge))
+    node2idx = {node: i for (i, node) in enumerate(nodes)}
+    rows = numpy.fromiter((node2idx[edge[0]] for edge in edges), dtype=numpy.int64, count=len(edges))
+    cols = numpy.fromiter((node2idx[edge[1]] for edge in edges), dtype=numpy.int64, count=len(edges))
+    keep = rows != cols
+    rows = rows[keep]
+    cols = cols[keep]
+
+    adjacency = scipy.sparse.coo_matrix((numpy.ones(2 * len(rows)),
+                                         (numpy.concatenate((rows, cols)), numpy.concatenate((cols, rows)))),
+                                        shape=(len(nodes), len(nodes))).tocsr()
+    # merge duplicate edges (and both directions of an edge listed twice)
+    adjacency.data[:] = 1.0
+
+    return(adjacency, nodes)
+
+
+def transition_matrix(adjacency):
+    """
+    Column-normalizes the adjacency matrix: T[i, j] = probability to walk from j to i.
+    Columns of isolated nodes stay 0.
+    """
+    degrees = numpy.asarray(adjacency.sum(axis=0)).ravel()
+    inv_degrees = numpy.divide(1.0, degrees, out=numpy.zeros_like(degrees), where=degrees > 0)
+    return((adjacency @ scipy.sparse.diags(inv_degrees)).tocsr())
+
+
+def restart_matrix(node2idx, seed_sets):
+    """
+    Builds one restart vector per seed set, uniform over the seeds of the set
+
+    arguments:
+    - node2idx: dict, key=node, value=row index in the transition matrix
+    - seed_sets: list of lists of seed nodes
+
+    returns:
+    - restart: 2D numpy array (num_nodes x len(seed_sets)), each column sums to 1
+    """
+    restart = numpy.zeros((len(node2idx), len(seed_sets)))
+    for (j, seeds) in enumerate(seed_sets):
+        idx = [node2idx[seed] for seed in set(seeds) if seed in node2idx]
+        if not idx:
+            raise Exception(f"None of the seeds of set {j} are in the network")
+        restart[idx, j] = 1 / len(idx)
+    return(restart)
+
+
+def random_walk_restart(transition, restart, r, threshold=1e-10):
+    """
+    Random walk with restart for a block of restart vectors at once:
+    P <- (1 - r) * T @ P + r * R, iterated until the L2 norm of the change of every column
+    is below threshold (the stopping rule of MultiXrank, applied column by column).
+
+    arguments:
+    - transition: scipy.sparse CSR matrix from transition_matrix()
+    - restart: 2D numpy array from restart_matrix(), one column per seed set
+    - r: restart probability
+
+    returns:
+    - scores: 2D numpy array (num_nodes x num_seed_sets), steady-state probabilities
+    """
+    scores = restart.copy()
+    restart_part = r * restart
+    residue = numpy.inf
+    iterations = 0
+    while residue >= threshold:
+        new_scores = transition @ scores
+        new_scores *= (1 - r)
+        new_scores += restart_part
+        residue = numpy.sqrt(numpy.max(numpy.sum((new_scores - scores) ** 2, axis=0)))
+        scores = new_scores
+        iterations += 1
+
+    logger.debug(f"RWR converged in {iterations} iterations for {restart.shape[1]} seed sets")
+    return(scores)
+
+
+def write_scores(out_dir, nodes, scores, multiplex="1", top_k=None, compression=None):
+    """
+    Writes scores like MultiXrank's write_ranking(): a TSV file multiplex_{multiplex}.tsv
+    in out_dir with columns multiplex, node, score, sorted by descending score,
+    compressed with compression (one of compressed_io.COMPRESSIONS, None for plain text)
+
+    arguments:
+    - out_dir: output directory, created if needed
+    - nodes: list of node names
+    - scores: 1D numpy array of scores, in the order of nodes
+    - top_k: only write the top_k highest-scoring nodes, None to write all nodes
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    order = numpy.argsort(-scores, kind='stable')[:top_k]
+    scores_file = compressed_io.compressed_name(os.path.join(out_dir, f"multiplex_{multiplex}.tsv"), compression)
+    with compressed_io.open_file(scores_file, 'w') as f:
+        f.write("multiplex\tnode\tscore\n")
+        for i in order:
+            f.write(f"{multiplex}\t{nodes[i]}\t{repr(float(scores[i]))}\n")
+
+
+def compress_scores(out_dir, compression):
+    """
+    Compresses the scores files multiplex_*.tsv written by MultiXrank's write_ranking() in out_dir,
+    with compression (one of compressed_io.COMPRESSIONS, None to leave them as they are)
+    """
+    if compression is None:
+        return
+    for scores_file in glob.glob(os.path.join(out_dir, "multiplex_*.tsv")):
+        compressed_io.finalize_file(scores_file, scores_file, compression)
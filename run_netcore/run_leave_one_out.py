@@ -0,0 +1,287 @@
+############################################################################################
+# Copyright (C) Jędrzej Kubica, Nicolas Thierry-Mieg, 2024-2026
+#
+# This file was written by Jędrzej Kubica and Nicolas Thierry-Mieg
+# (CNRS, France) Nicolas.Thierry-Mieg@univ-grenoble-alpes.fr
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with this program.
+# If not, see <https://www.gnu.org/licenses/>.
+############################################################################################
+
+import argparse
+import logging
+import os
+import subprocess
+import sys
+import time
+import concurrent.futures
+
+import numpy
+
+# shared modules of this repository (compressed_io.py...) are in the parent directory
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+import compressed_io
+import loo_store
+import netcore_index
+
+# manifest status of a seed whose netcore.py run succeeded but could not be saved in the LOO store
+STORE_FAILED = "store_failed"
+
+NETCORE_SCRIPT = os.path.join(os.path.dirname(os.path.realpath(__file__)), "NetCore", "netcore", "netcore.py")
+
+
+def parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Run NetCore leave-one-out: one netcore.py run per left-out seed, --jobs runs at a time. "
+                    "Left-out seeds with a complete output are skipped, so an interrupted run can simply be restarted.")
+    parser.add_argument(
+        "--interactome",
+        required=True,
+        help="path to network file")
+    parser.add_argument(
+        "--seeds",
+        required=True,
+        help="seeds file, one seed per line (eg seeds.txt produced by the MultiXrank leave-one-out)")
+    parser.add_argument(
+        "--permutations",
+        required=True,
+        help="directory with the network permutations (from run_permutations.py)")
+    parser.add_argument(
+        "--output-path",
+        required=True,
+        help="directory where one subdirectory output_{SEED} is created per left-out seed")
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="number of netcore.py runs in parallel (optional, default: 1)")
+    parser.add_argument(
+        "--python",
+        default=sys.executable,
+        help="Python interpreter to run netcore.py with, eg from a Python 3.7 environment "
+             "(optional, default: the interpreter running this script)")
+    parser.add_argument(
+        "--netcore",
+        default=NETCORE_SCRIPT,
+        help="path to netcore.py (optional, default: NetCore/netcore/netcore.py next to this script)")
+    parser.add_argument(
+        "--compress",
+        choices=compressed_io.COMPRESSIONS,
+        default=None,
+        help="compress random_walk_weights.txt of each left-out seed when netcore.py is done, "
+             "eg random_walk_weights.txt.gz (optional, default: no compression)")
+    parser.add_argument(
+        "--no-store",
+        action="store_true",
+        help="don't save the propagation weights of all nodes for each left-out seed in the LOO store "
+             "(LOO_store/ in --output-path, see loo_store.py)")
+
+    args = parser.parse_args()
+    return args
+
+
+def read_manifest(manifest_file):
+    """
+    Reads the manifest of previous runs (TSV with header: SEED, STATUS, WALL_TIME)
+
+    returns:
+    - seed2status: dict, key=seed, value=exit status of its last run
+    """
+    seed2status = {}
+    if os.path.isfile(manifest_file):
+        with open(manifest_file, 'r') as f:
+            next(f, None)
+            for line in f:
+                split_line = line.rstrip("\n").split("\t")
+                if len(split_line) == 3:
+                    seed2status[split_line[0]] = split_line[1]
+    return seed2status
+
+
+def is_complete(out_left_out, status):
+    """
+    Checks that a previous run for a left-out seed succeeded:
+    random_walk_weights.txt (or its compressed variant) starts with netcore.py's header
+    and is not truncated (ends with a newline, and a compressed file
+    decompresses to its end), and the manifest (if this seed is in it) records exit status 0
+    """
+    if status is not None and status != "0":
+        return False
+
+    weights_file = compressed_io.find_file(os.path.join(out_left_out, "random_walk_weights.txt"))
+    if not os.path.isfile(weights_file) or os.path.getsize(weights_file) == 0:
+        return False
+    try:
+        with compressed_io.open_file(weights_file, 'rb') as f:
+            line = f.readline()
+            if not line.startswith(b"node_index\t"):
+                return False
+            if compressed_io.compression_of(weights_file) is None:
+                f.seek(-1, os.SEEK_END)
+                return f.read(1) == b"\n"
+            # compressed streams can't seek to their end: read them through,
+            # a truncated or corrupt stream raises an exception
+            last = line[-1:]
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                last = chunk[-1:]
+            return last == b"\n"
+    except Exception as e:
+        logging.getLogger(__name__).warning("Unreadable %s, running this seed again: %s", weights_file, repr(e))
+        return False
+
+
+def run_netcore(seed, seeds, args):
+    """
+    Runs netcore.py with all seeds except seed, in output-path/output_{seed}/,
+    with stdout and stderr captured in log.txt; if it succeeds, random_walk_weights.txt
+    is compressed with --compress
+
+    returns:
+    - status: exit status of netcore.py
+    - wall_time: in seconds
+    """
+    out_left_out = os.path.join(args.output_path, f"output_{seed}")
+    os.makedirs(out_left_out, exist_ok=True)
+
+    seed_file = os.path.join(out_left_out, f"seeds_{seed}.txt")
+    with open(seed_file, 'w') as f:
+        for s in seeds:
+            if s != seed:
+                f.write(s + "\n")
+
+    start = time.time()
+    with open(os.path.join(out_left_out, "log.txt"), 'w') as log:
+        status = subprocess.run([args.python, args.netcore,
+                                 "-e", args.interactome,
+                                 "-s", seed_file,
+                                 "-pd", args.permutations,
+                                 "-o", out_left_out + os.sep],
+                                stdout=log, stderr=subprocess.STDOUT).returncode
+
+    if status == 0 and args.compress is not None:
+        weights_file = os.path.join(out_left_out, "random_walk_weights.txt")
+        compressed_io.finalize_file(weights_file, weights_file, args.compress)
+
+    return status, time.time() - start
+
+
+def read_interactome_nodes(interactome_file):
+    """
+    Returns the sorted list of nodes of the interactome (first two columns of each line),
+    the node table of the LOO store: netcore.py scores a subset of them
+    """
+    nodes = set()
+    with compressed_io.open_file(interactome_file, 'r') as f:
+        for line in f:
+            split_line = line.rstrip("\n").split("\t")
+            if len(split_line) >= 2:
+                nodes.update(split_line[:2])
+    return sorted(nodes)
+
+
+def store_weights(store_dir, seeds, seed, out_left_out, node2col):
+    """
+    Saves the propagation weights of all nodes in random_walk_weights.txt of a left-out seed
+    in the LOO store, as the row of seed; nodes without a weight (eg not in the main
+    component of the interactome) get NaN.
+
+    arguments:
+    - node2col: dict with key=node of the store's node table, value=column
+    """
+    weights_file = compressed_io.find_file(os.path.join(out_left_out, "random_walk_weights.txt"))
+    (n_above, n_equal, nodes, weights) = netcore_index.parse_netcore_scores_file(seed, weights_file, full_scores=True)
+    missing = [node for node in nodes if node not in node2col]
+    if missing:
+        raise Exception(f"{weights_file} has {len(missing)} nodes that are not in the interactome, eg {missing[0]}")
+    row = numpy.full(len(node2col), numpy.nan, dtype=numpy.float32)
+    row[[node2col[node] for node in nodes]] = weights
+    loo_store.write_rows(store_dir, [seeds.index(seed)], row[numpy.newaxis, :])
+
+
+def run_leave_one_out(args: argparse.Namespace):
+    logger = logging.getLogger(__name__)
+    compressed_io.check_compression(args.compress)
+    os.makedirs(args.output_path, exist_ok=True)
+
+    with open(args.seeds, 'r') as f:
+        seeds = [line.strip() for line in f if line.strip()]
+
+    manifest_file = os.path.join(args.output_path, "manifest.tsv")
+    seed2status = read_manifest(manifest_file)
+    todo = [seed for seed in seeds
+            if not is_complete(os.path.join(args.output_path, f"output_{seed}"), seed2status.get(seed))]
+    logger.info("%d left-out seeds, %d already complete, running %d with %d jobs",
+                len(seeds), len(seeds) - len(todo), len(todo), args.jobs)
+
+    if not os.path.isfile(manifest_file):
+        with open(manifest_file, 'w') as f:
+            f.write("SEED\tSTATUS\tWALL_TIME\n")
+
+    # the propagation weights of all nodes for each left-out seed (see loo_store.py), saved
+    # from random_walk_weights.txt: first for the seeds completed by previous runs and not
+    # yet in the store, then as the netcore.py runs finish; the node table is the interactome,
+    # so that every random_walk_weights.txt fits in it
+    store_dir = None
+    if not args.no_store:
+        store_dir = os.path.join(args.output_path, loo_store.STORE_DIR)
+        store_nodes = read_interactome_nodes(args.interactome)
+        node2col = {node: j for (j, node) in enumerate(store_nodes)}
+        loo_store.create_store(store_dir, seeds, store_nodes)
+        (scores, done) = loo_store.load_scores(store_dir)
+        for (seed, is_done) in zip(seeds, done):
+            if seed not in todo and not is_done:
+                try:
+                    store_weights(store_dir, seeds, seed, os.path.join(args.output_path, f"output_{seed}"), node2col)
+                except Exception as e:
+                    logger.error("%s: cannot save the weights in the LOO store %s, running it again: %s",
+                                 seed, store_dir, repr(e))
+                    todo.append(seed)
+
+    # jobs are netcore.py subprocesses, threads only wait for them
+    failed = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=args.jobs) as executor:
+        futures = {executor.submit(run_netcore, seed, seeds, args): seed for seed in todo}
+        for future in concurrent.futures.as_completed(futures):
+            seed = futures[future]
+            status, wall_time = future.result()
+            if status == 0 and store_dir is not None:
+                # a seed that can't be stored is recorded as failed, so that it is run again
+                try:
+                    store_weights(store_dir, seeds, seed, os.path.join(args.output_path, f"output_{seed}"), node2col)
+                except Exception as e:
+                    logger.error("%s: cannot save the weights in the LOO store %s: %s", seed, store_dir, repr(e))
+                    status = STORE_FAILED
+            if status == 0:
+                logger.info("%s done in %.1f s", seed, wall_time)
+            elif status == STORE_FAILED:
+                failed.append(seed)
+            else:
+                logger.error("%s failed with exit status %d, see %s", seed, status,
+                             os.path.join(args.output_path, f"output_{seed}", "log.txt"))
+                failed.append(seed)
+            with open(manifest_file, 'a') as f:
+                f.write(f"{seed}\t{status}\t{wall_time:.1f}\n")
+
+    if failed:
+        raise Exception(f"NetCore (or the LOO store) failed for {len(failed)} left-out seeds: {', '.join(failed)}")
+
+    logger.info("Done!")
+
+
+def main():
+    logging.basicConfig(level=logging.INFO,
+                        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    args = parse_arguments()
+    run_leave_one_out(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,5 @@
 ############################################################################################
-# Copyright (C) Jędrzej Kubica, Nicolas Thierry-Mieg, 2024-2026
+# Copyright (C) Jędrzej Kubica, Nicolas Thierry-Mieg, 2026
 #
 # This file was written by Jędrzej Kubica and Nicolas Thierry-Mieg
 # (CNRS, France) Nicolas.Thierry-Mieg@univ-grenoble-alpes.fr
@@ -16,30 +16,8 @@
 # If not, see <https://www.gnu.org/licenses/>.
 ############################################################################################
 
-#!/usr/bin/env bash
+import os
+import sys
 
-# Usage:
-# ./run_leave_one_out.sh <interactome> <seeds_dir> <permutation_dir> <out_dir>
-
-set -euo pipefail
-
-INTERACTOME="$1"
-SEEDS_DIR="$2"
-PERM_DIR="$3"
-OUT_DIR="$4"
-
-for seedfile in "$SEEDS_DIR"/seeds_*.txt ;
-    do
-    seed=$(basename "$seedfile" .txt | sed 's/^seeds_//')
-
-    OUT_LEFT_OUT="${OUT_DIR}/output_${seed}/"
-    mkdir -p "$OUT_LEFT_OUT"
-
-    python run_netcore/NetCore/netcore/netcore.py \
-        -e "$INTERACTOME" \
-        -s "$seedfile" \
-        -pd "$PERM_DIR" \
-        -o "$OUT_LEFT_OUT" \
-        1>"$OUT_LEFT_OUT"/log.txt \
-        2>&1 ;
-    done
\ No newline at end of file
+# the modules under test (validation_CDF.py, ranking.py...) are in the parent directory
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
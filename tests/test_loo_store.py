@@ -0,0 +1,68 @@
+############################################################################################
+# Copyright (C) Jędrzej Kubica, Nicolas Thierry-Mieg, 2026
+#
+# This file was written by Jędrzej Kubica and Nicolas Thierry-Mieg
+# (CNRS, France) Nicolas.Thierry-Mieg@univ-grenoble-alpes.fr
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with this program.
+# If not, see <https://www.gnu.org/licenses/>.
+############################################################################################
+
+
+
+import numpy
+import pytest
+import scipy.stats
+
+import loo_store
+import ranking
+
+
+def make_store(store_dir, genes, nodes, seed=0):
+    # few distinct scores, so that most nodes are tied
+    rng = numpy.random.default_rng(seed)
+    scores = (rng.integers(0, 8, size=(len(genes), len(nodes))) / 8).astype(numpy.float32)
+    loo_store.create_store(store_dir, genes, nodes)
+    loo_store.write_rows(store_dir, list(range(len(genes))), scores)
+    return(scores)
+
+
+@pytest.mark.parametrize("ties", ranking.TIES)
+def test_store_ranks_same_as_rankdata(tmp_path, ties):
+    nodes = [f"N{j}" for j in range(40)]
+    # G1 is not a node of the store: it gets rank=network_size
+    genes = ["N3", "G1", "N0", "N39"]
+    store_dir = str(tmp_path / loo_store.STORE_DIR)
+    scores = make_store(store_dir, genes, nodes)
+
+    node2rank = loo_store.store_ranks(store_dir, 50, ties, chunk_size=3)
+    assert list(node2rank) == genes
+    assert node2rank["G1"] == 50
+    for (i, gene) in enumerate(genes):
+        if gene in nodes:
+            expected = scipy.stats.rankdata(-scores[i], method=ties)[nodes.index(gene)]
+            assert node2rank[gene] == expected
+
+
+def test_store_ranks_incomplete_store(tmp_path):
+    store_dir = str(tmp_path / loo_store.STORE_DIR)
+    loo_store.create_store(store_dir, ["N0", "N1"], ["N0", "N1", "N2"])
+    loo_store.write_rows(store_dir, [0], numpy.ones((1, 3), dtype=numpy.float32))
+    with pytest.raises(Exception):
+        loo_store.store_ranks(store_dir, 3)
+
+
+def test_store_ranks_unscored_gene(tmp_path):
+    # N1 is a node of the store without a score in its own run (NaN, eg not scored by NetCore)
+    store_dir = str(tmp_path / loo_store.STORE_DIR)
+    loo_store.create_store(store_dir, ["N0", "N1"], ["N0", "N1", "N2"])
+    loo_store.write_rows(store_dir, [0, 1], numpy.array([[0.5, numpy.nan, 0.7], [0.5, numpy.nan, 0.7]], dtype=numpy.float32))
+    assert loo_store.store_ranks(store_dir, 10) == {"N0": 2, "N1": 10}
@@ -0,0 +1,54 @@
+############################################################################################
+# Copyright (C) Jędrzej Kubica, Nicolas Thierry-Mieg, 2026
+#
+# This file was written by Jędrzej Kubica and Nicolas Thierry-Mieg
+# (CNRS, France) Nicolas.Thierry-Mieg@univ-grenoble-alpes.fr
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with this program.
+# If not, see <https://www.gnu.org/licenses/>.
+############################################################################################
+
+
+
+import os
+
+import numpy
+
+import netcore_index
+
+
+def write_scores_file(netcore_LOO_dir, left_out_node, node2score):
+    out_dir = os.path.join(netcore_LOO_dir, f"output_{left_out_node}")
+    os.makedirs(out_dir, exist_ok=True)
+    with open(os.path.join(out_dir, "random_walk_weights.txt"), 'w') as f:
+        f.write("node_index\tnode\tprop_weight\tpvalue\n")
+        for (i, (node, score)) in enumerate(node2score.items()):
+            f.write(f"{i}\t{node}\t{score}\t0.5\n")
+
+
+def test_index_update_keeps_full_scores(tmp_path):
+    netcore_LOO_dir = str(tmp_path)
+    write_scores_file(netcore_LOO_dir, "A", {"B": 0.5, "C": 0.2, "A": 0.2})
+    write_scores_file(netcore_LOO_dir, "B", {"A": 0.7, "B": 0.1, "C": 0.4})
+    index = netcore_index.index_netcore_dir(netcore_LOO_dir, ["A", "B"], full_scores=True)
+    assert index['nodes'].tolist() == ["A", "B", "C"]
+    assert index['n_above'].tolist() == [1, 2]
+    assert index['n_equal'].tolist() == [2, 1]
+
+    # a changed file re-parsed by a caller that doesn't need the full scores
+    write_scores_file(netcore_LOO_dir, "B", {"A": 0.7, "B": 0.9, "C": 0.4, "D": 0.1})
+    index = netcore_index.index_netcore_dir(netcore_LOO_dir, ["A", "B"], full_scores=False)
+    assert index['n_above'].tolist() == [1, 0]
+
+    cached = netcore_index.load_index(os.path.join(netcore_LOO_dir, netcore_index.INDEX_FILE))
+    assert cached['nodes'].tolist() == ["A", "B", "C", "D"]
+    expected = numpy.array([[0.2, 0.5, 0.2, numpy.nan], [0.7, 0.9, 0.4, 0.1]], dtype=numpy.float32)
+    assert numpy.array_equal(cached['scores'], expected, equal_nan=True)
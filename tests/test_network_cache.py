@@ -0,0 +1,60 @@
+############################################################################################
+# Copyright (C) Jędrzej Kubica, Nicolas Thierry-Mieg, 2026
+#
+# This file was written by Jędrzej Kubica and Nicolas Thierry-Mieg
+# (CNRS, France) Nicolas.Thierry-Mieg@univ-grenoble-alpes.fr
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with this program.
+# If not, see <https://www.gnu.org/licenses/>.
+############################################################################################
+
+
+
+import numpy
+import pytest
+
+# network_cache.py needs BFWalk's data_parser
+pytest.importorskip("data_parser")
+import network_cache
+
+networkx = pytest.importorskip("networkx")
+
+
+def random_edges(seed, n_nodes=30, n_edges=200):
+    """
+    Weighted edges with duplicates, edges listed in both directions with different weights, and self-loops
+    """
+    rng = numpy.random.default_rng(seed)
+    return([(int(a), int(b), float(w)) for (a, b, w) in zip(rng.integers(0, n_nodes, n_edges),
+                                                           rng.integers(0, n_nodes, n_edges),
+                                                           rng.integers(1, 100, n_edges) / 100)])
+
+
+@pytest.mark.parametrize("directed", [False, True])
+@pytest.mark.parametrize("seed", range(3))
+def test_build_CSR_same_as_networkx(monkeypatch, tmp_path, directed, seed):
+    n_nodes = 30
+    edges = random_edges(seed, n_nodes)
+    nodes = [f"N{i}" for i in range(n_nodes)]
+    monkeypatch.setattr(network_cache.data_parser, "parse_network",
+                        lambda network_file, weighted, directed: (edges, {node: i for (i, node) in enumerate(nodes)}, nodes))
+    arrays = network_cache.build_CSR(tmp_path / "network.sif", True, directed)
+
+    # networkx keeps the last weight of duplicate edges, a-b and b-a being the same edge when undirected
+    graph = networkx.DiGraph() if directed else networkx.Graph()
+    graph.add_nodes_from(range(n_nodes))
+    graph.add_weighted_edges_from(edges)
+    expected = networkx.to_scipy_sparse_array(graph, nodelist=range(n_nodes), dtype=numpy.float32, format='csr')
+    expected.sort_indices()
+
+    assert numpy.array_equal(arrays['indptr'], expected.indptr)
+    assert numpy.array_equal(arrays['indices'], expected.indices)
+    assert numpy.array_equal(arrays['weights'], expected.data)
@@ -0,0 +1,61 @@
+############################################################################################
+# Copyright (C) Jędrzej Kubica, Nicolas Thierry-Mieg, 2026
+#
+# This file was written by Jędrzej Kubica and Nicolas Thierry-Mieg
+# (CNRS, France) Nicolas.Thierry-Mieg@univ-grenoble-alpes.fr
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with this program.
+# If not, see <https://www.gnu.org/licenses/>.
+############################################################################################
+
+
+import numpy
+import pytest
+import scipy.stats
+
+import ranking
+
+
+@pytest.mark.parametrize("ties", ranking.TIES)
+@pytest.mark.parametrize("seed", range(3))
+def test_rank_of_node_same_as_rankdata(ties, seed):
+    # few distinct scores, so that most nodes are tied
+    rng = numpy.random.default_rng(seed)
+    scores = rng.integers(0, 8, size=50) / 8
+    expected = scipy.stats.rankdata(-scores, method=ties)
+    for idx in range(len(scores)):
+        assert ranking.rank_of_node(scores, idx, ties) == expected[idx]
+
+
+@pytest.mark.parametrize("ties", ranking.TIES)
+def test_rank_from_counts_same_as_rankdata(ties):
+    scores = numpy.array([0.9, 0.5, 0.5, 0.5, 0.5, 0.2, 0.2, 0.2, 0.1])
+    expected = scipy.stats.rankdata(-scores, method=ties)
+    for (idx, score) in enumerate(scores):
+        rank = ranking.rank_from_counts(numpy.count_nonzero(scores > score), numpy.count_nonzero(scores == score), ties)
+        assert rank == expected[idx]
+
+
+def test_rank_from_counts_values():
+    assert ranking.rank_from_counts(0, 1) == 1
+    assert ranking.rank_from_counts(3, 4, "min") == 4
+    assert ranking.rank_from_counts(3, 4, "max") == 7
+    assert ranking.rank_from_counts(3, 4, "average") == 5.5
+    # average ranks are ints when the number of tied nodes is odd
+    rank = ranking.rank_from_counts(3, 3, "average")
+    assert rank == 5 and isinstance(rank, int)
+    # numpy counts, eg from count_nonzero
+    assert ranking.rank_from_counts(numpy.int64(2), numpy.int64(1), "max") == 3
+
+
+def test_rank_from_counts_unknown_policy():
+    with pytest.raises(Exception):
+        ranking.rank_from_counts(0, 1, "dense")
@@ -0,0 +1,161 @@
+############################################################################################
+# Copyright (C) Jędrzej Kubica, Nicolas Thierry-Mieg, 2026
+#
+# This file was written by Jędrzej Kubica and Nicolas Thierry-Mieg
+# (CNRS, France) Nicolas.Thierry-Mieg@univ-grenoble-alpes.fr
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with this program.
+# If not, see <https://www.gnu.org/licenses/>.
+############################################################################################
+
+import itertools
+
+import numpy
+import pytest
+
+# validation_CDF.py needs BFWalk's data_parser (see network_cache.py)
+pytest.importorskip("data_parser")
+import validation_CDF
+
+
+def loop_ranks_to_curve(ranks, network_size):
+    """
+    ranks_to_curve() before it was vectorized, as reference
+    """
+    curve = []
+    for i in range(1, network_size + 1):
+        curve.append(sum(rank <= i for rank in ranks))
+
+    AUC = 0.0
+    for i in range(1, len(curve)):
+        AUC += (curve[i] + curve[i-1]) / 2
+
+    max_possible = (len(curve) - 1) * len(ranks)
+    return(curve, AUC / max_possible)
+
+
+def check_same_as_loop(ranks, network_size):
+    (curve, AUC) = validation_CDF.ranks_to_curve(ranks, network_size)
+    (loop_curve, loop_AUC) = loop_ranks_to_curve(ranks, network_size)
+    assert curve.tolist() == loop_curve
+    assert AUC == pytest.approx(loop_AUC, rel=1e-12)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_ranks_to_curve_integer_ranks(seed):
+    rng = numpy.random.default_rng(seed)
+    network_size = 500
+    ranks = rng.integers(1, network_size, endpoint=True, size=40).tolist()
+    check_same_as_loop(ranks, network_size)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_ranks_to_curve_average_tie_ranks(seed):
+    # average ranks of tied nodes are integers or half-integers
+    rng = numpy.random.default_rng(seed)
+    network_size = 500
+    ranks = (rng.integers(2, 2 * network_size, endpoint=True, size=40) / 2).tolist()
+    check_same_as_loop(ranks, network_size)
+
+
+def test_ranks_to_curve_random_classifier_ranks():
+    (random_ranks, band) = validation_CDF.generate_random_ranks(37, 500)
+    check_same_as_loop(random_ranks.tolist(), 500)
+
+
+def test_ranks_to_curve_out_of_range_ranks():
+    # ranks of 0 count at every point, ranks above network_size at none
+    check_same_as_loop([0, 1, 5, 10, 11, 25], 10)
+    check_same_as_loop([0, 0.5, 3.5, 10.5, 12.5], 10)
+
+
+def test_ranks_to_curve_single_left_out():
+    for rank in (0, 1, 2, 7, 10, 11, 4.5):
+        check_same_as_loop([rank], 10)
+
+
+def test_ranks_to_curve_dict_values():
+    node2rank = {"A": 3, "B": 1, "C": 8}
+    (curve, AUC) = validation_CDF.ranks_to_curve(node2rank.values(), 10)
+    (loop_curve, loop_AUC) = loop_ranks_to_curve(list(node2rank.values()), 10)
+    assert curve.tolist() == loop_curve
+    assert AUC == pytest.approx(loop_AUC, rel=1e-12)
+
+
+@pytest.mark.parametrize("n_left_out,network_size", [(1, 1), (1, 7), (3, 7), (4, 9), (9, 9)])
+def test_generate_random_ranks_analytical_exact(n_left_out, network_size):
+    # expected sorted ranks, enumerating all samples without replacement
+    samples = numpy.array(list(itertools.combinations(range(1, network_size + 1), n_left_out)))
+    (random_ranks, band) = validation_CDF.generate_random_ranks(n_left_out, network_size)
+    assert band is None
+    assert random_ranks == pytest.approx(samples.mean(axis=0), rel=1e-12)
+
+
+def test_generate_random_ranks_montecarlo():
+    (random_ranks, (ranks_low, ranks_high)) = validation_CDF.generate_random_ranks(5, 100, mode="montecarlo",
+                                                                                    iterations=20000, seed=1)
+    (expected, band) = validation_CDF.generate_random_ranks(5, 100)
+    # standard error of each sorted rank is below 30 / sqrt(20000)
+    assert random_ranks == pytest.approx(expected, abs=1)
+    assert numpy.all(ranks_low <= random_ranks) and numpy.all(random_ranks <= ranks_high)
+    assert numpy.all(numpy.diff(random_ranks) > 0)
+
+    (again, again_band) = validation_CDF.generate_random_ranks(5, 100, mode="montecarlo", iterations=20000, seed=1)
+    assert numpy.array_equal(random_ranks, again)
+
+
+
+def test_generate_random_ranks_montecarlo_independent_of_workers():
+    # several chunks of rounds, the last one partial
+    results = [validation_CDF.generate_random_ranks(5, 100, mode="montecarlo", iterations=2500, seed=3, workers=workers)
+               for workers in (1, 2, 3)]
+    for (random_ranks, (ranks_low, ranks_high)) in results[1:]:
+        assert numpy.array_equal(random_ranks, results[0][0])
+        assert numpy.array_equal(ranks_low, results[0][1][0])
+        assert numpy.array_equal(ranks_high, results[0][1][1])
+
+def test_generate_random_ranks_unknown_mode():
+    with pytest.raises(Exception):
+        validation_CDF.generate_random_ranks(5, 100, mode="exact")
+
+
+@pytest.mark.parametrize("ranks", [[1, 3, 3, 10, 250, 500], [0, 0.5, 2.5, 17.5, 501, 800], [4], list(range(1, 501))])
+def test_AUC_contributions_sum_to_AUC(ranks):
+    network_size = 500
+    (curve, AUC) = validation_CDF.ranks_to_curve(ranks, network_size)
+    contributions = validation_CDF.AUC_contributions(ranks, network_size)
+    assert contributions.sum() / ((network_size - 1) * len(ranks)) == pytest.approx(AUC, rel=1e-12)
+
+
+def test_bootstrap_AUC_same_as_resampled_curves():
+    rng = numpy.random.default_rng(3)
+    network_size = 200
+    ranks = numpy.concatenate((rng.integers(1, network_size, endpoint=True, size=25),
+                               rng.integers(2, 2 * network_size, endpoint=True, size=5) / 2))
+    iterations = 500
+    (AUC_low, AUC_high) = validation_CDF.bootstrap_AUC(ranks, network_size, iterations, seed=7)
+
+    # same replicates (a single block of resampled indexes), each AUC from its own curve
+    resampled = numpy.random.default_rng(7).integers(0, len(ranks), size=(iterations, len(ranks)))
+    AUCs = [validation_CDF.ranks_to_curve(ranks[idx], network_size)[1] for idx in resampled]
+    (expected_low, expected_high) = numpy.percentile(AUCs, [2.5, 97.5])
+    assert AUC_low == pytest.approx(expected_low, rel=1e-12)
+    assert AUC_high == pytest.approx(expected_high, rel=1e-12)
+
+    curve_AUC = validation_CDF.ranks_to_curve(ranks, network_size)[1]
+    assert AUC_low <= curve_AUC <= AUC_high
+
+
+def test_bootstrap_AUC_identical_ranks():
+    # every replicate is the original sample
+    (AUC_low, AUC_high) = validation_CDF.bootstrap_AUC([5, 5, 5], 100, 200, seed=0)
+    AUC = validation_CDF.ranks_to_curve([5, 5, 5], 100)[1]
+    assert AUC_low == pytest.approx(AUC) and AUC_high == pytest.approx(AUC)
@@ -0,0 +1,116 @@
+############################################################################################
+# Copyright (C) Jędrzej Kubica, Nicolas Thierry-Mieg, 2026
+#
+# This file was written by Jędrzej Kubica and Nicolas Thierry-Mieg
+# (CNRS, France) Nicolas.Thierry-Mieg@univ-grenoble-alpes.fr
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with this program.
+# If not, see <https://www.gnu.org/licenses/>.
+############################################################################################
+
+
+import numpy
+import pytest
+import scipy.stats
+
+# validation_TE.py needs BFWalk's data_parser (see network_cache.py)
+pytest.importorskip("data_parser")
+import validation_TE
+
+
+def random_scores(seed, n_nodes=300):
+    """
+    Scores and enrichment with many ties, and some genes without expression data (NaN enrichment)
+    """
+    rng = numpy.random.default_rng(seed)
+    scores = rng.integers(0, 20, size=n_nodes) / 20
+    enrichment = rng.integers(0, 30, size=n_nodes).astype(float)
+    enrichment[rng.random(n_nodes) < 0.2] = numpy.nan
+    return(scores, enrichment, ~numpy.isnan(enrichment))
+
+
+@pytest.mark.parametrize("shuffled", [False, True])
+@pytest.mark.parametrize("seed", range(3))
+def test_threshold_sweep_same_as_single_thresholds(seed, shuffled):
+    (scores, enrichment, annotated) = random_scores(seed)
+    # tie-breaking order of a scores file that doesn't list the nodes by node index
+    order = numpy.random.default_rng(seed).permutation(len(scores)) if shuffled else None
+    thresholds = numpy.arange(1, 21) * 5.0
+    (tissue_enriched, non_tissue_enriched, ratio, pvalues) = validation_TE.threshold_sweep(scores, enrichment, annotated, thresholds,
+                                                                                           order)
+
+    for (i, highest_threshold) in enumerate(thresholds):
+        (highest_scoring, low_scoring) = validation_TE.get_highest_scoring_nodes(scores, annotated, highest_threshold, order)
+        for (j, enrichment_threshold) in enumerate(thresholds):
+            (enriched, non_enriched) = validation_TE.top_percent(enrichment, annotated, enrichment_threshold)
+            x1 = numpy.count_nonzero(highest_scoring & enriched)
+            x2 = numpy.count_nonzero(low_scoring & enriched)
+            x3 = numpy.count_nonzero(highest_scoring & non_enriched)
+            x4 = numpy.count_nonzero(low_scoring & non_enriched)
+            assert tissue_enriched[i, j] == x1
+            assert non_tissue_enriched[i, j] == x3
+            if x1 + x3 > 0:
+                assert ratio[i, j] == pytest.approx(x1 / (x1 + x3))
+            else:
+                assert numpy.isnan(ratio[i, j])
+            (_, pvalue) = scipy.stats.fisher_exact([[x1, x2], [x3, x4]], alternative='greater')
+            assert pvalues[i, j] == pytest.approx(pvalue, rel=1e-9, abs=1e-300)
+
+
+@pytest.mark.parametrize("threshold", [1.0, 10.0, 33.0])
+@pytest.mark.parametrize("seed", range(3))
+def test_highest_scoring_nodes_in_file_order(seed, threshold):
+    # selection of the previous implementation: stable sort of the scores file (ties in file order),
+    # then the top x% of the genes with tissue enrichment data
+    (scores, enrichment, annotated) = random_scores(seed)
+    rng = numpy.random.default_rng(seed)
+    node2idx = {f"N{i}": i for i in range(len(scores))}
+    node2score = {f"N{i}": scores[i] for i in rng.permutation(len(scores))}
+    annotated_nodes = [node for node in node2score if annotated[node2idx[node]]]
+    results_sorted = sorted(annotated_nodes, key=lambda node: node2score[node], reverse=True)
+    expected = set(results_sorted[:round(len(results_sorted) * threshold / 100)])
+
+    order = validation_TE.file_order(node2score, node2idx)
+    (highest_scoring, low_scoring) = validation_TE.get_highest_scoring_nodes(scores, annotated, threshold, order)
+    assert set(f"N{i}" for i in numpy.flatnonzero(highest_scoring)) == expected
+
+
+def test_file_order_missing_nodes():
+    node2idx = {"A": 0, "B": 1, "C": 2, "D": 3}
+    # D has no score, E is not in the network
+    order = validation_TE.file_order({"C": 0.5, "E": 0.4, "A": 0.5, "B": 0.1}, node2idx)
+    assert order.tolist() == [1, 2, 0, 3]
+
+
+def test_threshold_sweep_full_selection():
+    # at 100% every annotated gene is selected in both dimensions
+    (scores, enrichment, annotated) = random_scores(0)
+    thresholds = numpy.array([50.0, 100.0])
+    (tissue_enriched, non_tissue_enriched, ratio, pvalues) = validation_TE.threshold_sweep(scores, enrichment, annotated, thresholds)
+    assert tissue_enriched[1, 1] == numpy.count_nonzero(annotated)
+    assert non_tissue_enriched[1, 1] == 0
+    assert pvalues[1, 1] == pytest.approx(1.0)
+
+
+@pytest.mark.parametrize("degree_matched", [False, True])
+def test_empirical_pvalue_independent_of_workers(degree_matched):
+    rng = numpy.random.default_rng(0)
+    n_nodes = 300
+    annotated = rng.random(n_nodes) < 0.8
+    tissue_enriched = annotated & (rng.random(n_nodes) < 0.2)
+    highest_scoring = annotated & (rng.random(n_nodes) < 0.1)
+    degrees = rng.integers(1, 50, size=n_nodes) if degree_matched else None
+    # several chunks of random sets, the last one partial
+    pvalues = [validation_TE.empirical_pvalue(highest_scoring, tissue_enriched, annotated, degrees, iterations=2500,
+                                              seed_seq=numpy.random.SeedSequence(7), workers=workers)
+               for workers in (1, 2, 3)]
+    assert pvalues[0] == pvalues[1] == pvalues[2]
+    assert 1 / 2501 <= pvalues[0] <= 1
@@ -0,0 +1,67 @@
+############################################################################################
+# Copyright (C) Jędrzej Kubica, Nicolas Thierry-Mieg, 2026
+#
+# This file was written by Jędrzej Kubica and Nicolas Thierry-Mieg
+# (CNRS, France) Nicolas.Thierry-Mieg@univ-grenoble-alpes.fr
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with this program.
+# If not, see <https://www.gnu.org/licenses/>.
+############################################################################################
+
+
+import itertools
+
+import numpy
+import pytest
+
+# validation_rankVsDeg.py needs BFWalk's data_parser (see network_cache.py)
+pytest.importorskip("data_parser")
+import validation_rankVsDeg
+
+
+def exact_sign_flip_pvalue(rank_diff):
+    """
+    Two-sided sign-flip p-value, enumerating all 2^n sign vectors
+    """
+    observed = abs(sum(rank_diff))
+    n_extreme = 0
+    signs_list = list(itertools.product((-1, 1), repeat=len(rank_diff)))
+    for signs in signs_list:
+        n_extreme += abs(sum(s * d for (s, d) in zip(signs, rank_diff))) >= observed
+    return(n_extreme / len(signs_list))
+
+
+def test_sign_flip_pvalue_same_as_explicit_flips():
+    rank_diff = numpy.array([3, -1.5, 12, 7, -2, 0, 4.5, 9])
+    permutations = 2000
+    pvalue = validation_rankVsDeg.sign_flip_pvalue(rank_diff, permutations, seed=5)
+
+    # same random bits (a single block), statistic of each sign vector summed explicitly
+    bits = numpy.random.default_rng(5).integers(0, 2, size=(permutations, len(rank_diff)), dtype=numpy.int8)
+    n_extreme = sum(abs(sum(d if b else -d for (b, d) in zip(row, rank_diff))) >= abs(rank_diff.sum()) for row in bits)
+    assert pvalue == (1 + n_extreme) / (1 + permutations)
+
+
+@pytest.mark.parametrize("rank_diff", [[3, -1.5, 12, 7, -2, 0, 4.5, 9, 1, -6], [1, 1, 1, 1, 1, 1, 1, 1], [5, -5, 2.5, -2.5, 10]])
+def test_sign_flip_pvalue_close_to_exact(rank_diff):
+    pvalue = validation_rankVsDeg.sign_flip_pvalue(rank_diff, 100000, seed=0)
+    # standard error of the estimate is at most 0.5 / sqrt(100000)
+    assert pvalue == pytest.approx(exact_sign_flip_pvalue(rank_diff), abs=0.01)
+
+
+def test_sign_flip_pvalue_no_difference():
+    assert validation_rankVsDeg.sign_flip_pvalue([0, 0, 0], 100, seed=0) == 1.0
+
+
+def test_sign_flip_pvalue_reproducible():
+    rank_diff = numpy.arange(-20, 40) / 2
+    assert validation_rankVsDeg.sign_flip_pvalue(rank_diff, 5000, seed=11) == \
+        validation_rankVsDeg.sign_flip_pvalue(rank_diff, 5000, seed=11)
@@ -22,13 +22,16 @@ import argparse
 import pathlib
 import logging
 
-import statistics
+import concurrent.futures
 import numpy
-import networkx
 import matplotlib.pyplot
 
 sys.path.append("/home/kubicaj/Software/BFWalk")
-import data_parser
+import network_cache
+import ranking
+import netcore_index
+import compressed_io
+import loo_store
 
 # set up logger, using inherited config, in case we get called as a module
 logger = logging.getLogger(__name__)
@@ -45,7 +48,7 @@ def parse_ranks(ranks_file):
     """
     node2rank = {}
     
-    with open(ranks_file, 'r') as f:
+    with compressed_io.open_file(ranks_file, 'r') as f:
         header = f.readline()
         if not header.startswith("NODE\t"):
             raise Exception("Ranks file problem, wrong format")
@@ -59,118 +62,131 @@ def parse_ranks(ranks_file):
             try:
                 rank = int(rank)
             except ValueError:
-                raise Exception(f"Invalid rank value in ranks file: {rank} is not an integer")
+                # with the "average" tie policy, tied nodes can get a half-integer rank
+                try:
+                    rank = float(rank)
+                except ValueError:
+                    raise Exception(f"Invalid rank value in ranks file: {rank} is not a number")
             node2rank[node] = rank
 
     return(node2rank)
 
 
-def netcore_scores_to_ranks(left_out, netcore_LOO_dir, n_nodes):
+def sample_sorted_random_ranks(n_left_out, network_size, iterations, seed_seq):
     """
-    Iterates over the list of left-out nodes,
-    for each left-out node opens a leave-one-out file (with nodes sorted by descending score,
-    so the first node has rank=1, the second node has rank=2, etc),
-    finds the rank of the left-out node;
-    for left-out nodes for which scores are missing (not in the main network component), we assign scores=0.
+    Draws iterations rounds of n_left_out distinct random ranks in [1, network_size],
+    each round sorted by increasing rank.
+    The rounds are drawn in batches: each row of a batch gets one random key per node,
+    and the n_left_out nodes with the smallest keys form a uniform sample without replacement.
 
     arguments:
-    - left_out: list of left-out nodes
-    - netcore_LOO_dir: directory with NetCore scores files for left-out nodes,
-        eg. for each left-out node scores for all nodes in the interactome are in:
-        netcore-output/{PHENOTYPE}/output_{LEFT-OUT-NODE}/random_walk_weights.txt
-    - n_nodes: total number of nodes in the network
-    
+    - n_left_out: number of left-out genes
+    - network_size: total number of nodes in the network
+    - iterations: number of rounds to draw
+    - seed_seq: numpy.random.SeedSequence for this call, so parallel calls get independent streams
+
     returns:
-    - node2rank: dict with key=left-out node, value=rank
+    - samples: 2D numpy array (uint32) of shape (iterations, n_left_out)
     """
-    node2rank = {}
+    rng = numpy.random.default_rng(seed_seq)
+    samples = numpy.empty((iterations, n_left_out), dtype=numpy.uint32)
 
-    for left_out_node in left_out:
-        netcore_LOO_file = os.path.join(netcore_LOO_dir, f"output_{left_out_node}", "random_walk_weights.txt")
-        if not os.path.isfile(netcore_LOO_file):
-            raise Exception(f"NetCore scores file not found for left-out node {left_out_node}: {netcore_LOO_file}")
-
-        with open(netcore_LOO_file, 'r') as f:
-            header = f.readline()
-            if not header.startswith("node_index\t"):
-                raise Exception(f"NetCore scores file problem for left-out node {left_out_node}, wrong format: {netcore_LOO_file}")
-
-            rank = 1
-            found = False
-            for line in f:
-                split_line = line.rstrip().split("\t")
-                if len(split_line) != 4:
-                    raise Exception(f"Invalid line in NetCore scores file for left-out node {left_out_node}: {line}")
-
-                (idx, node, score, pvalue) = split_line
-                if node == left_out_node:
-                    node2rank[left_out_node] = rank
-                    found = True
-                    break
-                rank += 1
-
-            if not found:
-                # If the left-out node is not found in the NetCore scores file, assign score=0 (rank==n_nodes)
-                node2rank[left_out_node] = n_nodes
+    # keep each batch of random keys around 32 MB
+    batch_size = max(1, (1 << 22) // network_size)
+    for start in range(0, iterations, batch_size):
+        end = min(start + batch_size, iterations)
+        keys = rng.random((end - start, network_size))
+        picked = numpy.argpartition(keys, n_left_out - 1, axis=1)[:, :n_left_out] + 1  # + 1 because ranks start at 1 not 0
+        samples[start:end] = numpy.sort(picked, axis=1)
 
-    return(node2rank)
+    return(samples)
 
 
-def generate_random_ranks(n_left_out, network_size):
+def generate_random_ranks(n_left_out, network_size, mode="analytical", iterations=10000, seed=None, workers=1):
     """
     Generate ranks with a random classifier
 
+    A random classifier ranks the n_left_out genes at a uniform sample without replacement
+    of n_left_out ranks among 1..network_size.
+    In "analytical" mode the j-th smallest of these ranks is given by its exact expectation
+    j * (network_size + 1) / (n_left_out + 1).
+    In "montecarlo" mode the sorted ranks are averaged over iterations random rounds,
+    drawn in chunks of fixed size with independent streams derived from seed and spread over
+    workers processes (the result does not depend on workers),
+    and the 2.5th and 97.5th percentiles of each sorted rank give a 95% band around the curve.
+
     arguments:
     - n_left_out: number of left-out genes
     - network_size: total number of nodes in the network
+    - mode: "analytical" or "montecarlo"
+    - iterations: number of random rounds (montecarlo only)
+    - seed: seed for the random generator, None for a fresh one (montecarlo only)
+    - workers: number of processes to draw the rounds (montecarlo only)
 
     returns:
-    - random_ranks: list of average ranks for the left-out genes across n iterations
+    - random_ranks: 1D numpy array (float) of average ranks for the left-out genes
+    - random_band: None in analytical mode, otherwise a tuple of 1D numpy arrays (float)
+        (ranks_low, ranks_high) with the 2.5th and 97.5th percentiles of each sorted rank
     """
-
-    # use the integers method of a Generator instance instead of numpy.random.randint
-    # https://numpy.org/doc/2.1/reference/random/generated/numpy.random.randint.html
-    rng = numpy.random.default_rng()
-
-    # 1D numpy array for left-out gene ranks
-    # size=len(left-out genes)
-    random_ranks = numpy.zeros(n_left_out, dtype=numpy.uint64)
-
-    n = 10000  # 10,000 iterations for convergence
-    for i in range(n):
-        # 1D numpy array for left-out gene ranks
-        # size=len(left-out genes)
-        tmp = rng.integers(low=1, high=network_size, endpoint = True, size=random_ranks.shape, dtype=numpy.uint64)
-        tmp = numpy.sort(tmp)
-        random_ranks += tmp
-
-    for j in range(len(random_ranks)):
-        avg_rank = random_ranks[j] / n
-        random_ranks[j] = avg_rank
-    
-    return(random_ranks)
+    if mode == "analytical":
+        random_ranks = numpy.arange(1, n_left_out + 1) * ((network_size + 1) / (n_left_out + 1))
+        return(random_ranks, None)
+    elif mode != "montecarlo":
+        raise Exception(f"Unknown random classifier mode: {mode}")
+
+    # one independent stream per chunk of iterations: the chunks have a fixed size, so that
+    # the rounds (and the curve) only depend on seed, not on workers
+    chunk_size = 1000
+    chunks = [min(chunk_size, iterations - start) for start in range(0, iterations, chunk_size)]
+    seed_seqs = numpy.random.SeedSequence(seed).spawn(len(chunks))
+
+    if workers == 1 or len(chunks) == 1:
+        samples = numpy.concatenate([sample_sorted_random_ranks(n_left_out, network_size, chunk, chunk_seed_seq)
+                                     for (chunk, chunk_seed_seq) in zip(chunks, seed_seqs)])
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=min(workers, len(chunks))) as executor:
+            samples = numpy.concatenate(list(executor.map(sample_sorted_random_ranks,
+                                                          [n_left_out] * len(chunks),
+                                                          [network_size] * len(chunks),
+                                                          chunks,
+                                                          seed_seqs)))
+
+    random_ranks = samples.mean(axis=0)
+    (ranks_low, ranks_high) = numpy.percentile(samples, [2.5, 97.5], axis=0)
+
+    return(random_ranks, (ranks_low, ranks_high))
 
 
 def ranks_to_curve(ranks, network_size):
     """
     Computes a curve and AUC of rank vs cumulative distributions of left-out nodes
 
+    curve[x-1] is the number of left-out nodes with rank <= x, for x in 1..network_size;
+    integer ranks are counted with bincount + cumsum in O(network_size + n_ranks),
+    non-integer ranks (eg average ranks of the random classifier) with searchsorted.
+
     arguments:
-    - ranks: list of ranks for the left-out nodes
+    - ranks: list (or any iterable, eg dict values) of ranks for the left-out nodes
     - network_size: total number of nodes in the network
 
     returns:
-    - curve: list of cumulative distributions of left-out nodes
+    - curve: 1D numpy array (int32) of cumulative distributions of left-out nodes
     - AUC: normalized area under the curve
     """
-    curve = []
-    
-    for i in range(1, network_size + 1):
-        curve.append(sum(rank <= i for rank in ranks))
+    ranks = numpy.fromiter(ranks, dtype=float)
 
-    AUC = 0.0
-    for i in range(1, len(curve)):
-        AUC += (curve[i] + curve[i-1]) / 2
+    if numpy.all(ranks == numpy.floor(ranks)):
+        # ranks outside of [1, network_size] never/always satisfy rank <= x, clip them
+        # into bins 0 and network_size + 1, the latter is dropped from the curve
+        bins = numpy.clip(ranks, 0, network_size + 1).astype(numpy.int64)
+        counts = numpy.bincount(bins, minlength=network_size + 2)
+        curve = numpy.cumsum(counts[:network_size + 1])[1:]
+    else:
+        curve = numpy.searchsorted(numpy.sort(ranks), numpy.arange(1, network_size + 1), side='right')
+    curve = curve.astype(numpy.int32)
+
+    # trapezoidal rule with unit steps: sum of all points minus half of both end points
+    AUC = float(curve.sum(dtype=numpy.int64)) - (int(curve[0]) + int(curve[-1])) / 2
 
     max_possible = (len(curve) - 1) * len(ranks)  # maximum area: all left-out ranked at the top (rank=1)
     AUC_norm = AUC / max_possible
@@ -178,88 +194,312 @@ def ranks_to_curve(ranks, network_size):
     return(curve, AUC_norm)
 
 
+def AUC_contributions(ranks, network_size):
+    """
+    Computes the contribution of each left-out node to the AUC of ranks_to_curve(), in closed form:
+    a node with rank r is counted in curve[x-1] for every x in 1..network_size with x >= r,
+    ie in clip(network_size - ceil(r) + 1, 0, network_size) points of the curve,
+    minus half of the end points curve[0] and curve[-1] that count it (trapezoidal rule).
+    The AUC of ranks_to_curve() is the sum of the contributions / ((network_size - 1) * len(ranks)).
+
+    returns:
+    - contributions: 1D numpy array (float), one value per rank
+    """
+    ranks = numpy.fromiter(ranks, dtype=float)
+    n_points = numpy.clip(network_size - numpy.ceil(ranks) + 1, 0, network_size)
+    return(n_points - ((ranks <= 1).astype(float) + (ranks <= network_size)) / 2)
+
+
+def bootstrap_AUC(ranks, network_size, iterations=10000, seed=None):
+    """
+    Bootstrap 95% confidence interval of the normalized AUC: the left-out ranks are resampled
+    with replacement iterations times, and the AUC of each replicate is the sum of the
+    AUC contributions of its ranks (see AUC_contributions()), for blocks of replicates at once
+    as a (replicates x left-out nodes) array.
+
+    arguments:
+    - ranks: list (or any iterable, eg dict values) of ranks for the left-out nodes
+    - network_size: total number of nodes in the network
+    - iterations: number of bootstrap replicates
+    - seed: seed for the random generator, None for a fresh one
+
+    returns:
+    - (AUC_low, AUC_high): 2.5th and 97.5th percentiles of the replicates' normalized AUCs
+    """
+    contributions = AUC_contributions(ranks, network_size)
+    n_ranks = len(contributions)
+    rng = numpy.random.default_rng(seed)
+    AUCs = numpy.empty(iterations)
+
+    # keep each block of resampled indexes around 32 MB
+    batch_size = max(1, (1 << 22) // n_ranks)
+    for start in range(0, iterations, batch_size):
+        end = min(start + batch_size, iterations)
+        resampled = rng.integers(0, n_ranks, size=(end - start, n_ranks))
+        AUCs[start:end] = contributions[resampled].sum(axis=1)
+    AUCs /= (network_size - 1) * n_ranks
+
+    (AUC_low, AUC_high) = numpy.percentile(AUCs, [2.5, 97.5])
+    return(AUC_low, AUC_high)
+
+
+def AUC_label(method, AUC, AUC_CI=None):
+    """
+    Returns the legend label of a method, eg. "BFWalk (AUC=0.812)" or with the bootstrap CI
+    "BFWalk (AUC=0.812, 95% CI 0.790-0.833)"
+    """
+    if AUC_CI is None:
+        return("{} (AUC={:.3f})".format(method, AUC))
+    return("{} (AUC={:.3f}, 95% CI {:.3f}-{:.3f})".format(method, AUC, AUC_CI[0], AUC_CI[1]))
+
+
 def plot_CDF(BFWalk_curve, BFWalk_AUC, random_curve, network_size, out="CDF.png",
-             multixrank_curve=None, multixrank_AUC=None, netcore_curve=None, netcore_AUC=None):
+             multixrank_curve=None, multixrank_AUC=None, netcore_curve=None, netcore_AUC=None,
+             random_band=None, BFWalk_AUC_CI=None, multixrank_AUC_CI=None, netcore_AUC_CI=None):
+    # a new figure for each plot, so that several plots can be made in one process
+    fig = matplotlib.pyplot.figure()
     x = range(network_size)
-    matplotlib.pyplot.plot(x, BFWalk_curve, label="BFWalk (AUC={:.3f})".format(BFWalk_AUC), color="#D81B60")
-    if multixrank_curve:
-        matplotlib.pyplot.plot(x, multixrank_curve, label="MultiXrank (AUC={:.3f})".format(multixrank_AUC), color="#FFC107")
-    if netcore_curve:
-        matplotlib.pyplot.plot(x, netcore_curve, label="NetCore (AUC={:.3f})".format(netcore_AUC), color="#1E88E5")
+    matplotlib.pyplot.plot(x, BFWalk_curve, label=AUC_label("BFWalk", BFWalk_AUC, BFWalk_AUC_CI), color="#D81B60")
+    if multixrank_curve is not None:
+        matplotlib.pyplot.plot(x, multixrank_curve, label=AUC_label("MultiXrank", multixrank_AUC, multixrank_AUC_CI), color="#FFC107")
+    if netcore_curve is not None:
+        matplotlib.pyplot.plot(x, netcore_curve, label=AUC_label("NetCore", netcore_AUC, netcore_AUC_CI), color="#1E88E5")
     matplotlib.pyplot.plot(x, random_curve, label="random classifier", color="#004D40")
+    if random_band is not None:
+        # random_band: (lower curve, upper curve) of the random classifier
+        matplotlib.pyplot.fill_between(x, random_band[0], random_band[1], color="#004D40", alpha=0.2, linewidth=0)
 
     matplotlib.pyplot.xlabel("rank x", fontsize=12)
     matplotlib.pyplot.ylabel("Number of left-out genes where rank <= x", fontsize=12)
     matplotlib.pyplot.xticks(fontsize=11)
     matplotlib.pyplot.yticks(fontsize=11)
-    matplotlib.pyplot.legend(loc='lower right', fontsize=12)
+    # labels with confidence intervals are longer
+    with_CI = any(CI is not None for CI in (BFWalk_AUC_CI, multixrank_AUC_CI, netcore_AUC_CI))
+    matplotlib.pyplot.legend(loc='lower right', fontsize=9 if with_CI else 12)
 
     matplotlib.pyplot.savefig(out, dpi=500)
+    matplotlib.pyplot.close(fig)
 
     logger.info(f"CDF curve saved to {out}")
 
 
+# methods in the order of the plots, and the prefix of their plot_CDF() arguments
+METHODS = ("BFWalk", "MultiXrank", "NetCore")
+METHOD2PREFIX = {"BFWalk": "BFWalk", "MultiXrank": "multixrank", "NetCore": "netcore"}
+
+
+def calculate_CDFs(method2node2rank, network_size, random_mode="analytical", random_iterations=10000, random_seed=None,
+                   workers=1, bootstrap=None, bootstrap_seed=None, log_prefix=""):
+    """
+    Calculates the CDF curve and AUC of each method and of the random classifier,
+    with the bootstrap CI of each method's AUC if bootstrap is not None
+
+    arguments:
+    - method2node2rank: dict, key=method (one of METHODS), value=dict with key=left-out node, value=rank
+    - network_size: total number of nodes in the network
+    - random_mode, random_iterations, random_seed, workers: see generate_random_ranks()
+    - bootstrap: number of bootstrap replicates, None for no CI
+    - bootstrap_seed: seed of the bootstrap replicates, None for a fresh one
+    - log_prefix: prepended to the log messages (eg the phenotype)
+
+    returns:
+    - method2AUC: dict, key=method or "random classifier", value=(AUC, AUC_CI or None)
+    - plot_kwargs: dict of keyword arguments for plot_CDF() (all but out)
+    """
+    if bootstrap is not None:
+        # one independent stream per method
+        bootstrap_seeds = numpy.random.SeedSequence(bootstrap_seed).spawn(len(METHODS))
+
+    method2AUC = {}
+    plot_kwargs = {'network_size': network_size}
+    for method in METHODS:
+        if method not in method2node2rank:
+            continue
+        node2rank = method2node2rank[method]
+        (curve, AUC) = ranks_to_curve(node2rank.values(), network_size)
+        AUC_CI = None
+        if bootstrap is None:
+            logger.info(f"{log_prefix}AUC: {AUC:.3f} ({method})")
+        else:
+            AUC_CI = bootstrap_AUC(node2rank.values(), network_size, bootstrap, bootstrap_seeds[METHODS.index(method)])
+            logger.info(f"{log_prefix}AUC: {AUC:.3f}, 95% CI {AUC_CI[0]:.3f}-{AUC_CI[1]:.3f} ({bootstrap} bootstrap replicates) ({method})")
+        method2AUC[method] = (AUC, AUC_CI)
+        prefix = METHOD2PREFIX[method]
+        plot_kwargs.update({f"{prefix}_curve": curve, f"{prefix}_AUC": AUC, f"{prefix}_AUC_CI": AUC_CI})
+
+    n_left_out = len(method2node2rank["BFWalk"])
+    logger.info(f"{log_prefix}Generating random classifier ranks ({random_mode})")
+    (random_ranks, random_band) = generate_random_ranks(n_left_out, network_size, mode=random_mode,
+                                                        iterations=random_iterations, seed=random_seed, workers=workers)
+    (random_curve, random_AUC) = ranks_to_curve(random_ranks, network_size)
+    logger.info(f"{log_prefix}AUC: {random_AUC:.3f} (random classifier)")
+    method2AUC["random classifier"] = (random_AUC, None)
+    plot_kwargs['random_curve'] = random_curve
+    if random_band is not None:
+        # high ranks give the lower curve, low ranks the upper curve
+        (ranks_low, ranks_high) = random_band
+        plot_kwargs['random_band'] = (ranks_to_curve(ranks_high, network_size)[0],
+                                      ranks_to_curve(ranks_low, network_size)[0])
+
+    return(method2AUC, plot_kwargs)
+
+
 def main(network_file, BFWalk_ranks_file, multixrank_ranks_file=None, netcore_LOO_dir=None,
-         cdf_path=None, weighted=False, directed=False):
+         cdf_path=None, weighted=False, directed=False, ties="min",
+         random_mode="analytical", random_iterations=10000, random_seed=None, workers=1,
+         bootstrap=None, bootstrap_seed=None, BFWalk_store=None, multixrank_store=None, netcore_store=None):
     
     logger.info(f"Parsing network {network_file}")
-    (edge_list, node2idx, idx2node) = data_parser.parse_network(network_file, weighted, directed)
+    (indptr, indices, weights, node2idx, idx2node) = network_cache.load_network(network_file, weighted, directed)
 
-    # construct a networkx Graph from the edge list
-    edge_list_no_weights = []
-    for edge in edge_list:
-        edge_list_no_weights.append((idx2node[edge[0]], idx2node[edge[1]]))
-    interactome = networkx.from_edgelist(edge_list_no_weights)
+    degrees = network_cache.degrees(indptr, indices)
 
     # calculate the mean and median degree of nodes in the network
-    network_degrees = []
-    for node in interactome.nodes():
-        network_degrees.append(interactome.degree(node))
-    logger.info(f"node degree mean: {round(statistics.mean(network_degrees))}, median: {round(statistics.median(network_degrees))}")
-
-    logger.info("Parsing BFWalk ranks")
-    BFWalk_node2rank = parse_ranks(BFWalk_ranks_file)
-    if multixrank_ranks_file:
+    logger.info(f"node degree mean: {round(numpy.mean(degrees))}, median: {round(numpy.median(degrees))}")
+
+    if BFWalk_store:
+        logger.info("Calculating BFWalk ranks from the LOO store")
+        method2node2rank = {"BFWalk": loo_store.store_ranks(BFWalk_store, len(node2idx), ties)}
+    else:
+        logger.info("Parsing BFWalk ranks")
+        method2node2rank = {"BFWalk": parse_ranks(BFWalk_ranks_file)}
+    BFWalk_node2rank = method2node2rank["BFWalk"]
+    if multixrank_store:
+        logger.info("Calculating MultiXrank ranks from the LOO store")
+        method2node2rank["MultiXrank"] = loo_store.store_ranks(multixrank_store, len(node2idx), ties)
+    elif multixrank_ranks_file:
         logger.info("Parsing MultiXrank ranks")
-        multixrank_node2rank = parse_ranks(multixrank_ranks_file)
-        assert len(BFWalk_node2rank) == len(multixrank_node2rank), "BFWalk and MultiXrank ranks files have different number of left-out nodes"
-    if netcore_LOO_dir:
+        method2node2rank["MultiXrank"] = parse_ranks(multixrank_ranks_file)
+    if "MultiXrank" in method2node2rank:
+        assert len(BFWalk_node2rank) == len(method2node2rank["MultiXrank"]), "BFWalk and MultiXrank ranks files have different number of left-out nodes"
+    if netcore_store:
+        logger.info("Calculating NetCore ranks from the LOO store")
+        method2node2rank["NetCore"] = loo_store.store_ranks(netcore_store, len(node2idx), ties)
+    elif netcore_LOO_dir:
         logger.info("Parsing NetCore scores")
-        netcore_node2rank = netcore_scores_to_ranks(BFWalk_node2rank.keys(), netcore_LOO_dir, len(node2idx))
-        assert len(BFWalk_node2rank) == len(netcore_node2rank), "BFWalk and NetCore ranks files have different number of left-out nodes"
+        method2node2rank["NetCore"] = netcore_index.netcore_scores_to_ranks(BFWalk_node2rank.keys(), netcore_LOO_dir, len(node2idx), ties)
+    if "NetCore" in method2node2rank:
+        assert len(BFWalk_node2rank) == len(method2node2rank["NetCore"]), "BFWalk and NetCore ranks files have different number of left-out nodes"
     logger.info(f"Found {len(BFWalk_node2rank)} left-out nodes")
 
     # calculate the mean and median degree of the left-out genes (seeds)
-    seeds_degrees = []
-    for protein in BFWalk_node2rank:
-        seeds_degrees.append(interactome.degree(protein))
-    logger.info(f"left-out degree mean: {round(statistics.mean(seeds_degrees))}, median: {round(statistics.median(seeds_degrees))}")
+    seeds_degrees = degrees[[node2idx[protein] for protein in BFWalk_node2rank]]
+    logger.info(f"left-out degree mean: {round(numpy.mean(seeds_degrees))}, median: {round(numpy.median(seeds_degrees))}")
 
     logger.info("Calculating CDF curves and AUCs")
-    (BFWalk_curve, BFWalk_AUC) = ranks_to_curve(BFWalk_node2rank.values(), len(node2idx))
-    logger.info(f"AUC: {BFWalk_AUC:.3f} (BFWalk)")
+    (method2AUC, plot_kwargs) = calculate_CDFs(method2node2rank, len(node2idx), random_mode, random_iterations, random_seed,
+                                               workers, bootstrap, bootstrap_seed)
 
-    optional_kwargs = {}  # dict for plotting
-    if multixrank_ranks_file is not None:
-        (multixrank_curve, multixrank_AUC) = ranks_to_curve(multixrank_node2rank.values(), len(node2idx))
-        logger.info(f"AUC: {multixrank_AUC:.3f} (MultiXrank)")
-        optional_kwargs.update({'multixrank_curve': multixrank_curve, 'multixrank_AUC': multixrank_AUC})
+    cdf_path.parent.mkdir(parents=True, exist_ok=True)  # Path.parent of a bare filename returns Path("."), and mkdir on "."
+    plot_CDF(out=cdf_path, **plot_kwargs)
 
-    if netcore_LOO_dir is not None:
-        (netcore_curve, netcore_AUC) = ranks_to_curve(netcore_node2rank.values(), len(node2idx))
-        logger.info(f"AUC: {netcore_AUC:.3f} (NetCore)")
-        optional_kwargs.update({'netcore_curve': netcore_curve, 'netcore_AUC': netcore_AUC})
 
-    random_ranks = generate_random_ranks(len(BFWalk_node2rank), len(node2idx))
-    (random_curve, random_AUC) = ranks_to_curve(random_ranks, len(node2idx))
+def phenotype_CDF(phenotype, BFWalk_out_dir, multixrank_out_dir, netcore_out_dir, network_size, ties,
+                  random_mode, random_iterations, random_seed, bootstrap, bootstrap_seed, cdf_path=None, store=False):
+    """
+    Calculates the CDF curves and AUCs of one phenotype, for batch_main(); the ranks files are
+    {method output directory}/{phenotype}/ranks_LOO.tsv, and the NetCore scores files are in
+    {NetCore output directory}/{phenotype}/, or with store the ranks of every method are
+    calculated from the LOO store {method output directory}/{phenotype}/LOO_store/
 
-    cdf_path.parent.mkdir(parents=True, exist_ok=True)  # Path.parent of a bare filename returns Path("."), and mkdir on "."
-    plot_CDF(BFWalk_curve=BFWalk_curve,
-             BFWalk_AUC=BFWalk_AUC,
-             random_curve=random_curve,
-             network_size=len(interactome.nodes()),
-             out=cdf_path,
-             **optional_kwargs)
+    arguments: see batch_main(), and
+    - random_seed, bootstrap_seed: seeds for this phenotype
+    - cdf_path: path of the phenotype's figure, None for no figure
+    - store: whether to calculate the ranks from the LOO stores rather than the ranks and scores files
+
+    returns:
+    - left_out: list of left-out nodes
+    - method2AUC: see calculate_CDFs()
+    """
+    method2node2rank = {}
+    for (method, out_dir) in zip(METHODS, (BFWalk_out_dir, multixrank_out_dir, netcore_out_dir)):
+        if not out_dir:
+            continue
+        if store:
+            method2node2rank[method] = loo_store.store_ranks(os.path.join(out_dir, phenotype, loo_store.STORE_DIR), network_size, ties)
+        elif method == "NetCore":
+            method2node2rank[method] = netcore_index.netcore_scores_to_ranks(method2node2rank["BFWalk"].keys(),
+                                                                             os.path.join(out_dir, phenotype), network_size, ties)
+        else:
+            method2node2rank[method] = parse_ranks(compressed_io.find_file(os.path.join(out_dir, phenotype, "ranks_LOO.tsv")))
+    left_out = list(method2node2rank["BFWalk"])
+    for method in method2node2rank:
+        if len(left_out) != len(method2node2rank[method]):
+            raise Exception(f"BFWalk and {method} ranks have different number of left-out nodes for phenotype {phenotype}")
+
+    (method2AUC, plot_kwargs) = calculate_CDFs(method2node2rank, network_size, random_mode, random_iterations, random_seed,
+                                               1, bootstrap, bootstrap_seed, log_prefix=f"{phenotype}: ")
+    if cdf_path is not None:
+        plot_CDF(out=cdf_path, **plot_kwargs)
+
+    return(left_out, method2AUC)
+
+
+def batch_main(network_file, phenotypes, BFWalk_out_dir, multixrank_out_dir=None, netcore_out_dir=None,
+               summary_path=None, cdf_path=None, weighted=False, directed=False, ties="min",
+               random_mode="analytical", random_iterations=10000, random_seed=None, workers=1,
+               bootstrap=None, bootstrap_seed=None, store=False):
+    """
+    Batch mode: CDF curves and AUCs of every phenotype, with the network loaded once and
+    the phenotypes spread over workers processes. Saves a summary TSV (one row per phenotype)
+    and, if cdf_path is not None, one figure per phenotype named after cdf_path,
+    eg CDF_{PHENOTYPE}.png for CDF.png.
+
+    arguments:
+    - phenotypes: list of phenotypes, each method output directory has one subdirectory per phenotype
+        (the layout of validation_rankVsDeg.py)
+    - BFWalk_out_dir, multixrank_out_dir, netcore_out_dir: output directories of the methods
+        (multixrank_out_dir and netcore_out_dir can be None)
+    - summary_path: path of the summary TSV
+    - store: see phenotype_CDF()
+    - other arguments: see main()
+    """
+    logger.info(f"Parsing network {network_file}")
+    (indptr, indices, weights, node2idx, idx2node) = network_cache.load_network(network_file, weighted, directed)
+    degrees = network_cache.degrees(indptr, indices)
+    logger.info(f"node degree mean: {round(numpy.mean(degrees))}, median: {round(numpy.median(degrees))}")
+
+    # independent random streams for each phenotype
+    random_seeds = numpy.random.SeedSequence(random_seed).generate_state(len(phenotypes))
+    bootstrap_seeds = numpy.random.SeedSequence(bootstrap_seed).generate_state(len(phenotypes))
+
+    cdf_paths = [None] * len(phenotypes)
+    if cdf_path is not None:
+        cdf_path.parent.mkdir(parents=True, exist_ok=True)
+        cdf_paths = [cdf_path.with_name(f"{cdf_path.stem}_{phenotype}{cdf_path.suffix}") for phenotype in phenotypes]
+
+    args = [(phenotype, BFWalk_out_dir, multixrank_out_dir, netcore_out_dir, len(node2idx), ties,
+             random_mode, random_iterations, int(random_seeds[i]), bootstrap, int(bootstrap_seeds[i]), cdf_paths[i], store)
+            for (i, phenotype) in enumerate(phenotypes)]
+    logger.info(f"Calculating CDF curves and AUCs for {len(phenotypes)} phenotypes")
+    if workers > 1 and len(phenotypes) > 1:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=min(workers, len(phenotypes))) as executor:
+            results = list(executor.map(phenotype_CDF, *zip(*args)))
+    else:
+        results = [phenotype_CDF(*phenotype_args) for phenotype_args in args]
+
+    methods = [method for (method, out_dir) in zip(METHODS, (BFWalk_out_dir, multixrank_out_dir, netcore_out_dir)) if out_dir]
+    columns = ["PHENOTYPE", "N_LEFT_OUT", "LEFT_OUT_DEGREE_MEDIAN"]
+    for method in methods:
+        columns.append(f"{method}_AUC")
+        if bootstrap is not None:
+            columns += [f"{method}_AUC_CI_LOW", f"{method}_AUC_CI_HIGH"]
+    columns.append("RANDOM_AUC")
+
+    summary_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(summary_path, 'w') as f:
+        f.write("\t".join(columns) + "\n")
+        for (phenotype, (left_out, method2AUC)) in zip(phenotypes, results):
+            left_out_degrees = degrees[[node2idx[node] for node in left_out]]
+            row = [phenotype, str(len(left_out)), f"{numpy.median(left_out_degrees):g}"]
+            for method in methods:
+                (AUC, AUC_CI) = method2AUC[method]
+                row.append(f"{AUC:.4f}")
+                if bootstrap is not None:
+                    row += [f"{AUC_CI[0]:.4f}", f"{AUC_CI[1]:.4f}"]
+            row.append(f"{method2AUC['random classifier'][0]:.4f}")
+            f.write("\t".join(row) + "\n")
+    logger.info(f"Summary of {len(phenotypes)} phenotypes saved to {summary_path}")
 
 
 if __name__ == "__main__":
@@ -277,15 +517,19 @@ if __name__ == "__main__":
         Validation of BFWalk ranks by plotting the cumulative distribution function (CDF) of left-out genes ranks.
         The CDF curve shows the number of left-out genes with rank <= x for each rank x.
         The area under the curve (AUC) is also calculated and shown in the legend.
+        With --phenotypes, runs in batch mode: the ranks of each phenotype are searched in one subdirectory
+        per phenotype of each method output directory, and the AUCs of all phenotypes are saved in a summary TSV.
         """)
     parser.add_argument('--network',
                         help="Path to the network SIF file",
                         type=pathlib.Path,
                         required=True)
     parser.add_argument('--BFWalk_ranks',
-                        help="Path to the BFWalk ranks file (TSV with header, columns: NODE, RANK)",
+                        help="Path to the BFWalk ranks file (TSV with header, columns: NODE, RANK), " \
+                        "required without --phenotypes",
                         type=pathlib.Path,
-                        required=True)
+                        required=False,
+                        default=None)
     parser.add_argument('--multixrank_ranks',
                         help="Path to the MultiXrank ranks file (TSV with header, columns: NODE, RANK)",
                         type=pathlib.Path,
@@ -298,11 +542,70 @@ if __name__ == "__main__":
                         type=pathlib.Path,
                         required=False,
                         default=None)
+    parser.add_argument('--BFWalk_store',
+                        help="Path to the BFWalk LOO store (LOO_store/ in the output directory of the BFWalk " \
+                        "leave-one-out, see loo_store.py), to calculate the BFWalk ranks from instead of --BFWalk_ranks",
+                        type=pathlib.Path,
+                        required=False,
+                        default=None)
+    parser.add_argument('--multixrank_store',
+                        help="Path to the MultiXrank LOO store, to calculate the MultiXrank ranks from instead of --multixrank_ranks",
+                        type=pathlib.Path,
+                        required=False,
+                        default=None)
+    parser.add_argument('--netcore_store',
+                        help="Path to the NetCore LOO store, to calculate the NetCore ranks from instead of --netcore_LOO_dir",
+                        type=pathlib.Path,
+                        required=False,
+                        default=None)
     parser.add_argument('--cdf',
                         help="Path to the output figure for the CDF curve (default: CDF.png)",
                         type=pathlib.Path,
                         required=False,
                         default="CDF.png")
+    parser.add_argument('--phenotypes',
+                        nargs='+',
+                        help="Batch mode: list of phenotypes, with --BFWalk_out_dir and --multixrank_out_dir " \
+                        "and/or --netcore_out_dir instead of --BFWalk_ranks, --multixrank_ranks and --netcore_LOO_dir",
+                        required=False,
+                        default=None)
+    parser.add_argument('--BFWalk_out_dir',
+                        help="Batch mode: path to the BFWalk output directory containing one subdirectory per phenotype " \
+                        "(given by --phenotypes), each with a ranks_LOO.tsv file",
+                        type=pathlib.Path,
+                        required=False,
+                        default=None)
+    parser.add_argument('--multixrank_out_dir',
+                        help="Batch mode: path to the MultiXrank output directory, same layout as --BFWalk_out_dir",
+                        type=pathlib.Path,
+                        required=False,
+                        default=None)
+    parser.add_argument('--netcore_out_dir',
+                        help="Batch mode: path to the NetCore output directory, with one --netcore_LOO_dir per phenotype",
+                        type=pathlib.Path,
+                        required=False,
+                        default=None)
+    parser.add_argument('--summary',
+                        help="Batch mode: path to the summary TSV with the AUCs of each phenotype (default: CDF_summary.tsv)",
+                        type=pathlib.Path,
+                        required=False,
+                        default="CDF_summary.tsv")
+    parser.add_argument('--store',
+                        help="Batch mode: calculate the ranks of every method from its LOO store " \
+                        "(LOO_store/ in each phenotype subdirectory) rather than from the ranks and scores files (default: False)",
+                        action='store_true',
+                        required=False)
+    parser.add_argument('--figures',
+                        help="Batch mode: also save the CDF curves of each phenotype, named after --cdf " \
+                        "(eg CDF_{PHENOTYPE}.png) (default: False)",
+                        action='store_true',
+                        required=False)
+    parser.add_argument('--ties',
+                        help="How to rank a left-out node tied with other nodes in the NetCore scores and LOO stores: " \
+                        "min, average or max rank of the tied nodes (default: min)",
+                        choices=ranking.TIES,
+                        required=False,
+                        default="min")
     parser.add_argument('--weighted',
                         help="Whether the network is weighted (default: False)",
                         action='store_true',
@@ -311,17 +614,98 @@ if __name__ == "__main__":
                         help="Whether the network is directed (default: False)",
                         action='store_true',
                         required=False)
+    parser.add_argument('--random',
+                        help="How to compute the random classifier curve: 'analytical' (exact expected ranks) " \
+                        "or 'montecarlo' (average of random rounds, with a 95%% band) (default: analytical)",
+                        choices=['analytical', 'montecarlo'],
+                        required=False,
+                        default="analytical")
+    parser.add_argument('--random_iterations',
+                        help="Number of random rounds in montecarlo mode (default: 10000)",
+                        type=int,
+                        required=False,
+                        default=10000)
+    parser.add_argument('--random_seed',
+                        help="Seed for the random generator in montecarlo mode (default: None, not reproducible)",
+                        type=int,
+                        required=False,
+                        default=None)
+    parser.add_argument('--bootstrap',
+                        help="Number of bootstrap replicates of the left-out ranks, to report a 95%% confidence interval " \
+                        "of each AUC in the logs and in the legend (default: no bootstrap)",
+                        metavar="N",
+                        type=int,
+                        required=False,
+                        default=None)
+    parser.add_argument('--bootstrap_seed',
+                        help="Seed for the random generator of --bootstrap (default: None, not reproducible)",
+                        type=int,
+                        required=False,
+                        default=None)
+    parser.add_argument('--workers',
+                        help="Number of processes to use: for the phenotypes in batch mode, " \
+                        "for the random rounds of --random montecarlo otherwise (default: 1)",
+                        type=int,
+                        required=False,
+                        default=1)
 
     args = parser.parse_args()
 
     try:
-        main(args.network,
-             args.BFWalk_ranks,
-             multixrank_ranks_file=args.multixrank_ranks,
-             netcore_LOO_dir=args.netcore_LOO_dir,
-             cdf_path=args.cdf,
-             weighted=args.weighted,
-             directed=args.directed)
+        single_args = [name for name in ("BFWalk_ranks", "multixrank_ranks", "netcore_LOO_dir",
+                                         "BFWalk_store", "multixrank_store", "netcore_store")
+                       if getattr(args, name) is not None]
+        batch_args = [name for name in ("BFWalk_out_dir", "multixrank_out_dir", "netcore_out_dir")
+                      if getattr(args, name) is not None] + (["store"] if args.store else [])
+        if args.phenotypes:
+            if single_args:
+                raise Exception(f"Batch mode (--phenotypes) reads the ranks from the output directories, " \
+                                f"remove --{', --'.join(single_args)}")
+            if args.BFWalk_out_dir is None:
+                raise Exception("Batch mode (--phenotypes) needs --BFWalk_out_dir")
+            batch_main(args.network,
+                       args.phenotypes,
+                       args.BFWalk_out_dir,
+                       multixrank_out_dir=args.multixrank_out_dir,
+                       netcore_out_dir=args.netcore_out_dir,
+                       summary_path=args.summary,
+                       cdf_path=args.cdf if args.figures else None,
+                       weighted=args.weighted,
+                       directed=args.directed,
+                       ties=args.ties,
+                       random_mode=args.random,
+                       random_iterations=args.random_iterations,
+                       random_seed=args.random_seed,
+                       workers=args.workers,
+                       bootstrap=args.bootstrap,
+                       bootstrap_seed=args.bootstrap_seed,
+                       store=args.store)
+        else:
+            if batch_args:
+                raise Exception(f"--{', --'.join(batch_args)} can only be used in batch mode, with --phenotypes")
+            for (ranks_arg, store_arg) in (("BFWalk_ranks", "BFWalk_store"), ("multixrank_ranks", "multixrank_store"),
+                                           ("netcore_LOO_dir", "netcore_store")):
+                if getattr(args, ranks_arg) is not None and getattr(args, store_arg) is not None:
+                    raise Exception(f"Provide --{ranks_arg} or --{store_arg}, not both")
+            if args.BFWalk_ranks is None and args.BFWalk_store is None:
+                raise Exception("Provide --BFWalk_ranks or --BFWalk_store, or --phenotypes for batch mode")
+            main(args.network,
+                 args.BFWalk_ranks,
+                 multixrank_ranks_file=args.multixrank_ranks,
+                 netcore_LOO_dir=args.netcore_LOO_dir,
+                 cdf_path=args.cdf,
+                 weighted=args.weighted,
+                 directed=args.directed,
+                 ties=args.ties,
+                 random_mode=args.random,
+                 random_iterations=args.random_iterations,
+                 random_seed=args.random_seed,
+                 workers=args.workers,
+                 bootstrap=args.bootstrap,
+                 bootstrap_seed=args.bootstrap_seed,
+                 BFWalk_store=args.BFWalk_store,
+                 multixrank_store=args.multixrank_store,
+                 netcore_store=args.netcore_store)
 
     except Exception as e:
         # details on the issue should be in the exception name, print to stderr and die
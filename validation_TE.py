@@ -21,13 +21,16 @@ import sys
 import argparse
 import pathlib
 import logging
+import concurrent.futures
 
-import networkx
+import numpy
 import scipy
 import matplotlib.pyplot
 
 sys.path.append("/home/kubicaj/Software/BFWalk")
-import data_parser
+import network_cache
+import annotation_cache
+import compressed_io
 
 # set up logger, using inherited config, in case we get called as a module
 logger = logging.getLogger(__name__)
@@ -49,7 +52,7 @@ def parse_uniprot(uniprot_file):
     """
     uniprot2_gene = {}
 
-    with open(uniprot_file, 'r') as f:
+    with compressed_io.open_file(uniprot_file, 'r') as f:
         # skip header
         header = f.readline()
         if not header.startswith("PrimaryAC\t"):
@@ -92,7 +95,7 @@ def parse_expression_data(expression_data):
     gene2enrichment = {}
 
     try:
-        f = open(expression_data, 'r')
+        f = compressed_io.open_file(expression_data, 'r')
     except Exception as e:
         raise Exception("cannot open provided expression file")
 
@@ -117,6 +120,59 @@ def parse_expression_data(expression_data):
     return(gene2enrichment)
 
 
+def parse_expression_matrix(tpm_file):
+    """
+    Parses the TPM matrix of the Ensembl Expression Atlas (E-MTAB-5214, tpms.tsv as downloaded),
+    in a single pass: comment lines start with "#", the header is "Gene ID", "Gene Name",
+    then one column per tissue; empty values (not expressed) are read as 0.
+    The tissue enrichment of a gene in a tissue is its expression in that tissue
+    divided by its average expression in all tissues (NaN if it is not expressed at all).
+
+    arguments:
+    - tpm_file: path to the TPM matrix
+
+    returns:
+    - tissues: list of tissue names
+    - gene2row: dict, key=gene name, value=row index in enrichment
+    - enrichment: 2D numpy float32 array (genes x tissues) of tissue enrichment
+    """
+    tissues = None
+    gene2row = {}
+    rows = []
+
+    with compressed_io.open_file(tpm_file, 'r') as f:
+        line = f.readline()
+        if not line.startswith("# Expression Atlas\t"):
+            raise Exception(f"Expression matrix problem, not an Expression Atlas file: {tpm_file}")
+
+        for line in f:
+            # skip comments
+            if line.startswith("#"):
+                continue
+
+            split_line = line.rstrip("\n").split("\t")
+            if tissues is None:
+                if not line.startswith("Gene ID\t"):
+                    raise Exception(f"Expression matrix problem, expecting a Gene ID header but got {line}")
+                tissues = split_line[2:]
+                continue
+
+            if len(split_line) != len(tissues) + 2:
+                raise Exception(f"Invalid line in expression matrix, expecting {len(tissues) + 2} fields: {line}")
+            gene2row[split_line[1]] = len(rows)
+            rows.append([float(tpm) if tpm != "" else 0.0 for tpm in split_line[2:]])
+
+    if tissues is None:
+        raise Exception(f"Expression matrix problem, no header in {tpm_file}")
+
+    tpm = numpy.array(rows, dtype=numpy.float32).reshape(len(rows), len(tissues))
+    mean_tpm = tpm.mean(axis=1, keepdims=True)
+    enrichment = numpy.divide(tpm, mean_tpm, out=numpy.full(tpm.shape, numpy.nan, dtype=numpy.float32),
+                              where=mean_tpm > 0)
+
+    return(tissues, gene2row, enrichment)
+
+
 def parse_BFWalk_scores(scores_file):
     """
     Parses a TSV ranks file (with header) with two columns: NODE, SCORE
@@ -125,7 +181,7 @@ def parse_BFWalk_scores(scores_file):
     - node2score: dict with key=node, value=score
     """
     node2score = {}
-    with open(scores_file, 'r') as f:
+    with compressed_io.open_file(scores_file, 'r') as f:
         header = f.readline()
         if not header.startswith("NODE\t"):
             raise Exception("Scores file problem, wrong format")
@@ -153,7 +209,7 @@ def parse_multixrank_scores(scores_file):
     - node2score: dict with key=node, value=score
     """
     node2score = {}
-    with open(scores_file, 'r') as f:
+    with compressed_io.open_file(scores_file, 'r') as f:
         header = f.readline()
         if not header.startswith("multiplex\t"):
             raise Exception("Scores file problem, wrong format")
@@ -181,7 +237,7 @@ def parse_netcore_scores(scores_file):
     - node2score: dict with key=node, value=score
     """
     node2score = {}
-    with open(scores_file, 'r') as f:
+    with compressed_io.open_file(scores_file, 'r') as f:
         header = f.readline()
         if not header.startswith("node_index\t"):
             raise Exception("Scores file problem, wrong format")
@@ -201,61 +257,124 @@ def parse_netcore_scores(scores_file):
     return(node2score)
 
 
-def top_percent(list, x):
+def scores_to_array(node2score, node2idx, missing_score=None):
     """
-    Finds the top x% of values in a list
-    
-    returns: 
-    - top: list with top x% of values
-    - rest: list with the rest of values
+    Builds a node-indexed array of scores
+
+    arguments:
+    - node2score: dict with key=node, value=score
+    - node2idx: dict with key=node, value=node index
+    - missing_score: score of the nodes of the network missing from node2score,
+        if None all nodes must have a score
+
+    returns:
+    - scores: numpy array of scores, indexed by node index
     """
-    num_elements = round(len(list) * x/100)
+    scores = numpy.full(len(node2idx), numpy.nan)
+    for (node, score) in node2score.items():
+        if node in node2idx:
+            scores[node2idx[node]] = score
 
-    top = list[:num_elements]
-    rest = list[num_elements:]
-    
-    return(top, rest)
+    missing = numpy.isnan(scores)
+    if missing.any():
+        if missing_score is None:
+            raise Exception(f"Scores missing for {numpy.count_nonzero(missing)} nodes of the network")
+        scores[missing] = missing_score
+
+    return(scores)
+
+
+def file_order(node2score, node2idx):
+    """
+    Position of each node in a scores file (the order of node2score), used to break ties
+    between equal scores in the file order, as a stable sort of the scores file does;
+    nodes of the network without a score come last, by node index
+
+    returns:
+    - order: numpy array of positions, indexed by node index
+    """
+    order = numpy.full(len(node2idx), -1, dtype=numpy.int64)
+    position = 0
+    for node in node2score:
+        if node in node2idx:
+            order[node2idx[node]] = position
+            position += 1
+    missing = (order < 0)
+    order[missing] = numpy.arange(position, position + numpy.count_nonzero(missing))
+
+    return(order)
 
 
-def get_highest_scoring_nodes(node2score, network, protein2enrichment, threshold=10.0):
+def top_k(values, candidates, k, order=None):
     """
-    Get the top x% of highest-scoring genes (including causal) based on the provided
-    node2score dictionary.
+    Selects the k candidates with the highest values, without sorting:
+    the k-th highest value is found with a partition, and candidates tied with it
+    are selected by increasing order (node index if order is None)
 
     arguments:
-    - node2score: dict with key=node, value=score
-    - network: networkx graph of the interactome
-    - protein2enrichment: dict with key=protein, value=tissue enrichment
-    - threshold: float, percentage threshold for selecting highest-scoring genes
+    - values: numpy array of values, indexed by node index
+    - candidates: boolean numpy array, nodes that can be selected
+    - k: number of nodes to select
+    - order: numpy array indexed by node index, tie-breaking order (eg from file_order()), or None
 
     returns:
-    - highest_scoring: list of highest-scoring genes (top x%)
-    - low_scoring: list of low-scoring genes (the rest)
+    - top: boolean numpy array, the k selected nodes
+    """
+    top = numpy.zeros(len(values), dtype=bool)
+    candidate_idx = numpy.flatnonzero(candidates)
+    if k <= 0:
+        return(top)
+    if k >= len(candidate_idx):
+        top[candidate_idx] = True
+        return(top)
+
+    candidate_values = values[candidate_idx]
+    kth_value = numpy.partition(candidate_values, len(candidate_idx) - k)[len(candidate_idx) - k]
+    above = candidate_values > kth_value
+    top[candidate_idx[above]] = True
+    tied = candidate_idx[candidate_values == kth_value]
+    if order is not None:
+        tied = tied[numpy.argsort(order[tied], kind='stable')]
+    top[tied[:k - numpy.count_nonzero(above)]] = True
+
+    return(top)
+
+
+def top_percent(values, candidates, x, order=None):
     """
+    Finds the top x% of candidates by value, ties broken by order (see top_k())
 
-    # # sort scores by descending order
-    # results_sorted = sorted(node2score.keys(), key=lambda item: node2score[item], reverse=True)
-    # scores_sorted = [node2score[node] for node in results_sorted]
+    returns:
+    - top: boolean numpy array, the top x% of candidates
+    - rest: boolean numpy array, the rest of candidates
+    """
+    num_elements = round(numpy.count_nonzero(candidates) * x/100)
 
-    node2score_copy = node2score.copy()
+    top = top_k(values, candidates, num_elements, order)
+    rest = candidates & ~top
 
-    # get top x% of highest-scoring genes (including causal)
-    # due to obsolete GTEx data, some genes are removed from the tissue enrichment analysis
-    for protein in network:
-        if protein not in protein2enrichment:
-            del node2score_copy[protein]
+    return(top, rest)
 
-    results_sorted = sorted(node2score_copy.keys(), key=lambda item: node2score_copy[item], reverse=True)
-    highest_scoring, low_scoring = top_percent(results_sorted, threshold)
 
-    return(highest_scoring, low_scoring)
+def get_highest_scoring_nodes(scores, annotated, threshold=10.0, order=None):
+    """
+    Get the top x% of highest-scoring genes (including causal) based on the provided scores,
+    among the genes with tissue enrichment data.
 
+    arguments:
+    - scores: numpy array of scores, indexed by node index
+    - annotated: boolean numpy array, nodes with tissue enrichment data
+    - threshold: float, percentage threshold for selecting highest-scoring genes
+    - order: tie-breaking order of the genes, eg from file_order(), None for node index
 
-def intersection(list_1, list_2):
-    """
-    Returns a list with common elements for two lists
+    returns:
+    - highest_scoring: boolean numpy array, highest-scoring genes (top x%)
+    - low_scoring: boolean numpy array, low-scoring genes (the rest)
     """
-    return list(set(list_1) & set(list_2))
+    # due to obsolete GTEx data, some genes are removed from the tissue enrichment analysis
+    highest_scoring, low_scoring = top_percent(scores, annotated, threshold, order)
+
+    return(highest_scoring, low_scoring)
 
 
 def format_pvalue(pvalue):
@@ -286,15 +405,15 @@ def contingency_matrix(highest_scoring, low_scoring, tissue_enriched, non_tissue
     where contingency_matrix = [[a, b], [c, d]]
 
     arguments:
-    - highest_scoring: list of highest-scoring genes (top x%)
-    - low_scoring: list of low-scoring genes (the rest)
-    - tissue_enriched: list of genes enriched in the tissue
-    - non_tissue_enriched: list of genes non-enriched in the tissue
+    - highest_scoring: boolean numpy array, highest-scoring genes (top x%)
+    - low_scoring: boolean numpy array, low-scoring genes (the rest)
+    - tissue_enriched: boolean numpy array, genes enriched in the tissue
+    - non_tissue_enriched: boolean numpy array, genes non-enriched in the tissue
     """
-    x1 = len(intersection(highest_scoring, tissue_enriched))
-    x2 = len(intersection(low_scoring, tissue_enriched))
-    x3 = len(intersection(highest_scoring, non_tissue_enriched))
-    x4 = len(intersection(low_scoring, non_tissue_enriched))
+    x1 = numpy.count_nonzero(highest_scoring & tissue_enriched)
+    x2 = numpy.count_nonzero(low_scoring & tissue_enriched)
+    x3 = numpy.count_nonzero(highest_scoring & non_tissue_enriched)
+    x4 = numpy.count_nonzero(low_scoring & non_tissue_enriched)
 
     contingency_matrix = [[x1, x2], [x3, x4]]
 
@@ -312,8 +431,8 @@ def comparison_matrix_row(method, highest_scoring, tissue_enriched, non_tissue_e
     - percentage of the highest-scoring tissue-enriched genes,
     - p-value for tissue enrichment
     """
-    x1 = len(intersection(highest_scoring, tissue_enriched))
-    x2 = len(intersection(highest_scoring, non_tissue_enriched))
+    x1 = numpy.count_nonzero(highest_scoring & tissue_enriched)
+    x2 = numpy.count_nonzero(highest_scoring & non_tissue_enriched)
     perc = round(x1 / (x1 + x2), 2)
 
     comparison_row = [x1, x2, perc, pvalue]
@@ -321,6 +440,252 @@ def comparison_matrix_row(method, highest_scoring, tissue_enriched, non_tissue_e
     return(comparison_row)
 
 
+def sample_null_hits(strata, iterations, seed_seq):
+    """
+    Draws iterations random sets of genes and counts the tissue-enriched genes in each set.
+    A random set has strata[b, 2] genes drawn without replacement from the strata[b, 0] genes
+    of stratum b, of which strata[b, 1] are tissue-enriched, for every stratum b:
+    the number of tissue-enriched genes drawn from a stratum is hypergeometric, so each
+    set is drawn as one hypergeometric draw per stratum, in batches of sets.
+
+    arguments:
+    - strata: 2D numpy array (strata x 3): number of genes, of tissue-enriched genes,
+        and of genes to draw in each stratum
+    - iterations: number of random sets
+    - seed_seq: numpy.random.SeedSequence for this call, so parallel calls get independent streams
+
+    returns:
+    - hits: 1D numpy array, number of tissue-enriched genes in each random set
+    """
+    rng = numpy.random.default_rng(seed_seq)
+    hits = numpy.empty(iterations, dtype=numpy.int64)
+
+    batch_size = 10000
+    for start in range(0, iterations, batch_size):
+        end = min(start + batch_size, iterations)
+        draws = rng.hypergeometric(strata[:, 1], strata[:, 0] - strata[:, 1], strata[:, 2], size=(end - start, len(strata)))
+        hits[start:end] = draws.sum(axis=1)
+
+    return(hits)
+
+
+def empirical_pvalue(highest_scoring, tissue_enriched, annotated, degrees=None, iterations=10000, seed_seq=None, workers=1):
+    """
+    Empirical p-value of the number of tissue-enriched genes among the highest-scoring genes:
+    the fraction of random gene sets of the same size with at least as many tissue-enriched genes.
+    Random sets are drawn among the genes with expression data, either uniformly (degrees=None)
+    or degree-matched: with as many genes as the highest-scoring set in each degree bin
+    (bins of degrees [1], [2, 3], [4, 7], [8, 15]...).
+    The random sets are drawn in chunks of fixed size with independent streams derived from seed_seq,
+    spread over workers processes: the p-value does not depend on workers.
+
+    arguments:
+    - highest_scoring, tissue_enriched, annotated: boolean numpy arrays indexed by node index
+    - degrees: numpy array of node degrees, or None for uniform random sets
+    - iterations: number of random sets
+    - seed_seq: numpy.random.SeedSequence, None for a fresh one
+    - workers: number of processes to draw the random sets
+
+    returns:
+    - pvalue: (1 + number of random sets with at least as many tissue-enriched genes) / (1 + iterations)
+    """
+    if degrees is None:
+        strata_of_nodes = numpy.zeros(len(annotated), dtype=numpy.int64)
+    else:
+        strata_of_nodes = numpy.floor(numpy.log2(numpy.maximum(degrees, 1))).astype(numpy.int64)
+    n_strata = strata_of_nodes.max() + 1
+    strata = numpy.stack([numpy.bincount(strata_of_nodes[annotated], minlength=n_strata),
+                          numpy.bincount(strata_of_nodes[annotated & tissue_enriched], minlength=n_strata),
+                          numpy.bincount(strata_of_nodes[annotated & highest_scoring], minlength=n_strata)], axis=1)
+    # strata without highest-scoring genes draw nothing
+    strata = strata[strata[:, 2] > 0]
+    observed = numpy.count_nonzero(highest_scoring & tissue_enriched)
+
+    # one independent stream per chunk of iterations: the chunks have a fixed size, so that
+    # the random sets (and the p-value) only depend on seed_seq, not on workers
+    if seed_seq is None:
+        seed_seq = numpy.random.SeedSequence()
+    chunk_size = 1000
+    chunks = [min(chunk_size, iterations - start) for start in range(0, iterations, chunk_size)]
+    seed_seqs = seed_seq.spawn(len(chunks))
+
+    if workers == 1 or len(chunks) == 1:
+        hits = numpy.concatenate([sample_null_hits(strata, chunk, chunk_seed_seq)
+                                  for (chunk, chunk_seed_seq) in zip(chunks, seed_seqs)])
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=min(workers, len(chunks))) as executor:
+            hits = numpy.concatenate(list(executor.map(sample_null_hits,
+                                                       [strata] * len(chunks),
+                                                       chunks,
+                                                       seed_seqs)))
+
+    return((1 + numpy.count_nonzero(hits >= observed)) / (1 + iterations))
+
+
+def rank_order(values, candidates, order=None):
+    """
+    Returns the node indexes of candidates sorted by decreasing value,
+    ties by increasing order, or node index if order is None (the order used by top_k())
+    """
+    candidate_idx = numpy.flatnonzero(candidates)
+    tie_key = candidate_idx if order is None else order[candidate_idx]
+    return(candidate_idx[numpy.lexsort((tie_key, -values[candidate_idx]))])
+
+
+def threshold_sweep(scores, enrichment, annotated, thresholds, order=None):
+    """
+    Evaluates the tissue enrichment of the highest-scoring genes for every pair of
+    thresholds (highest-scoring threshold, enrichment threshold) at once.
+    Scores and enrichment are sorted once; for each gene we find the first threshold
+    at which it is selected (in each dimension), and the number of highest-scoring
+    tissue-enriched genes of every pair of thresholds is a 2D prefix count.
+
+    arguments:
+    - scores: numpy array of scores, indexed by node index
+    - enrichment: numpy array of tissue enrichment, indexed by node index
+    - annotated: boolean numpy array, nodes with tissue enrichment data
+    - thresholds: 1D numpy array of increasing percentage thresholds
+    - order: tie-breaking order of the scores, eg from file_order(), None for node index
+
+    returns: 2D numpy arrays (highest-scoring threshold x enrichment threshold):
+    - tissue_enriched: number of highest-scoring genes that are tissue-enriched
+    - non_tissue_enriched: number of highest-scoring genes that are non-tissue-enriched
+    - ratio: ratio of highest-scoring genes that are tissue-enriched
+    - pvalues: one-sided Fisher's exact test p-values, as in contingency_matrix()
+    """
+    n_annotated = numpy.count_nonzero(annotated)
+    # number of genes selected at each threshold, as in top_percent()
+    num_elements = numpy.round(n_annotated * thresholds / 100).astype(numpy.int64)
+
+    first_threshold = []
+    for (values, values_order) in ((scores, order), (enrichment, None)):
+        position = numpy.empty(len(values), dtype=numpy.int64)
+        ranked = rank_order(values, annotated, values_order)
+        position[ranked] = numpy.arange(len(ranked))
+        # a gene is selected at threshold t iff its position < num_elements[t]
+        first_threshold.append(numpy.searchsorted(num_elements, position[annotated], side='right'))
+
+    n_thresholds = len(thresholds)
+    counts = numpy.bincount(first_threshold[0] * (n_thresholds + 1) + first_threshold[1],
+                            minlength=(n_thresholds + 1) ** 2).reshape(n_thresholds + 1, n_thresholds + 1)
+    tissue_enriched = counts.cumsum(axis=0).cumsum(axis=1)[:n_thresholds, :n_thresholds]
+
+    num_highest = num_elements[:, numpy.newaxis]
+    num_tissue = num_elements[numpy.newaxis, :]
+    non_tissue_enriched = num_highest - tissue_enriched
+    ratio = numpy.divide(tissue_enriched, num_highest, out=numpy.full(tissue_enriched.shape, numpy.nan),
+                         where=num_highest > 0)
+    # Fisher's exact test with alternative='greater' is the hypergeometric tail P(x >= tissue_enriched)
+    pvalues = scipy.stats.hypergeom.sf(tissue_enriched - 1, n_annotated, num_tissue, num_highest)
+
+    return(tissue_enriched, non_tissue_enriched, ratio, pvalues)
+
+
+def sweep_to_TSV(method2sweep, thresholds, out):
+    """
+    Saves the results of threshold_sweep() for each method in a TSV file with columns:
+    METHOD, HIGHEST_SCORING_THRESHOLD, ENRICHMENT_THRESHOLD, TISSUE_ENRICHED, NON_TISSUE_ENRICHED, RATIO, PVALUE
+    """
+    with open(out, 'w') as f:
+        f.write("METHOD\tHIGHEST_SCORING_THRESHOLD\tENRICHMENT_THRESHOLD\tTISSUE_ENRICHED\tNON_TISSUE_ENRICHED\tRATIO\tPVALUE\n")
+        for (method, (tissue_enriched, non_tissue_enriched, ratio, pvalues)) in method2sweep.items():
+            for (i, highest_scoring_threshold) in enumerate(thresholds):
+                for (j, enrichement_threshold) in enumerate(thresholds):
+                    f.write(f"{method}\t{highest_scoring_threshold:g}\t{enrichement_threshold:g}\t"
+                            f"{tissue_enriched[i, j]}\t{non_tissue_enriched[i, j]}\t{ratio[i, j]:.4f}\t{pvalues[i, j]:.4g}\n")
+    logger.info(f"Threshold sweep table saved to {out}")
+
+
+def plot_sweep(method2sweep, thresholds, out):
+    """
+    Plots the results of threshold_sweep() as heatmaps, one row per method:
+    -log10(p-value) on the left, ratio of tissue-enriched highest-scoring genes on the right
+    """
+    fig, axes = matplotlib.pyplot.subplots(len(method2sweep), 2, figsize=(12, 5 * len(method2sweep)), squeeze=False)
+    step = thresholds[0]
+    extent = (thresholds[0] - step / 2, thresholds[-1] + step / 2, thresholds[0] - step / 2, thresholds[-1] + step / 2)
+
+    for (row, (method, (tissue_enriched, non_tissue_enriched, ratio, pvalues))) in enumerate(method2sweep.items()):
+        for (ax, values, label) in ((axes[row, 0], -numpy.log10(numpy.maximum(pvalues, 1e-300)), "-log10(p-value)"),
+                                    (axes[row, 1], ratio, "ratio")):
+            image = ax.imshow(values, origin='lower', extent=extent, aspect='auto', cmap='viridis')
+            fig.colorbar(image, ax=ax, label=label)
+            ax.set_title(f"{method}: {label}", fontsize=12)
+            ax.set_xlabel("Enrichment threshold (%)", fontsize=10)
+            ax.set_ylabel("Highest-scoring threshold (%)", fontsize=10)
+
+    fig.tight_layout()
+    matplotlib.pyplot.savefig(out, dpi=200)
+    logger.info(f"Threshold sweep heatmaps saved to {out}")
+
+
+def multi_tissue_enrichment(method2scores, enrichment, tissues, highest_scoring_threshold, enrichement_threshold, method2order=None):
+    """
+    Evaluates the tissue enrichment of the highest-scoring genes of each method in each tissue
+
+    arguments:
+    - method2scores: dict, key=method, value=numpy array of scores indexed by node index
+    - enrichment: 2D numpy array (nodes x tissues) of tissue enrichment, NaN for genes without expression data
+    - tissues: list of tissue names
+    - method2order: dict, key=method, value=tie-breaking order of the scores (see file_order()), or None
+
+    returns:
+    - results: list of rows [tissue, method, tissue-enriched, non-tissue-enriched, ratio, p-value]
+        (as comparison_matrix_row(), with the raw p-value)
+    """
+    results = []
+    for (t, tissue) in enumerate(tissues):
+        tissue_enrichment = enrichment[:, t]
+        annotated = ~numpy.isnan(tissue_enrichment)
+        tissue_enriched, non_tissue_enriched = top_percent(tissue_enrichment, annotated, enrichement_threshold)
+        for (method, scores) in method2scores.items():
+            order = method2order[method] if method2order else None
+            (highest_scoring, low_scoring) = get_highest_scoring_nodes(scores, annotated, highest_scoring_threshold, order)
+            x1 = numpy.count_nonzero(highest_scoring & tissue_enriched)
+            x2 = numpy.count_nonzero(low_scoring & tissue_enriched)
+            x3 = numpy.count_nonzero(highest_scoring & non_tissue_enriched)
+            x4 = numpy.count_nonzero(low_scoring & non_tissue_enriched)
+            _, pvalue = scipy.stats.fisher_exact([[x1, x2], [x3, x4]], alternative='greater')
+            ratio = x1 / (x1 + x3) if x1 + x3 > 0 else numpy.nan
+            results.append([tissue, method, x1, x3, ratio, pvalue])
+    return(results)
+
+
+def multi_tissue_to_TSV(results, out):
+    """
+    Saves the results of multi_tissue_enrichment() in a TSV file with columns:
+    TISSUE, METHOD, TISSUE_ENRICHED, NON_TISSUE_ENRICHED, RATIO, PVALUE
+    """
+    with open(out, 'w') as f:
+        f.write("TISSUE\tMETHOD\tTISSUE_ENRICHED\tNON_TISSUE_ENRICHED\tRATIO\tPVALUE\n")
+        for (tissue, method, x1, x3, ratio, pvalue) in results:
+            f.write(f"{tissue}\t{method}\t{x1}\t{x3}\t{ratio:.4f}\t{pvalue:.4g}\n")
+    logger.info(f"Multi-tissue table saved to {out}")
+
+
+def plot_multi_tissue(results, tissues, methods, out):
+    """
+    Plots the results of multi_tissue_enrichment() as a tissue x method heatmap of -log10(p-value)
+    """
+    method2col = {method: j for (j, method) in enumerate(methods)}
+    tissue2row = {tissue: i for (i, tissue) in enumerate(tissues)}
+    values = numpy.full((len(tissues), len(methods)), numpy.nan)
+    for (tissue, method, x1, x3, ratio, pvalue) in results:
+        values[tissue2row[tissue], method2col[method]] = -numpy.log10(max(pvalue, 1e-300))
+
+    fig, ax = matplotlib.pyplot.subplots(figsize=(2 + 1.5 * len(methods), 1 + 0.3 * len(tissues)))
+    image = ax.imshow(values, aspect='auto', cmap='viridis')
+    fig.colorbar(image, ax=ax, label="-log10(p-value)")
+    ax.set_xticks(range(len(methods)))
+    ax.set_xticklabels(methods, fontsize=10)
+    ax.set_yticks(range(len(tissues)))
+    ax.set_yticklabels(tissues, fontsize=8)
+
+    fig.tight_layout()
+    matplotlib.pyplot.savefig(out, dpi=200)
+    logger.info(f"Multi-tissue heatmap saved to {out}")
+
+
 ############################
 ########### MAIN ###########
 ############################
@@ -329,95 +694,138 @@ def main(network_file, uniprot_file, gtex_file, BFWalk_scores_file,
          multixrank_scores_file=None, netcore_scores_file=None,
          comparison_matrix_path="comparison_matrix.png",
          highest_scoring_threshold=10.0, enrichement_threshold=10.0,
-         weighted=False, directed=False):
+         weighted=False, directed=False, sweep_step=None, tpm_file=None, tissues=None,
+         empirical=None, empirical_iterations=10000, empirical_seed=None, workers=1):
 
     if not (multixrank_scores_file or netcore_scores_file):
         logger.warning("Provide MultiXrank and/or NetCore scores files")
         raise Exception("No MultiXrank and/or NetCore scores files provided")
 
     logger.info(f"Parsing network {network_file}")
-    (edge_list, node2idx, idx2node) = data_parser.parse_network(network_file, weighted, directed)
-
-    # construct a networkx Graph from the edge list
-    edge_list_no_weights = []
-    for edge in edge_list:
-        edge_list_no_weights.append((idx2node[edge[0]], idx2node[edge[1]]))
-    interactome = networkx.from_edgelist(edge_list_no_weights)
-
-    logger.info("Parsing Uniprot")
-    uniprot2gene = parse_uniprot(uniprot_file)
-
-    logger.info("Parsing GTEx")
-    gene2enrichment = parse_expression_data(gtex_file)
-
-    protein2enrichment = {}
-    for protein in interactome:
-        # due to obsolete GTEx data, some genes are removed from the tissue enrichment analysis
-        if protein in uniprot2gene:
-            gene = uniprot2gene[protein]
-            if gene in gene2enrichment:
-                protein2enrichment[protein] = gene2enrichment[gene]
-
-    # get top x% of genes enriched in the tissue
-    tissue_expr_sorted = sorted(protein2enrichment.keys(), key=lambda item: protein2enrichment[item], reverse=True)
-    tissue_enriched, non_tissue_enriched = top_percent(tissue_expr_sorted, enrichement_threshold)
-    logger.info(f"Selected {len(tissue_enriched)} tissue-enriched genes (removed {len(interactome) - len(protein2enrichment)} due to obsolete GTEx)")
-
-    comparison_matrix = []
-    row_labels = []
+    (indptr, indices, weights, node2idx, idx2node) = network_cache.load_network(network_file, weighted, directed)
+
+    if tpm_file is not None and sweep_step is not None:
+        raise Exception("The threshold sweep needs a single tissue (--gtex), it cannot be used with --tpm")
+    if empirical is not None and (tpm_file is not None or sweep_step is not None):
+        raise Exception("Empirical p-values are only computed for the comparison matrix, not with --tpm or --sweep")
+
+    def build_enrichment():
+        logger.info("Parsing Uniprot")
+        uniprot2gene = parse_uniprot(uniprot_file)
+        if tpm_file is not None:
+            logger.info("Parsing Expression Atlas TPM matrix")
+            (all_tissues, gene2row, gene_enrichment) = parse_expression_matrix(tpm_file)
+            return({'enrichment': annotation_cache.join_enrichment(idx2node, uniprot2gene, gene2row, gene_enrichment),
+                    'tissues': numpy.array(all_tissues, dtype=str)})
+        else:
+            logger.info("Parsing GTEx")
+            gene2enrichment = parse_expression_data(gtex_file)
+            gene2row = {gene: row for (row, gene) in enumerate(gene2enrichment)}
+            gene_enrichment = numpy.array(list(gene2enrichment.values()), dtype=numpy.float32)
+            return({'enrichment': annotation_cache.join_enrichment(idx2node, uniprot2gene, gene2row, gene_enrichment)})
+
+    # node-indexed tissue enrichment (nodes, or nodes x tissues with --tpm), NaN for genes without expression data
+    if tpm_file is not None:
+        annotations = annotation_cache.load_enrichment(network_file, weighted, directed, uniprot_file, tpm_file, "tpm", build_enrichment)
+        all_tissues = annotations['tissues'].tolist()
+        if tissues is None:
+            tissues = all_tissues
+        tissue_cols = []
+        for tissue in tissues:
+            if tissue not in all_tissues:
+                raise Exception(f"Tissue {tissue} is not in the TPM matrix, available tissues: {', '.join(all_tissues)}")
+            tissue_cols.append(all_tissues.index(tissue))
+        enrichment = annotations['enrichment'][:, tissue_cols]
+        logger.info(f"Found {len(all_tissues)} tissues, analysing {len(tissues)} tissues")
+        logger.info(f"Removed {numpy.count_nonzero(numpy.isnan(enrichment).all(axis=1))} genes without expression data")
+    else:
+        annotations = annotation_cache.load_enrichment(network_file, weighted, directed, uniprot_file, gtex_file, "gtex", build_enrichment)
+        enrichment = annotations['enrichment']
+        annotated = ~numpy.isnan(enrichment)
+
+    # scores of each method, and the order of the nodes in its scores file: genes with equal
+    # scores are selected in the file order
+    method2scores = {}
+    method2order = {}
     logger.info("Parsing BFWalk scores")
-    BFWalk_node2score = parse_BFWalk_scores(BFWalk_scores_file)
-    (BFWalk_highest_scoring, BFWalk_low_scoring) = get_highest_scoring_nodes(BFWalk_node2score, interactome, protein2enrichment, highest_scoring_threshold)
-    logger.info(f"BFWalk: Selected {len(BFWalk_highest_scoring)} highest-scoring genes")
-    BFWalk_pvalue = contingency_matrix(BFWalk_highest_scoring, BFWalk_low_scoring, tissue_enriched, non_tissue_enriched)
-    logger.info(f"BFWalk enrichment: {BFWalk_pvalue}")
-    BFWalk_comparison_row = comparison_matrix_row("BFWalk", BFWalk_highest_scoring, tissue_enriched, non_tissue_enriched, BFWalk_pvalue)
-    comparison_matrix.append(BFWalk_comparison_row)
-    row_labels.append("BFWalk")
-
+    node2score = parse_BFWalk_scores(BFWalk_scores_file)
+    method2scores["BFWalk"] = scores_to_array(node2score, node2idx)
+    method2order["BFWalk"] = file_order(node2score, node2idx)
     if multixrank_scores_file:
         logger.info("Parsing MultiXrank scores")
-        multixrank_node2score = parse_multixrank_scores(multixrank_scores_file)
-        (multixrank_highest_scoring, multixrank_low_scoring) = get_highest_scoring_nodes(multixrank_node2score, interactome, protein2enrichment, highest_scoring_threshold)
-        logger.info(f"MultiXrank: Selected {len(multixrank_highest_scoring)} highest-scoring genes")
-
-        multixrank_pvalue = contingency_matrix(multixrank_highest_scoring, multixrank_low_scoring, tissue_enriched, non_tissue_enriched)
-        logger.info(f"MultiXrank enrichment: {multixrank_pvalue}")
-
-        multixrank_comparison_row = comparison_matrix_row("MultiXrank", multixrank_highest_scoring, tissue_enriched, non_tissue_enriched, multixrank_pvalue)
-        comparison_matrix.append(multixrank_comparison_row)
-        row_labels.append("MultiXrank")
-
+        node2score = parse_multixrank_scores(multixrank_scores_file)
+        method2scores["MultiXrank"] = scores_to_array(node2score, node2idx)
+        method2order["MultiXrank"] = file_order(node2score, node2idx)
     if netcore_scores_file:
         logger.info("Parsing NetCore scores")
-        netcore_node2score = parse_netcore_scores(netcore_scores_file)
+        node2score = parse_netcore_scores(netcore_scores_file)
         # in netcore, some gene scores are missing, because they are not linked
         # to the main network component, we assign them scores=0,
         # so that they are included in the analysis
-        for protein in node2idx:
-            if protein not in netcore_node2score:
-                netcore_node2score[protein] = 0.0
-        (netcore_highest_scoring, netcore_low_scoring) = get_highest_scoring_nodes(netcore_node2score, interactome, protein2enrichment, highest_scoring_threshold)
-        logger.info(f"NetCore: Selected {len(netcore_highest_scoring)} highest-scoring genes")
-        netcore_pvalue = contingency_matrix(netcore_highest_scoring, netcore_low_scoring, tissue_enriched, non_tissue_enriched)
-        logger.info(f"NetCore enrichment: {netcore_pvalue}")
-
-        netcore_comparison_row = comparison_matrix_row("NetCore", netcore_highest_scoring, tissue_enriched, non_tissue_enriched, netcore_pvalue)
-        comparison_matrix.append(netcore_comparison_row)
-        row_labels.append("NetCore")
+        method2scores["NetCore"] = scores_to_array(node2score, node2idx, missing_score=0.0)
+        method2order["NetCore"] = file_order(node2score, node2idx)
+
+    comparison_matrix_path.parent.mkdir(parents=True, exist_ok=True)  # Path.parent of a bare filename returns Path("."), and mkdir on "."
+
+    if tpm_file is not None:
+        logger.info(f"Evaluating {len(method2scores)} methods in {len(tissues)} tissues")
+        results = multi_tissue_enrichment(method2scores, enrichment, tissues, highest_scoring_threshold, enrichement_threshold,
+                                          method2order)
+        multi_tissue_to_TSV(results, comparison_matrix_path.with_suffix(".tsv"))
+        plot_multi_tissue(results, tissues, list(method2scores), comparison_matrix_path)
+        return
+
+    if sweep_step is not None:
+        if not 0 < sweep_step <= 100:
+            raise Exception(f"Threshold sweep step must be in ]0, 100], got {sweep_step}")
+        thresholds = numpy.arange(1, int(100 / sweep_step) + 1) * sweep_step
+        logger.info(f"Sweeping {len(thresholds)} x {len(thresholds)} thresholds over {numpy.count_nonzero(annotated)} genes " \
+                    f"(removed {len(idx2node) - numpy.count_nonzero(annotated)} due to obsolete GTEx)")
+        method2sweep = {}
+        for (method, scores) in method2scores.items():
+            method2sweep[method] = threshold_sweep(scores, enrichment, annotated, thresholds, method2order[method])
+        sweep_to_TSV(method2sweep, thresholds, comparison_matrix_path.with_suffix(".tsv"))
+        plot_sweep(method2sweep, thresholds, comparison_matrix_path)
+        return
+
+    # get top x% of genes enriched in the tissue
+    tissue_enriched, non_tissue_enriched = top_percent(enrichment, annotated, enrichement_threshold)
+    logger.info(f"Selected {numpy.count_nonzero(tissue_enriched)} tissue-enriched genes (removed {len(idx2node) - numpy.count_nonzero(annotated)} due to obsolete GTEx)")
+
+    col_labels = ['tissue-enriched', 'non-tissue-enriched', "ratio", "p-value"]
+    if empirical is not None:
+        col_labels.append(f"empirical p-value ({empirical})")
+        degrees = network_cache.degrees(indptr, indices) if empirical == "degree" else None
+        method_seed_seqs = numpy.random.SeedSequence(empirical_seed).spawn(len(method2scores))
+
+    comparison_matrix = []
+    row_labels = []
+    for (m, (method, scores)) in enumerate(method2scores.items()):
+        (highest_scoring, low_scoring) = get_highest_scoring_nodes(scores, annotated, highest_scoring_threshold,
+                                                                   method2order[method])
+        logger.info(f"{method}: Selected {numpy.count_nonzero(highest_scoring)} highest-scoring genes")
+        pvalue = contingency_matrix(highest_scoring, low_scoring, tissue_enriched, non_tissue_enriched)
+        logger.info(f"{method} enrichment: {pvalue}")
+        comparison_row = comparison_matrix_row(method, highest_scoring, tissue_enriched, non_tissue_enriched, pvalue)
+        if empirical is not None:
+            empirical_p = format_pvalue(empirical_pvalue(highest_scoring, tissue_enriched, annotated, degrees,
+                                                         empirical_iterations, method_seed_seqs[m], workers))
+            logger.info(f"{method} empirical enrichment ({empirical}, {empirical_iterations} random sets): {empirical_p}")
+            comparison_row.append(empirical_p)
+        comparison_matrix.append(comparison_row)
+        row_labels.append(method)
 
     # plot the comparison table
     fig, ax = matplotlib.pyplot.subplots(figsize=(10, 8))
     table = ax.table(comparison_matrix, 
                     rowLabels=row_labels,
-                    colLabels=['tissue-enriched', 'non-tissue-enriched', "ratio", "p-value"],
+                    colLabels=col_labels,
                     loc="center")
     ax.axis('tight')
     ax.axis('off')
     table.set_fontsize(10)
     table.scale(1,2)
 
-    comparison_matrix_path.parent.mkdir(parents=True, exist_ok=True)  # Path.parent of a bare filename returns Path("."), and mkdir on "."
     matplotlib.pyplot.savefig(comparison_matrix_path, dpi=500, bbox_inches='tight')
 
 
@@ -445,11 +853,21 @@ if __name__ == "__main__":
                         "Uniprot Primary AC, Uniprot Secondary AC(s), tax ID, gene name, synonyms",
                         type=pathlib.Path,
                         required=True)
-    parser.add_argument('--gtex',
-                        help="path to the TSV file with expression data with columns: " \
-                        "ENSG, tissue_expression_ratio, gene name, other columns",
-                        type=pathlib.Path,
-                        required=True)
+    expression_group = parser.add_mutually_exclusive_group(required=True)
+    expression_group.add_argument('--gtex',
+                                  help="path to the TSV file with expression data with columns: " \
+                                  "ENSG, tissue_expression_ratio, gene name, other columns",
+                                  type=pathlib.Path)
+    expression_group.add_argument('--tpm',
+                                  help="path to the Expression Atlas TPM matrix (E-MTAB-5214 tpms.tsv, unmodified): " \
+                                  "all tissues (or --tissues) are analysed in one run, the tissue x method p-value heatmap " \
+                                  "is saved to --matrix and the results table to the same path with a .tsv extension",
+                                  type=pathlib.Path)
+    parser.add_argument('--tissues',
+                        help="Tissues (column names of the TPM matrix) to analyse with --tpm (default: all)",
+                        nargs='+',
+                        required=False,
+                        default=None)
     parser.add_argument('--BFWalk_scores',
                         help="Path to the BFWalk scores file (TSV with header, columns: NODE, SCORE)",
                         type=pathlib.Path,
@@ -479,6 +897,35 @@ if __name__ == "__main__":
                         type=float,
                         required=False,
                         default=10.0)
+    parser.add_argument('--sweep',
+                        help="Evaluate every pair of highest-scoring and enrichment thresholds STEP, 2*STEP, ..., 100 (%%) " \
+                        "instead of --highest_scoring_threshold and --enrichement_threshold: heatmaps are saved to --matrix " \
+                        "and the results table to the same path with a .tsv extension",
+                        metavar="STEP",
+                        type=float,
+                        required=False,
+                        default=None)
+    parser.add_argument('--empirical',
+                        help="Also compute an empirical p-value for each method, from random gene sets of the same size " \
+                        "as the highest-scoring genes: drawn uniformly, or with the same number of genes in each degree bin",
+                        choices=["uniform", "degree"],
+                        required=False,
+                        default=None)
+    parser.add_argument('--empirical_iterations',
+                        help="Number of random gene sets for --empirical (default: 10000)",
+                        type=int,
+                        required=False,
+                        default=10000)
+    parser.add_argument('--empirical_seed',
+                        help="Seed for the random generator of --empirical, for reproducible p-values (default: random)",
+                        type=int,
+                        required=False,
+                        default=None)
+    parser.add_argument('--workers',
+                        help="Number of processes drawing the random gene sets of --empirical (default: 1)",
+                        type=int,
+                        required=False,
+                        default=1)
     parser.add_argument('--weighted',
                         help="Whether the network is weighted (default: False)",
                         action='store_true',
@@ -501,7 +948,14 @@ if __name__ == "__main__":
              highest_scoring_threshold=args.highest_scoring_threshold,
              enrichement_threshold=args.enrichement_threshold,
              weighted=args.weighted,
-             directed=args.directed)
+             directed=args.directed,
+             sweep_step=args.sweep,
+             tpm_file=args.tpm,
+             tissues=args.tissues,
+             empirical=args.empirical,
+             empirical_iterations=args.empirical_iterations,
+             empirical_seed=args.empirical_seed,
+             workers=args.workers)
 
     except Exception as e:
         # details on the issue should be in the exception name, print to stderr and die
@@ -21,15 +21,20 @@ import sys
 import argparse
 import pathlib
 import logging
+import itertools
+import concurrent.futures
 
-import statistics
 import numpy
-import networkx
+import scipy.stats
 import matplotlib.pyplot
 from mpl_toolkits.axes_grid1.inset_locator import inset_axes
 
 sys.path.append("/home/kubicaj/Software/BFWalk")
-import data_parser
+import network_cache
+import ranking
+import netcore_index
+import compressed_io
+import loo_store
 
 # set up logger, using inherited config, in case we get called as a module
 logger = logging.getLogger(__name__)
@@ -46,7 +51,7 @@ def parse_ranks(ranks_file):
     """
     node2rank = {}
     
-    with open(ranks_file, 'r') as f:
+    with compressed_io.open_file(ranks_file, 'r') as f:
         header = f.readline()
         if not header.startswith("NODE\t"):
             raise Exception("Ranks file problem, wrong format")
@@ -60,101 +65,154 @@ def parse_ranks(ranks_file):
             try:
                 rank = int(rank)
             except ValueError:
-                raise Exception(f"Invalid rank value in ranks file: {rank} is not an integer")
+                # with the "average" tie policy, tied nodes can get a half-integer rank
+                try:
+                    rank = float(rank)
+                except ValueError:
+                    raise Exception(f"Invalid rank value in ranks file: {rank} is not a number")
             node2rank[node] = rank
 
     return(node2rank)
 
 
-def netcore_scores_to_ranks(left_out, netcore_LOO_dir, n_nodes):
+def calculate_rank_difference(BFWalk_node2rank, other_method_node2rank, node2idx, degrees):
     """
-    Iterates over the list of left-out nodes,
-    for each left-out node opens a leave-one-out file (with nodes sorted by descending score,
-    so the first node has rank=1, the second node has rank=2, etc),
-    finds the rank of the left-out node;
-    for left-out nodes for which scores are missing (not in the main network component), we assign scores=0.
+    Calculates the rank differences (BFWalk rank - other method rank) of the left-out nodes,
+    and splits their degrees by the sign of the difference
 
     arguments:
-    - left_out: list of left-out nodes
-    - netcore_LOO_dir: directory with NetCore scores files for left-out nodes,
-        eg. for each left-out node scores for all nodes in the interactome are in:
-        netcore-output/{PHENOTYPE}/output_{LEFT-OUT-NODE}/random_walk_weights.txt
-    - n_nodes: total number of nodes in the network
-    
+    - BFWalk_node2rank, other_method_node2rank: dicts with key=left-out node, value=rank
+    - node2idx: dict with key=node, value=node index
+    - degrees: numpy array of node degrees, indexed by node index
+
     returns:
-    - node2rank: dict with key=left-out node, value=rank
+    - rank_diff: numpy array of rank differences, in the order of BFWalk_node2rank
+    - negative_rank_degrees, positive_rank_degrees: numpy arrays of degrees of
+        left-out nodes with rank_diff < 0 and rank_diff >= 0
+    - node_degrees: numpy array of degrees of the left-out nodes
     """
-    node2rank = {}
+    ranks_BFWalk = numpy.array([BFWalk_node2rank[node] for node in BFWalk_node2rank], dtype=float)
+    ranks_other = numpy.array([other_method_node2rank[node] for node in BFWalk_node2rank], dtype=float)
+    node_degrees = degrees[[node2idx[node] for node in BFWalk_node2rank]]
 
-    for left_out_node in left_out:
-        netcore_LOO_file = os.path.join(netcore_LOO_dir, f"output_{left_out_node}", "random_walk_weights.txt")
-        if not os.path.isfile(netcore_LOO_file):
-                    raise Exception(f"NetCore scores file not found for left-out node {left_out_node}: {netcore_LOO_file}")
-
-        with open(netcore_LOO_file, 'r') as f:
-            header = f.readline()
-            if not header.startswith("node_index\t"):
-                raise Exception(f"NetCore scores file problem for left-out node {left_out_node}, wrong format: {netcore_LOO_file}")
-
-            rank = 1
-            found = False
-            for line in f:
-                split_line = line.rstrip().split("\t")
-                if len(split_line) != 4:
-                    raise Exception(f"Invalid line in NetCore scores file for left-out node {left_out_node}: {line}")
-
-                (idx, node, score, pvalue) = split_line
-                if node == left_out_node:
-                    node2rank[left_out_node] = rank
-                    found = True
-                    break
-                rank += 1
-
-            if not found:
-                # If the left-out node is not found in the NetCore scores file, assign score=0 (rank==n_nodes)
-                node2rank[left_out_node] = n_nodes
+    rank_diff = ranks_BFWalk - ranks_other
+    rank_diff_abs = numpy.abs(rank_diff)
+    negative_rank_degrees = node_degrees[rank_diff < 0]
+    positive_rank_degrees = node_degrees[rank_diff >= 0]
 
-    return(node2rank)
+    logger.info(f"absolute rank difference mean: {round(numpy.mean(rank_diff_abs))}, median: {round(numpy.median(rank_diff_abs))}")
+    logger.info(f"negative rank degree mean: {round(numpy.mean(negative_rank_degrees))}, median: {round(numpy.median(negative_rank_degrees))}")
+    logger.info(f"positive rank degree mean: {round(numpy.mean(positive_rank_degrees))}, median: {round(numpy.median(positive_rank_degrees))}")
 
+    return(rank_diff, negative_rank_degrees, positive_rank_degrees, node_degrees)
 
-def calculate_rank_difference(BFWalk_node2rank, other_method_node2rank, network):
-    ranks_BFWalk = []
-    ranks_other = []
-    node_degrees = []
 
-    for node in BFWalk_node2rank:
-        ranks_BFWalk.append(BFWalk_node2rank[node])
-        ranks_other.append(other_method_node2rank[node])
-        node_degrees.append(network.degree(node))
-    assert len(ranks_BFWalk) == len(ranks_other) == len(node_degrees)
+def sign_flip_pvalue(rank_diff, permutations=100000, seed=None):
+    """
+    Two-sided paired permutation test of the rank differences: under the null hypothesis
+    the two methods are exchangeable, so the sign of each difference is flipped at random.
+    The statistic is the sum of the differences; with random bits B (0/1) the sum of the
+    sign-flipped differences is 2 * B @ rank_diff - sum(rank_diff), computed for blocks
+    of permutations as one (permutations x left-out nodes) matrix product.
 
-    rank_diff = []
-    rank_diff_abs = []
-    negative_rank_degrees = []
-    positive_rank_degrees = []
+    arguments:
+    - rank_diff: numpy array of paired rank differences
+    - permutations: number of random sign flips
+    - seed: seed (or numpy.random.SeedSequence) for the random generator, None for a fresh one
 
-    for i in range(len(ranks_BFWalk)):
-        diff = ranks_BFWalk[i] - ranks_other[i]
-        rank_diff.append(diff)
-        rank_diff_abs.append(abs(diff))
+    returns:
+    - pvalue: (1 + number of permutations with |statistic| >= |observed|) / (1 + permutations)
+    """
+    rank_diff = numpy.asarray(rank_diff, dtype=float)
+    # ranks are integers or half-integers, so sums are exact in float64 and need no tolerance
+    observed = abs(rank_diff.sum())
+    rng = numpy.random.default_rng(seed)
+    n_extreme = 0
 
-        if diff < 0:
-            negative_rank_degrees.append(node_degrees[i])
-        else:
-            positive_rank_degrees.append(node_degrees[i])
+    # keep each block of random bits around 32 MB
+    batch_size = max(1, (1 << 22) // max(1, len(rank_diff)))
+    for start in range(0, permutations, batch_size):
+        end = min(start + batch_size, permutations)
+        bits = rng.integers(0, 2, size=(end - start, len(rank_diff)), dtype=numpy.int8).astype(float)
+        statistics = 2 * (bits @ rank_diff) - rank_diff.sum()
+        n_extreme += numpy.count_nonzero(numpy.abs(statistics) >= observed)
 
-    logger.info(f"absolute rank difference mean: {round(statistics.mean(rank_diff_abs))}, median: {round(statistics.median(rank_diff_abs))}")
-    logger.info(f"negative rank degree mean: {round(statistics.mean(negative_rank_degrees))}, median: {round(statistics.median(negative_rank_degrees))}")
-    logger.info(f"positive rank degree mean: {round(statistics.mean(positive_rank_degrees))}, median: {round(statistics.median(positive_rank_degrees))}")
+    return((1 + n_extreme) / (1 + permutations))
 
-    return(rank_diff, negative_rank_degrees, positive_rank_degrees, node_degrees)
 
+def paired_tests(method2node2rank, permutations=100000, seed=None):
+    """
+    Paired tests of the left-out ranks between every pair of methods:
+    Wilcoxon signed-rank test and sign-flip permutation test (see sign_flip_pvalue())
+    on the rank differences (method1 rank - method2 rank) of the left-out nodes
 
-def plot_rankVsDeg(rank_diff, negative_rank_degrees, positive_rank_degrees, node_degrees, interactome, other_method, out):
+    arguments:
+    - method2node2rank: dict with key=method, value=dict with key=left-out node, value=rank
+        (all methods must have ranks for the same left-out nodes)
+    - permutations: number of random sign flips of the permutation test
+    - seed: seed for the random generator, None for a fresh one
+
+    returns:
+    - results: list of dicts, one per pair of methods, with keys METHOD1, METHOD2, N,
+        MEAN_RANK_DIFF, MEDIAN_RANK_DIFF, METHOD1_BETTER, METHOD2_BETTER,
+        WILCOXON_STATISTIC, WILCOXON_PVALUE, PERMUTATION_PVALUE
+    """
+    pairs = list(itertools.combinations(method2node2rank, 2))
+    seed_seqs = numpy.random.SeedSequence(seed).spawn(len(pairs))
+    results = []
+
+    for ((method1, method2), seed_seq) in zip(pairs, seed_seqs):
+        node2rank1 = method2node2rank[method1]
+        node2rank2 = method2node2rank[method2]
+        rank_diff = numpy.array([node2rank1[node] - node2rank2[node] for node in node2rank1], dtype=float)
+
+        if numpy.any(rank_diff != 0):
+            wilcoxon = scipy.stats.wilcoxon(rank_diff)
+            (statistic, wilcoxon_pvalue) = (wilcoxon.statistic, wilcoxon.pvalue)
+        else:
+            # identical ranks: the Wilcoxon test is not defined
+            (statistic, wilcoxon_pvalue) = (numpy.nan, 1.0)
+
+        results.append({'METHOD1': method1,
+                        'METHOD2': method2,
+                        'N': len(rank_diff),
+                        'MEAN_RANK_DIFF': numpy.mean(rank_diff),
+                        'MEDIAN_RANK_DIFF': numpy.median(rank_diff),
+                        # lower rank is better
+                        'METHOD1_BETTER': numpy.count_nonzero(rank_diff < 0),
+                        'METHOD2_BETTER': numpy.count_nonzero(rank_diff > 0),
+                        'WILCOXON_STATISTIC': statistic,
+                        'WILCOXON_PVALUE': wilcoxon_pvalue,
+                        'PERMUTATION_PVALUE': sign_flip_pvalue(rank_diff, permutations, seed_seq)})
+        logger.info(f"{method1} vs {method2}: Wilcoxon p-value {wilcoxon_pvalue:.4g}, "
+                    f"permutation p-value {results[-1]['PERMUTATION_PVALUE']:.4g} ({permutations} permutations)")
+
+    return(results)
+
+
+def paired_tests_to_TSV(results, permutations, out):
+    """
+    Saves the results of paired_tests() in a TSV file with columns:
+    METHOD1, METHOD2, N, MEAN_RANK_DIFF, MEDIAN_RANK_DIFF, METHOD1_BETTER, METHOD2_BETTER,
+    WILCOXON_STATISTIC, WILCOXON_PVALUE, PERMUTATION_PVALUE, PERMUTATIONS
+    """
+    with open(out, 'w') as f:
+        f.write("METHOD1\tMETHOD2\tN\tMEAN_RANK_DIFF\tMEDIAN_RANK_DIFF\tMETHOD1_BETTER\tMETHOD2_BETTER\t"
+                "WILCOXON_STATISTIC\tWILCOXON_PVALUE\tPERMUTATION_PVALUE\tPERMUTATIONS\n")
+        for result in results:
+            f.write(f"{result['METHOD1']}\t{result['METHOD2']}\t{result['N']}\t"
+                    f"{result['MEAN_RANK_DIFF']:.4f}\t{result['MEDIAN_RANK_DIFF']:g}\t"
+                    f"{result['METHOD1_BETTER']}\t{result['METHOD2_BETTER']}\t"
+                    f"{result['WILCOXON_STATISTIC']:g}\t{result['WILCOXON_PVALUE']:.4g}\t"
+                    f"{result['PERMUTATION_PVALUE']:.4g}\t{permutations}\n")
+    logger.info(f"Paired tests saved to {out}")
+
+
+def plot_rankVsDeg(rank_diff, negative_rank_degrees, positive_rank_degrees, node_degrees, network_size, other_method, out):
     fig, ax = matplotlib.pyplot.subplots(figsize=(7, 6))
 
     ax.scatter(x=rank_diff, y=node_degrees, s=1, alpha=0.8, zorder=3)
-    ax.set_xlim(-(len(interactome)), len(interactome))
+    ax.set_xlim(-network_size, network_size)
     ax.axvline(0, color='grey', linestyle='--', linewidth=1.5, zorder=2)
 
     ax.set_xlabel(f"Rank diff (BFWalk rank - {other_method} rank)", fontsize=12)
@@ -173,11 +231,103 @@ def plot_rankVsDeg(rank_diff, negative_rank_degrees, positive_rank_degrees, node
 
     inset.grid(True, linestyle="--", alpha=0.2)
 
-    matplotlib.pyplot.savefig(out, dpi=500)
+    fig.savefig(out, dpi=500)
+    matplotlib.pyplot.close(fig)
+
+
+def load_phenotype_ranks(phenotype, BFWalk_out_dir, multixrank_out_dir, netcore_out_dir, network_size, ties="min", store=False):
+    """
+    Loads the left-out ranks of one phenotype for each method, from the ranks files
+    (scores files for NetCore), or with store from the LOO store of each method
+    ({method output directory}/{phenotype}/LOO_store/, see loo_store.py)
+
+    arguments:
+    - phenotype: name of the phenotype subdirectory in each output directory
+    - BFWalk_out_dir, multixrank_out_dir, netcore_out_dir: output directories of the methods
+        (multixrank_out_dir and netcore_out_dir can be None)
+    - network_size: total number of nodes in the network
+    - ties: tie policy for the NetCore ranks (and all ranks with store), one of ranking.TIES
+    - store: whether to calculate the ranks from the LOO stores
+
+    returns:
+    - (BFWalk_node2rank, multixrank_node2rank, netcore_node2rank): dicts with key=left-out node,
+        value=rank, None for a method without output directory
+    """
+    if store:
+        logger.info(f"Calculating ranks from the LOO stores for phenotype {phenotype}")
+        store_dirs = [os.path.join(out_dir, phenotype, loo_store.STORE_DIR) if out_dir else None
+                      for out_dir in (BFWalk_out_dir, multixrank_out_dir, netcore_out_dir)]
+        (BFWalk_node2rank, multixrank_node2rank, netcore_node2rank) = \
+            [loo_store.store_ranks(store_dir, network_size, ties) if store_dir else None for store_dir in store_dirs]
+        if multixrank_node2rank is not None and len(BFWalk_node2rank) != len(multixrank_node2rank):
+            raise Exception(f"BFWalk and MultiXrank LOO stores have different number of left-out nodes for phenotype {phenotype}")
+        if netcore_node2rank is not None and len(BFWalk_node2rank) != len(netcore_node2rank):
+            raise Exception(f"BFWalk and NetCore LOO stores have different number of left-out nodes for phenotype {phenotype}")
+        return(BFWalk_node2rank, multixrank_node2rank, netcore_node2rank)
+
+    logger.info(f"Parsing ranks for phenotype {phenotype}")
+    BFWalk_ranks_file = compressed_io.find_file(os.path.join(BFWalk_out_dir, phenotype, "ranks_LOO.tsv"))
+    BFWalk_node2rank = parse_ranks(BFWalk_ranks_file)
+
+    multixrank_node2rank = None
+    if multixrank_out_dir:
+        multixrank_ranks_file = compressed_io.find_file(os.path.join(multixrank_out_dir, phenotype, "ranks_LOO.tsv"))
+        multixrank_node2rank = parse_ranks(multixrank_ranks_file)
+        if len(BFWalk_node2rank) != len(multixrank_node2rank):
+            raise Exception(f"BFWalk and MultiXrank ranks files have different number of left-out nodes for phenotype {phenotype}")
+
+    netcore_node2rank = None
+    if netcore_out_dir:
+        netcore_LOO_dir = os.path.join(netcore_out_dir, phenotype)
+        netcore_node2rank = netcore_index.netcore_scores_to_ranks(BFWalk_node2rank.keys(), netcore_LOO_dir, network_size, ties)
+
+    return(BFWalk_node2rank, multixrank_node2rank, netcore_node2rank)
+
+
+def plot_facets(phenotype2ranks, other_method_idx, node2idx, degrees, network_size, other_method, out):
+    """
+    Plots the ranks vs degree scatter plot of each phenotype in one figure, one panel per phenotype
+
+    arguments:
+    - phenotype2ranks: dict, key=phenotype, value=tuple of node2rank dicts from load_phenotype_ranks()
+    - other_method_idx: index in these tuples of the method compared with BFWalk
+    - node2idx, degrees: node indexes and numpy array of node degrees
+    - network_size: total number of nodes in the network
+    - other_method: name of the other method, for the axis labels
+    - out: path of the figure
+    """
+    n_cols = int(numpy.ceil(numpy.sqrt(len(phenotype2ranks))))
+    n_rows = int(numpy.ceil(len(phenotype2ranks) / n_cols))
+    fig, axes = matplotlib.pyplot.subplots(n_rows, n_cols, figsize=(3 * n_cols, 3 * n_rows),
+                                           sharex=True, squeeze=False)
+
+    for (ax, (phenotype, ranks)) in zip(axes.flat, phenotype2ranks.items()):
+        BFWalk_node2rank = ranks[0]
+        other_method_node2rank = ranks[other_method_idx]
+        rank_diff = numpy.array([BFWalk_node2rank[node] - other_method_node2rank[node] for node in BFWalk_node2rank], dtype=float)
+        node_degrees = degrees[[node2idx[node] for node in BFWalk_node2rank]]
+
+        ax.scatter(x=rank_diff, y=node_degrees, s=1, alpha=0.8, zorder=3)
+        ax.set_xlim(-network_size, network_size)
+        ax.axvline(0, color='grey', linestyle='--', linewidth=1, zorder=2)
+        ax.set_title(f"{phenotype} (n={len(rank_diff)})", fontsize=9)
+        ax.tick_params(labelsize=7)
+        ax.grid(True, linestyle='--', which='major', color='grey', alpha=0.2)
+
+    # hide the panels left over in the last row
+    for ax in axes.flat[len(phenotype2ranks):]:
+        ax.set_visible(False)
+
+    fig.supxlabel(f"Rank diff (BFWalk rank - {other_method} rank)", fontsize=12)
+    fig.supylabel("Node degree", fontsize=12)
+    fig.tight_layout()
+    fig.savefig(out, dpi=200)
+    matplotlib.pyplot.close(fig)
 
 
 def main(network_file, phenotypes, BFWalk_out_dir, multixrank_out_dir=None, netcore_out_dir=None,
-         rankVsDeg_dir="./", weighted=False, directed=False):
+         rankVsDeg_dir="./", weighted=False, directed=False, ties="min",
+         permutations=100000, permutation_seed=None, facets=False, workers=1, store=False):
 
     if not (multixrank_out_dir or netcore_out_dir):
         logger.warning("Provide MultiXrank and/or NetCore output directories")
@@ -186,61 +336,63 @@ def main(network_file, phenotypes, BFWalk_out_dir, multixrank_out_dir=None, netc
     rankVsDeg_dir.parent.mkdir(parents=True, exist_ok=True)  # Path.parent of a bare filename returns Path("."), and mkdir on "."
 
     logger.info(f"Parsing network {network_file}")
-    (edge_list, node2idx, idx2node) = data_parser.parse_network(network_file, weighted, directed)
+    (indptr, indices, weights, node2idx, idx2node) = network_cache.load_network(network_file, weighted, directed)
 
-    # construct a networkx Graph from the edge list
-    edge_list_no_weights = []
-    for edge in edge_list:
-        edge_list_no_weights.append((idx2node[edge[0]], idx2node[edge[1]]))
-    interactome = networkx.from_edgelist(edge_list_no_weights)
+    degrees = network_cache.degrees(indptr, indices)
 
     # calculate the mean and median degree of nodes in the network
-    network_degrees = []
-    for node in interactome.nodes():
-        network_degrees.append(interactome.degree(node))
-    logger.info(f"node degree mean: {round(statistics.mean(network_degrees))}, median: {round(statistics.median(network_degrees))}")
-
-    # dicts to store node-rank pairs for all phenotypes combined
+    logger.info(f"node degree mean: {round(numpy.mean(degrees))}, median: {round(numpy.median(degrees))}")
+
+    # load the ranks of all phenotypes, in parallel with workers > 1
+    load_args = (BFWalk_out_dir, multixrank_out_dir, netcore_out_dir, len(node2idx), ties, store)
+    if workers > 1 and len(phenotypes) > 1:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=min(workers, len(phenotypes))) as executor:
+            futures = [executor.submit(load_phenotype_ranks, phenotype, *load_args) for phenotype in phenotypes]
+            phenotype2ranks = {phenotype: future.result() for (phenotype, future) in zip(phenotypes, futures)}
+    else:
+        phenotype2ranks = {phenotype: load_phenotype_ranks(phenotype, *load_args) for phenotype in phenotypes}
+
+    # dicts to store node-rank pairs for all phenotypes combined,
+    # a node left out in several phenotypes keeps its rank in the last one
     BFWalk_node2rank = {}
     multixrank_node2rank = {}
     netcore_node2rank = {}
-
-    for phenotype in phenotypes:
-        logger.info(f"Phenotype: {phenotype}")
-        logger.info("Parsing BFWalk ranks")
-        # search all subdirectories of the BFWalk output directory for "ranks_LOO.tsv"
-        BFWalk_ranks_file = os.path.join(BFWalk_out_dir, phenotype, "ranks_LOO.tsv")
-        BFWalk_node2rank_pheno = parse_ranks(BFWalk_ranks_file)
+    for (BFWalk_node2rank_pheno, multixrank_node2rank_pheno, netcore_node2rank_pheno) in phenotype2ranks.values():
         BFWalk_node2rank.update(BFWalk_node2rank_pheno)
-
         if multixrank_out_dir:
-            logger.info("Parsing MultiXrank ranks")
-            multixrank_ranks_file = os.path.join(multixrank_out_dir, phenotype, "ranks_LOO.tsv")
-            multixrank_node2rank_pheno = parse_ranks(multixrank_ranks_file)
             multixrank_node2rank.update(multixrank_node2rank_pheno)
-            assert len(BFWalk_node2rank) == len(multixrank_node2rank), "BFWalk and MultiXrank ranks files have different number of left-out nodes"
-            logger.info("BFWalk vs MultiXrank:")
-            (rank_diff, negative_rank_degrees, positive_rank_degrees, node_degrees) = calculate_rank_difference(BFWalk_node2rank,
-                                                                                                                multixrank_node2rank,
-                                                                                                                interactome)
-            rankVsDeg_path = os.path.join(rankVsDeg_dir, "all_rank_vs_deg_BFWalk_vs_RWR.png")
-            plot_rankVsDeg(rank_diff, negative_rank_degrees, positive_rank_degrees, node_degrees, interactome, "RWR", rankVsDeg_path)
-
         if netcore_out_dir:
-            logger.info("Parsing NetCore scores")
-            netcore_LOO_dir = os.path.join(netcore_out_dir, phenotype)
-            netcore_node2rank_pheno = netcore_scores_to_ranks(BFWalk_node2rank_pheno.keys(), netcore_LOO_dir, len(node2idx))
             netcore_node2rank.update(netcore_node2rank_pheno)
-            assert len(BFWalk_node2rank) == len(netcore_node2rank), "BFWalk and NetCore ranks files have different number of left-out nodes"
-            logger.info("BFWalk vs NetCore:")
-            (rank_diff, negative_rank_degrees, positive_rank_degrees, node_degrees) = calculate_rank_difference(BFWalk_node2rank,
-                                                                                                                netcore_node2rank,
-                                                                                                                interactome)
-            rankVsDeg_path = os.path.join(rankVsDeg_dir, "all_rank_vs_deg_BFWalk_vs_NetCore.png")
-            plot_rankVsDeg(rank_diff, negative_rank_degrees, positive_rank_degrees, node_degrees, interactome, "NetCore", rankVsDeg_path)
 
     logger.info(f"Found {len(BFWalk_node2rank)} left-out nodes")
 
+    # rank differences and plots for all phenotypes combined, and per phenotype with facets
+    for (other_method_idx, other_method, other_method_node2rank, used) in \
+            ((1, "MultiXrank", multixrank_node2rank, multixrank_out_dir),
+             (2, "NetCore", netcore_node2rank, netcore_out_dir)):
+        if not used:
+            continue
+        logger.info(f"BFWalk vs {other_method}:")
+        (rank_diff, negative_rank_degrees, positive_rank_degrees, node_degrees) = calculate_rank_difference(BFWalk_node2rank,
+                                                                                                            other_method_node2rank,
+                                                                                                            node2idx, degrees)
+        rankVsDeg_path = os.path.join(rankVsDeg_dir, f"all_rank_vs_deg_BFWalk_vs_{other_method}.png")
+        plot_rankVsDeg(rank_diff, negative_rank_degrees, positive_rank_degrees, node_degrees, len(idx2node), other_method, rankVsDeg_path)
+
+        if facets:
+            facets_path = os.path.join(rankVsDeg_dir, f"phenotypes_rank_vs_deg_BFWalk_vs_{other_method}.png")
+            plot_facets(phenotype2ranks, other_method_idx, node2idx, degrees, len(idx2node), other_method, facets_path)
+            logger.info(f"Per-phenotype plots saved to {facets_path}")
+
+    # paired tests between every pair of methods, over the left-out nodes of all phenotypes
+    method2node2rank = {"BFWalk": BFWalk_node2rank}
+    if multixrank_out_dir:
+        method2node2rank["MultiXrank"] = multixrank_node2rank
+    if netcore_out_dir:
+        method2node2rank["NetCore"] = netcore_node2rank
+    results = paired_tests(method2node2rank, permutations, permutation_seed)
+    paired_tests_to_TSV(results, permutations, os.path.join(rankVsDeg_dir, "all_paired_tests.tsv"))
+
 
 if __name__ == "__main__":
     script_name = os.path.basename(sys.argv[0])
@@ -286,6 +438,36 @@ if __name__ == "__main__":
                         type=pathlib.Path,
                         required=False,
                         default="./")
+    parser.add_argument('--ties',
+                        help="How to rank a left-out node tied with other nodes in the NetCore scores and LOO stores: " \
+                        "min, average or max rank of the tied nodes (default: min)",
+                        choices=ranking.TIES,
+                        required=False,
+                        default="min")
+    parser.add_argument('--store',
+                        help="Calculate the ranks of every method from its LOO store (LOO_store/ in each phenotype " \
+                        "subdirectory, see loo_store.py) rather than from the ranks and scores files (default: False)",
+                        action='store_true',
+                        required=False)
+    parser.add_argument('--permutations',
+                        help="Number of random sign flips for the paired permutation test between methods (default: 100000)",
+                        type=int,
+                        required=False,
+                        default=100000)
+    parser.add_argument('--permutation_seed',
+                        help="Seed for the random sign flips, for reproducible p-values (default: None)",
+                        type=int,
+                        required=False,
+                        default=None)
+    parser.add_argument('--facets',
+                        help="Also plot the ranks vs degree of each phenotype, one panel per phenotype (default: False)",
+                        action='store_true',
+                        required=False)
+    parser.add_argument('--workers',
+                        help="Number of processes loading the ranks of the phenotypes in parallel (default: 1)",
+                        type=int,
+                        required=False,
+                        default=1)
     parser.add_argument('--weighted',
                         help="Whether the network is weighted (default: False)",
                         action='store_true',
@@ -305,7 +487,13 @@ if __name__ == "__main__":
              netcore_out_dir=args.netcore_out_dir,
              rankVsDeg_dir=args.rankVsDeg,
              weighted=args.weighted,
-             directed=args.directed)
+             directed=args.directed,
+             ties=args.ties,
+             permutations=args.permutations,
+             permutation_seed=args.permutation_seed,
+             facets=args.facets,
+             workers=args.workers,
+             store=args.store)
 
     except Exception as e:
         # details on the issue should be in the exception name, print to stderr and die